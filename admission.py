@@ -0,0 +1,165 @@
+# admission.py
+"""
+Control de admisión del tráfico WebSocket entrante, aplicado ANTES de
+parsear nada (`json.loads` / validación Pydantic).
+
+- Por conexión: tamaño máximo de mensaje y un token bucket de mensajes por
+  segundo. Quien lo supera se desconecta sin más trabajo.
+- Por partida: tope de jugadores y un token bucket de nuevas conexiones
+  (ritmo de uniones), comprobados antes de aceptar el WebSocket.
+
+Los límites viven en `limits` (modelo `AdmissionLimits`), se pueden fijar
+con variables de entorno `QUIZ_<CAMPO>` y cambiar en caliente desde
+`/debug/admission`. Los rechazos se exportan como métricas.
+"""
+import logging
+import os
+import time
+from typing import Dict, Optional, Union
+
+from metrics import Counter, Gauge
+from models import AdmissionLimits
+
+logger = logging.getLogger(__name__)
+
+# Motivos de rechazo (también usados como etiqueta de métrica)
+REJECT_FRAME_TOO_LARGE = "frame_too_large"
+REJECT_MESSAGE_RATE = "message_rate"
+REJECT_JOIN_RATE = "join_rate"
+REJECT_GAME_FULL = "game_full"
+REJECT_SPECTATORS_FULL = "spectators_full"
+
+
+class TokenBucket:
+    """Token bucket clásico: `rate` fichas por segundo hasta un máximo de `capacity`."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def consume(self, amount: float = 1.0) -> bool:
+        """Intenta gastar `amount` fichas. Devuelve False si no hay suficientes."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+
+def _limits_from_env() -> AdmissionLimits:
+    overrides = {}
+    for field_name in AdmissionLimits.model_fields:
+        value = os.environ.get(f"QUIZ_{field_name.upper()}")
+        if value is not None:
+            overrides[field_name] = value
+    return AdmissionLimits.model_validate(overrides)
+
+
+# --- Estado del Módulo ---
+limits: AdmissionLimits = _limits_from_env()
+_join_buckets: Dict[str, TokenBucket] = {} # game_code -> bucket de nuevas conexiones
+
+# --- Métricas ---
+rejections_total = Counter("quiz_admission_rejections_total", "Conexiones o mensajes rechazados por control de admisión", ("reason",))
+messages_admitted_total = Counter("quiz_ws_messages_admitted_total", "Mensajes WebSocket entrantes que pasaron el control de admisión")
+Gauge("quiz_admission_limit", "Límites de admisión configurados", ("limit",),
+      callback=lambda: {(name,): float(value) for name, value in limits.model_dump().items()})
+
+
+def update_limits(new_limits: AdmissionLimits):
+    """Sustituye los límites vigentes. Los buckets existentes se reconfiguran al momento."""
+    global limits
+    limits = new_limits
+    for bucket in _join_buckets.values():
+        bucket.rate = limits.joins_per_second_per_game
+        bucket.capacity = limits.join_burst_per_game
+    logger.info("Admission limits updated: %s", limits.model_dump())
+
+
+def check_new_connection(game_code: str, player_count: int) -> Optional[str]:
+    """
+    Comprueba si una partida admite una nueva conexión (antes de aceptarla).
+
+    Args:
+        game_code: Código de la partida.
+        player_count: Jugadores actualmente en la partida (incluido el host).
+
+    Returns:
+        None si se admite, o el motivo del rechazo.
+    """
+    if player_count >= limits.max_players_per_game:
+        rejections_total.inc(REJECT_GAME_FULL)
+        return REJECT_GAME_FULL
+    bucket = _join_buckets.get(game_code)
+    if bucket is None:
+        bucket = _join_buckets[game_code] = TokenBucket(limits.joins_per_second_per_game, limits.join_burst_per_game)
+    if not bucket.consume():
+        rejections_total.inc(REJECT_JOIN_RATE)
+        return REJECT_JOIN_RATE
+    return None
+
+
+def check_join(player_count: int) -> Optional[str]:
+    """Comprueba el tope de jugadores en el momento del 'join_game' (cubre conexiones simultáneas)."""
+    if player_count >= limits.max_players_per_game:
+        rejections_total.inc(REJECT_GAME_FULL)
+        return REJECT_GAME_FULL
+    return None
+
+
+def check_new_spectator(spectator_count: int) -> Optional[str]:
+    """
+    Comprueba si una partida admite un nuevo espectador (antes de aceptarlo).
+
+    Los espectadores no consumen del ritmo de uniones de la partida: son
+    baratos y suelen llegar en avalancha cuando se comparte el enlace.
+    """
+    if spectator_count >= limits.max_spectators_per_game:
+        rejections_total.inc(REJECT_SPECTATORS_FULL)
+        return REJECT_SPECTATORS_FULL
+    return None
+
+
+def forget_game(game_code: str):
+    """Libera el estado de admisión de una partida eliminada."""
+    _join_buckets.pop(game_code, None)
+
+
+class ConnectionAdmission:
+    """Estado de admisión de una única conexión WebSocket."""
+    __slots__ = ("bucket",)
+
+    def __init__(self):
+        self.bucket = TokenBucket(limits.messages_per_second, limits.message_burst)
+
+    def check_frame(self, raw_data: Union[str, bytes], is_host: bool) -> Optional[str]:
+        """
+        Comprueba un mensaje recibido antes de parsearlo.
+
+        Args:
+            raw_data: Mensaje tal como llegó (texto JSON o fotograma binario); los
+                textos se miden en bytes UTF-8, como los binarios.
+            is_host: Si la conexión es la del anfitrión (límite de tamaño mayor).
+
+        Returns:
+            None si se admite, o el motivo del rechazo.
+        """
+        max_size = limits.max_frame_bytes_host if is_host else limits.max_frame_bytes_player
+        size = len(raw_data)
+        if isinstance(raw_data, str) and max_size < size * 4 and size <= max_size:
+            # Texto: el límite es en bytes UTF-8. Solo se codifica si los caracteres no lo
+            # deciden ya (cada uno ocupa de 1 a 4 bytes)
+            size = len(raw_data.encode("utf-8"))
+        if size > max_size:
+            rejections_total.inc(REJECT_FRAME_TOO_LARGE)
+            return REJECT_FRAME_TOO_LARGE
+        if not self.bucket.consume():
+            rejections_total.inc(REJECT_MESSAGE_RATE)
+            return REJECT_MESSAGE_RATE
+        messages_admitted_total.inc()
+        return None
@@ -0,0 +1,324 @@
+# diagnostics.py
+"""
+Herramientas de diagnóstico en caliente para el servidor de Quiz.
+
+Incluye:
+- Un muestreador del retraso (lag) del bucle de eventos de asyncio, que mide
+  cuánto tarda el bucle en despertar una tarea respecto a lo programado.
+- Un trazador de latencia por tipo de mensaje para los manejadores de
+  `game_logic`, que registra en el log los eventos lentos (con código de
+  partida, tipo de mensaje y número de jugadores) y conserva los N más lentos.
+- Un perfilador por muestreo de pilas, bajo demanda y acotado en el tiempo,
+  que etiqueta cada muestra con la partida y el tipo de mensaje en curso
+  (tomados de la contextvar `current_dispatch`) y devuelve pilas colapsadas
+  listas para generar flamegraphs.
+
+Todo se activa/desactiva en tiempo de ejecución (ver endpoints `/debug/*`
+en main.py). Desactivados, su coste se reduce a comprobar un booleano.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+LOOP_LAG_SAMPLE_INTERVAL = 0.1 # Segundos entre muestras del retraso del bucle
+LOOP_LAG_EWMA_ALPHA = 0.2      # Peso de la última muestra en la media móvil exponencial
+SLOW_HANDLER_THRESHOLD_MS = 50.0 # Manejadores más lentos que esto se loggean como lentos
+SLOWEST_EVENTS_KEPT = 50       # Número de eventos más lentos que se conservan para el endpoint
+PROFILE_MAX_SECONDS = 60       # Duración máxima permitida para un perfil bajo demanda
+PROFILE_MAX_DEPTH = 64         # Profundidad máxima de pila registrada por muestra
+
+# Partida y tipo de mensaje que se están despachando en la tarea actual.
+# Se fija en websocket_endpoint (main.py) antes de llamar a los manejadores.
+current_dispatch: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar("current_dispatch", default=("-", "-"))
+
+
+class LoopLagMonitor:
+    """
+    Muestrea periódicamente el retraso del bucle de eventos.
+
+    Una tarea duerme `interval` segundos y mide cuánto tarde despierta
+    respecto a lo esperado. Ese exceso es el tiempo durante el cual el
+    bucle estuvo ocupado (bloqueado) sin poder atender otras tareas.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.reset()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def reset(self):
+        """Reinicia las estadísticas acumuladas."""
+        self.samples = 0
+        self.last_lag_ms = 0.0
+        self.avg_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def start(self):
+        """Arranca la tarea de muestreo (debe llamarse desde el bucle de eventos)."""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Event-loop lag monitor started (interval %.3fs).", self.interval)
+
+    def stop(self):
+        """Detiene la tarea de muestreo si está activa."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logger.info("Event-loop lag monitor stopped.")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, (loop.time() - expected) * 1000.0))
+
+    def record(self, lag_ms: float):
+        """Incorpora una muestra de retraso (en milisegundos)."""
+        self.samples += 1
+        self.last_lag_ms = lag_ms
+        if self.samples == 1:
+            self.avg_lag_ms = lag_ms
+        else:
+            self.avg_lag_ms += LOOP_LAG_EWMA_ALPHA * (lag_ms - self.avg_lag_ms)
+        if lag_ms > self.max_lag_ms:
+            self.max_lag_ms = lag_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Devuelve el estado actual del monitor como diccionario serializable."""
+        return {
+            "enabled": self.running,
+            "interval_s": self.interval,
+            "samples": self.samples,
+            "last_lag_ms": round(self.last_lag_ms, 3),
+            "avg_lag_ms": round(self.avg_lag_ms, 3),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+        }
+
+
+class HandlerTracer:
+    """
+    Mide la duración de cada despacho de mensaje a los manejadores del juego.
+
+    Uso típico (barato cuando está desactivado, `start()` devuelve None):
+
+        started = handler_tracer.start()
+        ... manejar el mensaje ...
+        if started is not None:
+            handler_tracer.finish(started, game_code, message_type, game)
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_HANDLER_THRESHOLD_MS, keep: int = SLOWEST_EVENTS_KEPT):
+        self.enabled = False
+        self.threshold_ms = threshold_ms
+        self.keep = keep
+        self.reset()
+
+    def reset(self):
+        """Reinicia estadísticas por tipo y el ranking de eventos lentos."""
+        # message_type -> [count, total_ms, max_ms]
+        self._stats: Dict[str, List[float]] = {}
+        # Min-heap de (duration_ms, seq, game_code, message_type, player_count, timestamp)
+        self._slowest: List[Tuple[float, int, str, str, int, float]] = []
+        self._seq = itertools.count()
+
+    def start(self) -> Optional[float]:
+        """Devuelve una marca de tiempo de inicio, o None si el trazado está desactivado."""
+        return time.perf_counter() if self.enabled else None
+
+    def finish(self, started: float, game_code: str, message_type: Optional[str], game: Any = None):
+        """
+        Registra la duración de un despacho iniciado con `start()`.
+
+        Args:
+            started: Valor devuelto por `start()`.
+            game_code: Código de la partida a la que pertenece el mensaje.
+            message_type: Tipo de mensaje despachado (ej: 'submit_answer').
+            game: Objeto Game opcional, usado solo para obtener el número de jugadores.
+        """
+        duration_ms = (time.perf_counter() - started) * 1000.0
+        message_type = message_type or "unknown"
+
+        stats = self._stats.get(message_type)
+        if stats is None:
+            self._stats[message_type] = [1, duration_ms, duration_ms]
+        else:
+            stats[0] += 1
+            stats[1] += duration_ms
+            if duration_ms > stats[2]:
+                stats[2] = duration_ms
+
+        if duration_ms < self.threshold_ms and len(self._slowest) >= self.keep and duration_ms <= self._slowest[0][0]:
+            return # Ni lento ni entre los N más lentos: nada más que hacer
+
+        player_count = len(game.players) if game is not None else 0
+        entry = (duration_ms, next(self._seq), game_code, message_type, player_count, time.time())
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif duration_ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+        if duration_ms >= self.threshold_ms:
+            logger.warning(
+                "Slow handler: game=%s type=%s players=%d duration=%.1fms",
+                game_code, message_type, player_count, duration_ms
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Devuelve estadísticas por tipo y los eventos más lentos (de mayor a menor)."""
+        per_type = {
+            message_type: {
+                "count": int(count),
+                "avg_ms": round(total / count, 3) if count else 0.0,
+                "max_ms": round(max_ms, 3),
+            }
+            for message_type, (count, total, max_ms) in self._stats.items()
+        }
+        slowest = [
+            {
+                "game_code": game_code,
+                "message_type": message_type,
+                "player_count": player_count,
+                "duration_ms": round(duration_ms, 3),
+                "at": at,
+            }
+            for duration_ms, _, game_code, message_type, player_count, at in sorted(self._slowest, reverse=True)
+        ]
+        return {
+            "enabled": self.enabled,
+            "slow_threshold_ms": self.threshold_ms,
+            "per_type": per_type,
+            "slowest": slowest,
+        }
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo de pilas del hilo del bucle de eventos.
+
+    Un hilo auxiliar toma, cada `interval` segundos, la pila actual del hilo
+    del bucle (`sys._current_frames`) y la acumula en formato colapsado
+    (`etiqueta;frame;frame;... N`), precedida por la partida y el tipo de
+    mensaje de la tarea que se estaba ejecutando en ese instante.
+
+    Como desde otro hilo no se puede leer la contextvar de una tarea en
+    Python < 3.12, mientras hay un perfil activo `set_dispatch_context`
+    anota además la etiqueta de la tarea en un diccionario débil.
+    """
+
+    def __init__(self):
+        self.active = False
+        self._task_tags: "weakref.WeakKeyDictionary[asyncio.Task, Tuple[str, str]]" = weakref.WeakKeyDictionary()
+
+    def tag_task(self, task: asyncio.Task, tag: Tuple[str, str]):
+        """Asocia una etiqueta (game_code, message_type) a una tarea durante el perfil."""
+        self._task_tags[task] = tag
+
+    def _task_tag(self, task: asyncio.Task) -> Optional[Tuple[str, str]]:
+        get_context = getattr(task, "get_context", None) # Python 3.12+
+        if get_context is not None:
+            return get_context().get(current_dispatch)
+        return self._task_tags.get(task)
+
+    async def profile(self, seconds: float, interval: float, game_code: Optional[str] = None, include_idle: bool = False) -> Counter:
+        """
+        Muestrea el bucle de eventos durante `seconds` segundos.
+
+        Args:
+            seconds: Duración del perfil (como máximo PROFILE_MAX_SECONDS).
+            interval: Segundos entre muestras.
+            game_code: Si se indica, solo se conservan las muestras de esa partida.
+            include_idle: Si es True, incluye también las muestras tomadas cuando
+                ninguna tarea estaba en ejecución (bucle esperando E/S o callbacks).
+
+        Returns:
+            Un Counter que mapea cada pila colapsada a su número de muestras.
+
+        Raises:
+            RuntimeError si ya hay un perfil en curso.
+        """
+        if self.active:
+            raise RuntimeError("A profile is already running.")
+        loop = asyncio.get_running_loop()
+        counts: Counter = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample,
+            args=(loop, threading.get_ident(), interval, game_code, include_idle, counts, stop),
+            name="quiz-profiler",
+            daemon=True,
+        )
+        self.active = True
+        logger.info("Sampling profile started (%.1fs, every %.1fms, game=%s).", seconds, interval * 1000.0, game_code or "*")
+        sampler.start()
+        try:
+            await asyncio.sleep(min(seconds, PROFILE_MAX_SECONDS))
+        finally:
+            stop.set()
+            sampler.join(timeout=1.0)
+            self.active = False
+            self._task_tags.clear()
+        logger.info("Sampling profile finished: %d samples.", sum(counts.values()))
+        return counts
+
+    def _sample(self, loop, thread_id, interval, game_code, include_idle, counts, stop):
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(loop)
+            if task is None:
+                if not include_idle:
+                    continue
+                tag = ("-", "idle")
+            else:
+                tag = self._task_tag(task) or ("-", "-")
+            if game_code is not None and tag[0] != game_code:
+                continue
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(f"msg:{tag[1]}")
+            stack.append(f"game:{tag[0]}")
+            stack.reverse()
+            counts[";".join(stack)] += 1
+
+
+# Instancias globales compartidas por main.py y game_logic.py
+loop_monitor = LoopLagMonitor()
+handler_tracer = HandlerTracer()
+sampling_profiler = SamplingProfiler()
+
+
+def set_dispatch_context(game_code: str, message_type: str):
+    """
+    Fija la partida y el tipo de mensaje en curso para la tarea actual.
+
+    Lo leen el perfilador por muestreo (para etiquetar muestras) y cualquier
+    código que quiera saber qué se está despachando sin recibirlo por argumento.
+    """
+    tag = (game_code, message_type)
+    current_dispatch.set(tag)
+    if sampling_profiler.active:
+        task = asyncio.current_task()
+        if task is not None:
+            sampling_profiler.tag_task(task, tag)
@@ -0,0 +1,150 @@
+# event_log.py
+"""
+Registro de eventos por partida: todo lo que entra al actor, en orden y solo
+por anexado, para reproducir la partida después (ver replay.py).
+
+Cada comando que aplica el actor (unirse, reanudar, cargar quiz, iniciar,
+responder con su timestamp de recepción, avanzar, terminar, desconexiones,
+avance automático y expiración de sesiones) se escribe como una línea JSON
+compacta `[segundos desde el inicio, tipo, conn_id, datos]`. Además se
+registran como `capture` los valores no deterministas que leen los
+manejadores (reloj al mostrar una pregunta, tokens de reconexión
+aleatorios...), de modo que la reproducción da exactamente las mismas
+puntuaciones y mensajes.
+
+Se activa con la variable de entorno QUIZ_EVENT_LOG_DIR: un fichero
+`<código>-<timestamp>.ndjson` por partida, cuya primera línea es una
+cabecera con la versión del formato. El bucle de eventos solo encola las
+líneas; un hilo de fondo las escribe y vacía el buffer tras cada tanda.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, TextIO, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+EVENT_LOG_DIR = os.environ.get("QUIZ_EVENT_LOG_DIR", "") # Directorio de los registros de eventos ('' = desactivado)
+EVENT_LOG_VERSION = 1 # Versión del formato (cabecera de cada fichero)
+EVENT_CAPTURE = "capture" # Tipo de evento de un valor no determinista leído por un manejador
+
+# --- Estado del Módulo ---
+# (ruta, línea) o (ruta, None) para cerrar el fichero; (None, None) detiene el hilo
+_write_queue: "queue.SimpleQueue[Tuple[Optional[str], Optional[str]]]" = queue.SimpleQueue()
+_writer: Optional[threading.Thread] = None
+
+
+class EventLog:
+    """Registro de eventos de una partida en curso (solo anexado)."""
+
+    replaying = False # Ver replay.ReplaySource: los temporizadores no se disparan al reproducir
+
+    def __init__(self, game_code: str, path: str, restored: bool = False):
+        self.path = path
+        self.started_at = time.time()
+        self.closed = False
+        header = {"version": EVENT_LOG_VERSION, "game_code": game_code,
+                  "started_at": self.started_at, "restored": restored}
+        _enqueue(path, json.dumps(header, separators=(",", ":")))
+
+    def record(self, kind: str, conn_id: Optional[int], data: Any = None):
+        """Anexa un evento (los datos deben ser serializables a JSON)."""
+        if self.closed:
+            return
+        event = [round(time.time() - self.started_at, 6), kind, conn_id, data]
+        _enqueue(self.path, json.dumps(event, separators=(",", ":"), ensure_ascii=False))
+
+    def record_command(self, kind: str, conn_id: Optional[int], payload: Any):
+        """Anexa un comando del actor; los modelos (ej: el quiz cargado) se guardan como dict."""
+        if isinstance(payload, BaseModel):
+            payload = payload.model_dump(mode="json")
+        self.record(kind, conn_id, payload)
+
+    def capture(self, value: Any) -> Any:
+        """Registra un valor no determinista (reloj, token aleatorio) y lo devuelve tal cual."""
+        self.record(EVENT_CAPTURE, None, value)
+        return value
+
+    def close(self):
+        """Cierra el fichero (idempotente); las líneas pendientes se escriben antes."""
+        if not self.closed:
+            self.closed = True
+            _enqueue(self.path, None)
+
+
+def open_event_log(game_code: str, restored: bool = False) -> Optional[EventLog]:
+    """
+    Abre el registro de una partida nueva, o None si los registros están desactivados.
+
+    Args:
+        game_code: Código de la partida.
+        restored: True si la partida viene de una instantánea (snapshot.py): su
+            registro empieza a mitad de partida y no se puede reproducir solo.
+    """
+    if not EVENT_LOG_DIR:
+        return None
+    path = os.path.join(EVENT_LOG_DIR, f"{game_code}-{int(time.time() * 1000)}.ndjson")
+    return EventLog(game_code, path, restored)
+
+
+def _enqueue(path: str, line: Optional[str]):
+    global _writer
+    if _writer is None:
+        _writer = threading.Thread(target=_write_loop, name="event-log-writer", daemon=True)
+        _writer.start()
+        atexit.register(shutdown_event_logs) # Vaciar la cola al salir del proceso
+    _write_queue.put((path, line))
+
+
+def _write_loop():
+    """Hilo de escritura: agrupa lo que haya en cola, escribe y vacía los buffers tocados."""
+    files: Dict[str, TextIO] = {}
+    running = True
+    while running:
+        batch = [_write_queue.get()]
+        while True:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        touched = set()
+        for path, line in batch:
+            if path is None:
+                running = False
+                continue
+            try:
+                handle = files.get(path)
+                if line is None:
+                    if handle is not None:
+                        handle.close()
+                        del files[path]
+                    continue
+                if handle is None:
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    handle = files[path] = open(path, "a", encoding="utf-8")
+                handle.write(line)
+                handle.write("\n")
+                touched.add(path)
+            except OSError as e:
+                logger.error("Failed to write event log %s: %s", path, e)
+        for path in touched:
+            if path in files:
+                files[path].flush()
+    for handle in files.values():
+        handle.close()
+
+
+def shutdown_event_logs():
+    """Detiene el hilo de escritura tras escribir todo lo pendiente."""
+    global _writer
+    if _writer is not None:
+        _write_queue.put((None, None))
+        _writer.join(timeout=5)
+        _writer = None
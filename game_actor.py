@@ -0,0 +1,168 @@
+# game_actor.py
+"""
+Actor por partida: una única tarea aplica, en orden, todos los comandos que
+modifican el estado de una partida.
+
+Los bucles de recepción de cada conexión (main.py), el temporizador de avance
+automático, el heartbeat y la expiración de sesiones ya no tocan el estado
+directamente: encolan un `GameCommand` con `GameActor.submit()`. La tarea del
+actor los consume por lotes (todo lo que haya en cola, hasta
+ACTOR_MAX_BATCH) y los aplica uno detrás de otro, esperando a que termine
+cada uno (incluidos sus envíos) antes del siguiente. Así no se pueden
+entrelazar, por ejemplo, un 'next_question' del host y el avance automático.
+
+El actor no conoce la lógica del juego: la función que aplica un lote la
+proporciona game_logic al arrancarlo (ver `game_logic.submit_command`).
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Collection, List, NamedTuple, Optional
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+ACTOR_MAX_BATCH = 256 # Comandos aplicados como máximo por iteración del actor
+
+# --- Tipos de Comando ---
+# Coinciden con los tipos de mensaje WebSocket cuando vienen de un cliente.
+CMD_JOIN = "join_game"
+CMD_RESUME = "resume_session"
+CMD_LOAD_QUIZ = "load_quiz_data"
+CMD_START = "start_game"
+CMD_ANSWER = "submit_answer"
+CMD_NEXT = "next_question"
+CMD_END = "end_game"
+CMD_DISCONNECT = "disconnect"
+CMD_AUTO_ADVANCE = "auto_advance"
+CMD_EXPIRE_SESSION = "expire_session"
+CMD_CLOSE_QUESTION = "close_question"
+CMD_GLOBAL_LEADERBOARD = "global_leaderboard"
+
+
+class GameCommand(NamedTuple):
+    """Un cambio de estado pendiente de aplicar por el actor de una partida."""
+    kind: str                       # Uno de los CMD_*
+    conn_id: Optional[int]          # Conexión que lo originó (None para temporizadores)
+    payload: Any                    # Datos del comando (payload del mensaje, token, índice...)
+    future: Optional[asyncio.Future] # Se resuelve al aplicarse (None si nadie espera el resultado)
+    enqueued_at: float              # time.perf_counter() al encolar (para medir la espera en cola)
+
+
+BatchHandler = Callable[[List[GameCommand]], Awaitable[None]]
+
+
+class GameActor:
+    """Cola de comandos y tarea consumidora de una partida."""
+
+    def __init__(self):
+        self._queue: "asyncio.Queue[Optional[GameCommand]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.batch_window = 0.0                    # Segundos a esperar para agrupar comandos (0 = sin espera)
+        self.window_kinds: Collection[str] = ()    # Tipos de comando que abren la ventana de agrupación
+        self.last_queue_delay_ms = 0.0 # Espera en cola del primer comando del último lote
+
+    def __len__(self) -> int:
+        """Comandos pendientes en cola."""
+        return self._queue.qsize()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, handler: BatchHandler, batch_window: float = 0.0, window_kinds: Collection[str] = ()):
+        """
+        Arranca la tarea consumidora (idempotente).
+
+        Args:
+            handler: Función que aplica un lote de comandos, en orden. Es
+                responsable de resolver el Future de cada comando con su
+                resultado; los que deje sin resolver se resuelven con None.
+            batch_window: Si el primer comando de un lote es de `window_kinds`,
+                segundos que se espera antes de cerrar el lote para que lleguen
+                más (micro-lotes, ej: respuestas casi simultáneas).
+            window_kinds: Tipos de comando que justifican esa espera.
+        """
+        if self.running or self.closed:
+            return
+        self.batch_window = batch_window
+        self.window_kinds = window_kinds
+        self._task = asyncio.create_task(self._run(handler))
+
+    def submit(self, kind: str, conn_id: Optional[int] = None, payload: Any = None,
+               wait: bool = False) -> Optional[asyncio.Future]:
+        """
+        Encola un comando.
+
+        Args:
+            kind: Tipo de comando (CMD_*).
+            conn_id: Conexión que origina el comando, si la hay.
+            payload: Datos del comando.
+            wait: Si es True, devuelve un Future que se resuelve cuando el
+                comando se haya aplicado.
+
+        Returns:
+            El Future del comando si `wait` es True, o None.
+        """
+        future = asyncio.get_running_loop().create_future() if wait else None
+        if self.closed:
+            # La partida ya se eliminó: no hay estado que modificar
+            if future is not None:
+                future.set_result(None)
+            return future
+        self._queue.put_nowait(GameCommand(kind, conn_id, payload, future, time.perf_counter()))
+        commands_total.inc(kind)
+        return future
+
+    def close(self):
+        """
+        Cierra el actor (la partida se eliminó).
+
+        Puede llamarse desde un comando en curso: la tarea termina al acabar el
+        lote actual y los comandos pendientes se descartan (sus Futures se
+        resuelven con None).
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put_nowait(None) # Despierta a la tarea si está esperando comandos
+
+    async def _run(self, handler: BatchHandler):
+        while not self.closed:
+            command = await self._queue.get()
+            if command is None:
+                break
+            if self.batch_window > 0 and command.kind in self.window_kinds:
+                await asyncio.sleep(self.batch_window) # Dejar que se acumulen más en la cola
+            batch = [command]
+            while len(batch) < ACTOR_MAX_BATCH and not self._queue.empty():
+                command = self._queue.get_nowait()
+                if command is None:
+                    break
+                batch.append(command)
+            self.last_queue_delay_ms = (time.perf_counter() - batch[0].enqueued_at) * 1000.0
+            try:
+                await handler(batch)
+            except Exception:
+                logger.exception("Unhandled error applying a batch of %d game commands", len(batch))
+            finally:
+                _resolve(batch)
+        # Cerrado: descartar lo que quede
+        while not self._queue.empty():
+            command = self._queue.get_nowait()
+            if command is not None:
+                _resolve((command,))
+
+
+def _resolve(commands):
+    """Resuelve con None los Futures que sigan pendientes."""
+    for command in commands:
+        if command.future is not None and not command.future.done():
+            command.future.set_result(None)
+
+
+# --- Métricas ---
+commands_total = Counter("quiz_game_commands_total", "Comandos encolados en los actores de partida", ("command",))
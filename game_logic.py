@@ -7,14 +7,24 @@ el flujo del juego (inicio, preguntas, marcador, fin), y la comunicación
 a través de WebSockets (broadcast, mensajes personales). No gestiona directamente
 la creación de partidas ni las conexiones WebSocket iniciales (eso está en main.py),
 pero opera sobre el diccionario `active_games` compartido.
+
+Los manejadores se ejecutan siempre dentro del actor de su partida
+(game_actor.py): el resto del servidor solo encola comandos con
+`submit_command`, de modo que los cambios de estado nunca se entrelazan.
+Cada comando aplicado se anota en el registro de eventos de la partida
+(event_log.py), y los valores no deterministas que leen los manejadores
+(reloj, tokens aleatorios) pasan por `_capture` para poder reproducirla.
 """
 import asyncio
+import functools
 import json
 import logging
+import os
 import secrets
 import time
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
 import uuid
+import zlib
 
 from fastapi import WebSocket, WebSocketDisconnect
 from pydantic import ValidationError
@@ -24,12 +34,32 @@ from models import (
     AnswerRecord, ErrorPayload, Game, GameStateEnum, JoinAckPayload,
     JoinGamePayload, NewQuestionPayload, Player, PlayerJoinedPayload, Question,
     QuizData, Option, ScoreboardEntry, SubmitAnswerPayload,
-    UpdateScoreboardPayload, WebSocketMessage, AnswerResultPayload,
+    UpdateScoreboardPayload, WebSocketMessage,
     GameOverPayload, GameStartedPayload, PlayerLeftPayload, OptionData,
-    QuestionData # Importar también los Data para get_current_question
+    QuestionData, # Importar también los Data para get_current_question
+    DetachedPlayer, ResumeSessionPayload, SessionResumedPayload, AnswerStatsPayload,
+    ServerRestartingPayload, GlobalLeaderboardPayload, GlobalScoreboardEntry,
+    PrefetchedQuestion, RevealPayload, MediaPrefetchPayload, TeamScoreboardEntry
+)
+from media import media_url, quiz_media_ids
+from wire import EncodedMessage, PersonalizedMessage, close_connection, encode, encoding_of, send_frame
+from spectators import SPECTATOR_LEADERBOARD_TOP_K
+from game_actor import (
+    CMD_ANSWER, CMD_AUTO_ADVANCE, CMD_CLOSE_QUESTION, CMD_DISCONNECT, CMD_END,
+    CMD_EXPIRE_SESSION, CMD_GLOBAL_LEADERBOARD, CMD_JOIN, CMD_LOAD_QUIZ, CMD_NEXT,
+    CMD_RESUME, CMD_START, GameCommand
+)
+from tournament import TOURNAMENT_CLOSE_GRACE, Tournament
+from teams import TeamError
+from diagnostics import handler_tracer, set_dispatch_context
+from logging_setup import forget_game, should_log
+from metrics import Counter
+from overload import (
+    LEVEL_COALESCE_LOBBY, LEVEL_PAUSE_BACKGROUND, LEVEL_TRIM_SCOREBOARD, OVERLOAD_LOBBY_FLUSH_S,
+    overload_controller, shed_total
 )
+import admission
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Cache opcional para datos de quizzes cargados desde archivo.
@@ -38,6 +68,24 @@ loaded_quizzes: Dict[str, QuizData] = {}
 
 # --- Constantes ---
 AUTO_ADVANCE_DELAY = 5 # Segundos a esperar en el marcador antes de avanzar automáticamente
+RESUME_GRACE_PERIOD = 60 # Segundos que se conserva a un jugador desconectado para que pueda reanudar su sesión
+ANSWER_STATS_RATE_HZ = float(os.environ.get("QUIZ_ANSWER_STATS_HZ", "4")) # Envíos por segundo (máx.) de 'answer_stats' al host
+ANSWER_BATCH_WINDOW_MS = float(os.environ.get("QUIZ_ANSWER_BATCH_MS", "2")) # Ventana para agrupar respuestas casi simultáneas (0 = sin espera)
+REVEAL_LEAD_MS = int(os.environ.get("QUIZ_REVEAL_LEAD_MS", "250")) # Antelación con la que se programa la revelación de una pregunta ya enviada oculta
+SCOREBOARD_WINDOW_TOP_K = 10 # Entradas del marcador que recibe cada jugador en 'update_scoreboard' (el host recibe el marcador completo)
+OPTION_VIEWS = 12 # Vistas de opciones que se reparten entre los jugadores (múltiplo de 2, 3 y 4: reparto uniforme)
+# Órdenes de las opciones según su número: cuadrados latinos, así dos vistas distintas
+# nunca muestran la misma opción en la misma posición (ni con el mismo color/símbolo)
+OPTION_PERMUTATIONS: Dict[int, Tuple[Tuple[int, ...], ...]] = {
+    2: ((0, 1), (1, 0)),
+    3: ((0, 1, 2), (1, 2, 0), (2, 0, 1)),
+    4: ((0, 1, 2, 3), (1, 0, 3, 2), (2, 3, 0, 1), (3, 2, 1, 0)),
+}
+
+# --- Métricas ---
+sessions_detached_total = Counter("quiz_sessions_detached_total", "Jugadores desconectados conservados en periodo de gracia")
+sessions_resumed_total = Counter("quiz_sessions_resumed_total", "Sesiones reanudadas con 'resume_session'")
+sessions_expired_total = Counter("quiz_sessions_expired_total", "Sesiones desconectadas que expiraron sin reanudarse")
 
 # --- Funciones Auxiliares ---
 
@@ -86,29 +134,33 @@ def load_quiz(quiz_id: str) -> Optional[QuizData]:
         logger.exception(f"Unexpected error loading quiz '{quiz_id}': {e}")
         return None
 
-def get_current_question(game: Game) -> Optional[Question]:
+def get_current_question(game: Game, question_index: Optional[int] = None) -> Optional[Question]:
     """
     Obtiene y procesa la pregunta actual del juego según su índice.
 
     Extrae la `QuestionData` del `quiz_data` del juego, asigna IDs únicos
-    a las opciones si no los tienen, identifica el ID de la respuesta correcta
-    y lo almacena en `game.current_correct_answer_id`.
+    a las opciones si no los tienen e identifica el ID de la respuesta
+    correcta (`Question.correct_answer_id`).
 
     Args:
         game: El objeto Game cuyo estado se está consultando.
+        question_index: Pregunta a procesar (por defecto, la actual). Se usa
+            para preparar la siguiente pregunta durante el marcador.
 
     Returns:
         Un objeto `Question` procesado y listo para enviar, o None si el índice
         es inválido, falta `quiz_data` o hay un error al procesar la pregunta.
     """
+    if question_index is None:
+        question_index = game.current_question_index
     if not game.quiz_data:
         logger.error(f"Attempted to get question for game {game.game_code} but quiz_data is None.")
         return None
-    if not (0 <= game.current_question_index < len(game.quiz_data.questions)):
-        logger.debug(f"Invalid question index {game.current_question_index} for game {game.game_code}. (Likely end of game or error).")
+    if not (0 <= question_index < len(game.quiz_data.questions)):
+        logger.debug(f"Invalid question index {question_index} for game {game.game_code}. (Likely end of game or error).")
         return None # Puede ser fin del juego o un índice erróneo
 
-    q_data: QuestionData = game.quiz_data.questions[game.current_question_index]
+    q_data: QuestionData = game.quiz_data.questions[question_index]
     processed_options: List[Option] = []
     correct_id: Optional[str] = None
     processed_ids: Set[str] = set() # Para asegurar IDs únicos dentro de la pregunta
@@ -117,9 +169,9 @@ def get_current_question(game: Game) -> Optional[Question]:
         option_id = opt_data.id
         # Generar ID si falta o si ya existe (colisión improbable pero posible)
         if not option_id or option_id in processed_ids:
-            option_id = f"opt_{secrets.token_hex(3)}"
+            option_id = _capture(game, f"opt_{secrets.token_hex(3)}")
             while option_id in processed_ids:
-                option_id = f"opt_{secrets.token_hex(3)}" # Regenerar en caso de colisión
+                option_id = _capture(game, f"opt_{secrets.token_hex(3)}") # Regenerar en caso de colisión
         processed_ids.add(option_id)
 
         processed_options.append(Option(id=option_id, text=opt_data.text))
@@ -135,17 +187,16 @@ def get_current_question(game: Game) -> Optional[Question]:
         logger.error(f"No correct option found for question '{q_data.text}' in game {game.game_code}. Cannot proceed with this question.")
         return None # No se puede proceder sin una respuesta correcta definida
 
-    # Almacenar el ID correcto en el estado del juego para usarlo en handle_submit_answer
-    game.current_correct_answer_id = correct_id
     # Asegurar un ID para la pregunta si no lo tiene
-    question_id = q_data.id or f"q_{secrets.token_hex(4)}"
+    question_id = q_data.id or _capture(game, f"q_{secrets.token_hex(4)}")
 
     return Question(
         id=question_id,
         text=q_data.text,
         options=processed_options,
         correct_answer_id=correct_id, # Se necesita internamente, pero no se envía en NewQuestionPayload
-        time_limit=q_data.time_limit
+        time_limit=q_data.time_limit,
+        media_url=media_url(q_data.media_id) if q_data.media_id else None
     )
 
 def calculate_points(start_time: float, answer_time: float, time_limit: int, base_points: int = 1000) -> int:
@@ -177,6 +228,31 @@ def calculate_points(start_time: float, answer_time: float, time_limit: int, bas
     factor = max(0.1, 1.0 - (time_taken / time_limit))
     return int(base_points * factor)
 
+def calculate_points_batch(start_time: float, answer_times: Sequence[float], time_limit: int, base_points: int = 1000) -> List[int]:
+    """
+    `calculate_points` para varias respuestas: una lista por comprensión con la
+    misma fórmula, aplicada al timestamp de recepción de cada una.
+
+    Cada respuesta se puntúa con su propio timestamp, así que agruparlas no
+    cambia los puntos de nadie.
+
+    Args:
+        start_time: Timestamp (time.time()) de cuándo se mostró la pregunta.
+        answer_times: Timestamps de recepción de cada respuesta.
+        time_limit: Tiempo máximo en segundos permitido para responder.
+        base_points: Puntuación máxima posible por responder instantáneamente.
+
+    Returns:
+        Los puntos de cada respuesta, en el mismo orden que `answer_times`.
+    """
+    # La misma expresión que calculate_points (dividir, no multiplicar por el inverso):
+    # con el truncado a entero, cualquier diferencia de redondeo cambiaría algún punto
+    return [
+        int(base_points * max(0.1, 1.0 - (time_taken / time_limit)))
+        if 0.0 <= (time_taken := answer_time - start_time) < time_limit else 0
+        for answer_time in answer_times
+    ]
+
 # <<< FUNCIÓN RESTAURADA >>>
 def get_scoreboard(game: Game) -> List[ScoreboardEntry]:
     """
@@ -186,73 +262,170 @@ def get_scoreboard(game: Game) -> List[ScoreboardEntry]:
     Returns:
         Una lista de objetos ScoreboardEntry, ordenada por puntuación descendente.
     """
-    valid_players: List[Player] = [p for p in game.players.values() if p]
-    sorted_players = sorted(valid_players, key=lambda p: p.score, reverse=True)
+    scores = game.connections.scores
+    valid_players = [(scores[conn_id], p.nickname) for conn_id, p in game.players.items()]
+    sorted_players = sorted(valid_players, key=lambda entry: entry[0], reverse=True)
     scoreboard = [
-        ScoreboardEntry(rank=i + 1, nickname=p.nickname, score=p.score)
-        for i, p in enumerate(sorted_players)
+        ScoreboardEntry(rank=i + 1, nickname=nickname, score=score)
+        for i, (score, nickname) in enumerate(sorted_players)
     ]
     return scoreboard
 
 def get_real_player_count(game: Game) -> int:
     """Calcula el número de jugadores reales (excluyendo al host)."""
-    host_conn = game.host_connection
-    return sum(1 for ws, player in game.players.items() if ws != host_conn and player is not None)
+    return len(game.players) - (1 if game.host_id in game.players else 0)
 
 def get_player_only_scoreboard(game: Game) -> List[ScoreboardEntry]:
     """
     Genera la lista de puntuaciones ordenada excluyendo al host.
     """
-    host_conn = game.host_connection
-    # Filtrar solo jugadores reales (no el host)
-    real_players: List[Player] = [p for ws, p in game.players.items() if p and ws != host_conn]
+    host_id = game.host_id
+    scores = game.connections.scores
+    # Filtrar solo jugadores reales (no el host). Los desconectados en periodo
+    # de gracia conservan su puesto hasta que reanuden o expiren.
+    real_players = [(scores[conn_id], p.nickname) for conn_id, p in game.players.items() if conn_id != host_id]
+    real_players.extend((d.score, d.nickname) for d in game.detached_players.values())
 
     # Ordenar jugadores reales por puntuación (mayor a menor)
-    sorted_players = sorted(real_players, key=lambda p: p.score, reverse=True)
+    sorted_players = sorted(real_players, key=lambda entry: entry[0], reverse=True)
 
     # Crear las entradas del marcador con el rango basado solo en jugadores reales
     scoreboard = [
-        ScoreboardEntry(rank=i + 1, nickname=p.nickname, score=p.score)
-        for i, p in enumerate(sorted_players)
+        ScoreboardEntry(rank=i + 1, nickname=nickname, score=score)
+        for i, (score, nickname) in enumerate(sorted_players)
     ]
     return scoreboard
 
+def get_team_scoreboard(game: Game) -> Optional[List[TeamScoreboardEntry]]:
+    """
+    Clasificación de equipos, o None si nadie se ha unido con equipo.
+
+    Sale de los agregados incrementales de `game.teams`: O(equipos), sin recorrer a los jugadores.
+    """
+    if not game.teams:
+        return None
+    return [
+        TeamScoreboardEntry(rank=rank, team=team, score=score, members=members, average_score=average)
+        for rank, team, score, members, average in game.teams.standings()
+    ]
+
 # --- Funciones de Comunicación WebSocket ---
 
-async def broadcast(games_dict: Dict[str, Game], game_code: str, message: WebSocketMessage, exclude_connection: Optional[WebSocket] = None):
+async def broadcast(games_dict: Dict[str, Game], game_code: str, message: WebSocketMessage, exclude_id: Optional[int] = None):
     """
     Envía un mensaje WebSocket a todos los participantes activos de una partida.
 
-    Busca la partida en `games_dict` y envía el mensaje JSON serializado a
-    cada conexión en `game.active_connections`, excepto a la especificada en
-    `exclude_connection` (si se proporciona).
+    Busca la partida en `games_dict` y envía el mensaje serializado a cada
+    conexión activa de `game.connections`, excepto a la indicada en
+    `exclude_id` (si se proporciona). Se serializa una sola vez por
+    codificación (JSON o binaria, ver wire.py), no una vez por conexión.
 
     Args:
         games_dict: El diccionario global de partidas activas.
         game_code: El código de la partida a la que enviar el broadcast.
         message: El objeto WebSocketMessage a enviar.
-        exclude_connection: Conexión WebSocket opcional a excluir del broadcast.
+        exclude_id: conn_id opcional a excluir del broadcast.
     """
     if game_code in games_dict:
         game = games_dict[game_code]
-        message_json = message.model_dump_json() # Pydantic v2+
+        encoded = EncodedMessage(message)
         # Copiar la lista para evitar problemas si se modifica durante la iteración
-        connections_to_send = list(game.active_connections)
+        excluded = game.connections.get(exclude_id)
+        connections_to_send = list(game.connections.active_connections)
         for connection in connections_to_send:
-            if connection != exclude_connection:
-                try:
-                    await connection.send_text(message_json)
-                except WebSocketDisconnect:
-                    # Loggear pero no interrumpir el broadcast para otros
-                    logger.warning(f"Broadcast failed for one client: disconnected during send in game {game_code}.")
-                    # La limpieza de esta conexión ocurrirá en handle_disconnect
-                except Exception as e:
-                    # Otros errores de envío (ej: conexión cerrada inesperadamente)
-                    logger.error(f"Error broadcasting to a client in game {game_code}: {e}", exc_info=False) # exc_info=False para no llenar logs
+            if connection is not excluded:
+                await _send_broadcast_frame(game_code, connection, encoded.frame(encoding_of(connection)))
     else:
         logger.warning(f"Attempted to broadcast to non-existent game: {game_code}")
 
 
+async def broadcast_views(games_dict: Dict[str, Game], game_code: str, frames: List[EncodedMessage]):
+    """
+    Como `broadcast`, pero con un mensaje por vista de opciones.
+
+    Cada conexión recibe `frames[vista % len(frames)]` según su columna
+    `connections.views`: las N variantes se codifican una sola vez por
+    codificación (ver `_question_frames`), no una por jugador.
+    """
+    game = games_dict.get(game_code)
+    if game is None:
+        logger.warning(f"Attempted to broadcast to non-existent game: {game_code}")
+        return
+    views = game.connections.views
+    frame_count = len(frames)
+    for conn_id, connection in game.connections.iter_active():
+        await _send_broadcast_frame(game_code, connection, frames[views[conn_id] % frame_count].frame(encoding_of(connection)))
+
+
+async def send_personalized(game: Game, message: PersonalizedMessage, recipients: Sequence[Tuple[WebSocket, Sequence]]):
+    """
+    Envía un mensaje personalizado a varias conexiones a la vez.
+
+    La parte común del mensaje se serializa una vez por codificación y a
+    cada conexión solo se le añaden sus campos (ver `PersonalizedMessage`);
+    los envíos se hacen concurrentemente, así que una conexión lenta no
+    retrasa al resto.
+
+    Args:
+        game: La partida (para los logs de errores de envío).
+        message: El mensaje con la parte común ya fijada.
+        recipients: Pares (conexión, valores de `message.personal_fields`).
+    """
+    game_code = game.game_code
+    await asyncio.gather(*(
+        _send_broadcast_frame(game_code, websocket, message.frame(encoding_of(websocket), values))
+        for websocket, values in recipients
+    ))
+
+
+async def broadcast_lobby_update(games_dict: Dict[str, Game], game: Game, message: WebSocketMessage, exclude_id: Optional[int] = None):
+    """
+    Envía un 'player_joined'/'player_left' a la partida.
+
+    Normalmente es un `broadcast`. Con sobrecarga (LEVEL_COALESCE_LOBBY) y
+    la partida en el lobby, solo el host lo recibe al momento (mantiene la
+    lista de jugadores); a los jugadores, que solo muestran el contador, les
+    llega el último cada OVERLOAD_LOBBY_FLUSH_S. Así una avalancha de uniones
+    cuesta O(N) envíos por segundo en lugar de O(N) por unión.
+    """
+    if overload_controller.level < LEVEL_COALESCE_LOBBY or game.state != GameStateEnum.LOBBY or _replaying(game):
+        await broadcast(games_dict, game.game_code, message, exclude_id=exclude_id)
+        return
+    shed_total.inc("lobby_update")
+    host_websocket = game.connections.get(game.host_id) if game.host_id != exclude_id else None
+    if host_websocket is not None:
+        await send_personal_message(host_websocket, message)
+    if game.pending_lobby_update is None:
+        asyncio.create_task(_flush_lobby_update(games_dict, game))
+    game.pending_lobby_update = message # El contador del último mensaje ya es el actual
+
+
+async def _flush_lobby_update(games_dict: Dict[str, Game], game: Game):
+    """Tarea que envía a los jugadores la última actualización de lobby agrupada."""
+    await asyncio.sleep(OVERLOAD_LOBBY_FLUSH_S)
+    message, game.pending_lobby_update = game.pending_lobby_update, None
+    if message is None or game.state != GameStateEnum.LOBBY or game.actor.closed:
+        return # La partida empezó (o se cerró): 'game_started' ya lleva el contador
+    await broadcast(games_dict, game.game_code, message, exclude_id=game.host_id)
+
+
+async def _send_broadcast_frame(game_code: str, connection: WebSocket, frame: Union[str, bytes]):
+    """Envía un fotograma de broadcast a una conexión sin interrumpir el envío al resto si falla."""
+    try:
+        await send_frame(connection, frame)
+    except WebSocketDisconnect:
+        # Loggear pero no interrumpir el broadcast para otros
+        if should_log(game_code, "send_error"):
+            logger.warning("Broadcast failed for one client: disconnected during send in game %s.", game_code,
+                           extra={"game_code": game_code, "event": "send_error"})
+        # La limpieza de esta conexión ocurrirá en handle_disconnect
+    except Exception as e:
+        # Otros errores de envío (ej: conexión cerrada inesperadamente)
+        if should_log(game_code, "send_error"):
+            logger.error("Error broadcasting to a client in game %s: %s", game_code, e,
+                         extra={"game_code": game_code, "event": "send_error"}) # Sin traceback para no llenar logs
+
+
 async def send_personal_message(websocket: WebSocket, message: WebSocketMessage):
     """
     Envía un mensaje WebSocket a una única conexión específica.
@@ -262,18 +435,155 @@ async def send_personal_message(websocket: WebSocket, message: WebSocketMessage)
         message: El objeto WebSocketMessage a enviar.
     """
     try:
-        await websocket.send_text(message.model_dump_json()) # Pydantic v2+
+        await send_frame(websocket, encode(message, encoding_of(websocket)))
     except WebSocketDisconnect:
         # El cliente ya se desconectó, no se puede enviar.
-        logger.warning(f"Attempted to send personal message but client was already disconnected.")
+        logger.warning("Attempted to send personal message but client was already disconnected.")
     except Exception as e:
         # Otro error durante el envío
-        logger.error(f"Error sending personal message: {e}", exc_info=False)
+        logger.error("Error sending personal message: %s", e)
+
+
+# --- Actor de Partida (serialización de cambios de estado) ---
+
+def submit_command(games_dict: Dict[str, Game], game: Game, kind: str, conn_id: Optional[int] = None,
+                   payload=None, wait: bool = False) -> Optional[asyncio.Future]:
+    """
+    Encola un comando en el actor de la partida (ver game_actor.py).
+
+    Es la única vía para modificar el estado de una partida desde fuera de
+    sus comandos: bucles de recepción, temporizadores y heartbeat.
+
+    Args:
+        games_dict: El diccionario global de partidas activas.
+        game: La partida destino.
+        kind: Tipo de comando (CMD_*).
+        conn_id: Conexión que origina el comando, si la hay.
+        payload: Datos del comando.
+        wait: Si es True, devuelve un Future con el resultado del comando.
+
+    Returns:
+        El Future del comando si `wait` es True, o None.
+    """
+    actor = game.actor
+    if not actor.running:
+        actor.start(functools.partial(_apply_commands, games_dict, game),
+                    batch_window=ANSWER_BATCH_WINDOW_MS / 1000.0, window_kinds=(CMD_ANSWER,))
+    return actor.submit(kind, conn_id, payload, wait)
+
+
+async def _apply_commands(games_dict: Dict[str, Game], game: Game, batch: List[GameCommand]):
+    """
+    Aplica en orden un lote de comandos del actor de la partida.
+
+    Las respuestas consecutivas del lote se puntúan juntas
+    (`handle_submit_answers`); el resto se aplica uno a uno. Cada comando se
+    anota en el registro de eventos justo antes de aplicarse, así que el
+    registro sigue exactamente el orden del actor.
+    """
+    event_log = game.event_log
+    index = 0
+    while index < len(batch):
+        if game.actor.closed:
+            return # La partida se eliminó durante el lote: el resto se descarta
+        command = batch[index]
+        if command.kind == CMD_ANSWER:
+            end = index + 1
+            while end < len(batch) and batch[end].kind == CMD_ANSWER:
+                end += 1
+            if event_log is not None:
+                for answer in batch[index:end]:
+                    event_log.record_command(CMD_ANSWER, answer.conn_id, answer.payload)
+            await _traced(game, CMD_ANSWER, handle_submit_answers(game, batch[index:end]))
+            index = end
+            continue
+        if event_log is not None:
+            event_log.record_command(command.kind, command.conn_id, command.payload)
+        result = await _traced(game, command.kind, _apply_command(games_dict, game, command))
+        if command.future is not None and not command.future.done():
+            command.future.set_result(result)
+        index += 1
+
+
+def _capture(game: Game, value):
+    """
+    Pasa por el registro de eventos un valor no determinista leído por un manejador.
+
+    En una partida normal se anota y se devuelve tal cual; al reproducirla
+    (replay.py) se devuelve el valor anotado en su lugar, en el mismo orden.
+    """
+    return game.event_log.capture(value) if game.event_log is not None else value
+
+
+def _replaying(game: Game) -> bool:
+    """True si la partida se está reproduciendo: los temporizadores ya vienen como comandos en el registro."""
+    return game.event_log is not None and game.event_log.replaying
+
+
+async def _traced(game: Game, kind: str, coroutine):
+    """Ejecuta un manejador con etiqueta de despacho y trazado; registra (sin propagar) sus errores."""
+    set_dispatch_context(game.game_code, kind) # Etiqueta para perfilado/diagnóstico
+    trace_started = handler_tracer.start()
+    try:
+        return await coroutine
+    except Exception as e:
+        logger.exception(f"Unhandled error applying command '{kind}' in game {game.game_code}: {e}")
+        return None
+    finally:
+        if trace_started is not None:
+            handler_tracer.finish(trace_started, game.game_code, kind, game)
+
+
+async def _apply_command(games_dict: Dict[str, Game], game: Game, command: GameCommand):
+    """
+    Despacha un comando a su manejador.
+
+    Returns:
+        Para 'join_game' y 'resume_session', True si la conexión quedó unida a
+        la partida. None para el resto.
+    """
+    kind = command.kind
+    conn_id = command.conn_id
+    if kind == CMD_ANSWER:
+        await handle_submit_answers(game, [command])
+    elif kind == CMD_JOIN:
+        await handle_join_game(games_dict, game, conn_id, command.payload)
+        return conn_id in game.players
+    elif kind == CMD_RESUME:
+        await handle_resume_session(games_dict, game, conn_id, command.payload)
+        return conn_id in game.players
+    elif kind == CMD_DISCONNECT:
+        await handle_disconnect(games_dict, game.game_code, conn_id, allow_resume=command.payload)
+    elif kind == CMD_LOAD_QUIZ:
+        await handle_load_quiz_data(games_dict, game, conn_id, command.payload)
+    elif kind == CMD_START:
+        await handle_start_game(games_dict, game, conn_id)
+    elif kind == CMD_NEXT:
+        await handle_next_question(games_dict, game, conn_id)
+    elif kind == CMD_END:
+        await handle_game_over(games_dict, game)
+    elif kind == CMD_AUTO_ADVANCE:
+        # Solo si la partida sigue en el marcador de la misma pregunta que programó el avance
+        if game.state == GameStateEnum.LEADERBOARD and game.current_question_index == command.payload:
+            logger.info(f"Game {game.game_code}: Auto-advance delay finished. Triggering next stage from LEADERBOARD.")
+            await advance_to_next_stage(games_dict, game)
+        else:
+            logger.info(f"Game {game.game_code}: Auto-advance cancelled. State changed during delay (Current state: {game.state.value}).")
+    elif kind == CMD_EXPIRE_SESSION:
+        await expire_detached_player(games_dict, game, command.payload)
+    elif kind == CMD_CLOSE_QUESTION:
+        # Solo si la sala sigue mostrando la pregunta que el torneo quiere cerrar
+        if game.state == GameStateEnum.QUESTION_DISPLAY and game.current_question_index == command.payload:
+            await advance_to_next_stage(games_dict, game)
+    elif kind == CMD_GLOBAL_LEADERBOARD:
+        await send_global_leaderboard(games_dict, game, command.payload)
+    else:
+        logger.error(f"Unknown command '{kind}' submitted to game {game.game_code}.")
 
 
 # --- Lógica de Flujo del Juego (Manejadores de Eventos) ---
 
-async def handle_join_game(games_dict: Dict[str, Game], game: Game, websocket: WebSocket, payload_data: dict):
+async def handle_join_game(games_dict: Dict[str, Game], game: Game, conn_id: int, payload_data: dict):
     """
     Procesa la solicitud de un cliente para unirse a una partida existente.
 
@@ -282,14 +592,16 @@ async def handle_join_game(games_dict: Dict[str, Game], game: Game, websocket: W
     lo añade al juego, asigna el rol de host si es el primero en unirse,
     envía un mensaje de confirmación ('join_ack') al jugador con la cuenta
     de jugadores actual, y notifica al resto ('player_joined') con el
-    contador de jugadores reales.
+    contador de jugadores reales. Si el payload trae un equipo, el jugador
+    se suma a él (se crea si es el primero en usar ese nombre).
 
     Args:
         games_dict: El diccionario global de partidas activas (para broadcast).
         game: El objeto Game al que intenta unirse el jugador.
-        websocket: La conexión WebSocket del jugador que intenta unirse.
+        conn_id: ID de la conexión del jugador que intenta unirse.
         payload_data: El diccionario con los datos del payload 'join_game'.
     """
+    websocket = game.connections.get(conn_id)
     try:
         payload = JoinGamePayload(**payload_data)
         nickname = payload.nickname.strip() # Eliminar espacios extra
@@ -297,42 +609,66 @@ async def handle_join_game(games_dict: Dict[str, Game], game: Game, websocket: W
         # Validaciones
         if not nickname:
             await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="El nickname no puede estar vacío.")))
-            await websocket.close(code=1008) # Policy Violation
+            await close_connection(websocket, 1008) # Policy Violation
             return
         if game.state != GameStateEnum.LOBBY:
             await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="La partida ya ha comenzado.")))
-            await websocket.close(code=1008)
+            await close_connection(websocket, 1008)
             return
-        # Comprobar si el nickname (insensible a mayúsculas) ya existe
-        if any(p.nickname.lower() == nickname.lower() for p in game.players.values()):
+        # Comprobar si el nickname (insensible a mayúsculas) ya existe (incluidos jugadores en periodo de gracia)
+        if any(p.nickname.lower() == nickname.lower() for p in game.players.values()) or \
+           any(d.nickname.lower() == nickname.lower() for d in game.detached_players.values()):
             await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="El nickname ya está en uso.")))
-            await websocket.close(code=1008)
+            await close_connection(websocket, 1008)
             return
         # Comprobar si esta conexión ya está registrada (no debería pasar si se maneja bien en main.py)
-        if websocket in game.players:
+        if conn_id in game.players:
             await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Ya estás unido a esta partida con esta conexión.")))
             return # No cerrar, solo informar
 
+        # Asignar Host si es el primero (en una partida restaurada el host está pendiente de reconectar;
+        # las salas de un torneo no tienen host)
+        is_first_connection = (game.host_id is None and game.detached_host is None and game.tournament is None)
+
+        # Equipo (opcional; el host no juega, así que no pertenece a ninguno)
+        team_id = None
+        team_name = (payload.team or "").strip()
+        if team_name and not is_first_connection:
+            try:
+                team_id = game.teams.resolve(team_name)
+            except TeamError as e:
+                await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message=str(e))))
+                await close_connection(websocket, 1008)
+                return
+            game.teams.add_member(team_id)
+            team_name = game.teams.name(team_id)
+
         # Crear y añadir jugador
-        player = Player(nickname=nickname, connection=websocket)
-        game.players[websocket] = player
-        # Asegurarse de que la conexión esté en la lista activa
-        if websocket not in game.active_connections:
-            game.active_connections.append(websocket)
+        player = Player(nickname=nickname, conn_id=conn_id, team_id=team_id)
+        game.players[conn_id] = player
+        if not is_first_connection:
+            game.ranking.add() # Entra en el índice de puestos con 0 puntos
+        # Añadir la conexión a la lista de fan-out
+        game.connections.activate(conn_id)
 
         # --- MODIFICADO: Calcular el número de jugadores REALES ANTES de enviar el ACK ---
         # Se calcula después de añadir al jugador actual a game.players
         real_player_count = get_real_player_count(game)
         # ---------------------------------------------------------------------------
 
-        # Asignar Host si es el primero
-        is_first_connection = (game.host_connection is None)
         if is_first_connection:
-            game.host_connection = websocket
+            game.host_id = conn_id
             logger.info(f"Player '{nickname}' assigned as HOST for game '{game.game_code}'.")
             welcome_message = f"¡Eres el Anfitrión de la partida {game.game_code}! Esperando jugadores..."
         else:
-            welcome_message = f"¡Bienvenido a la partida {game.game_code}, {nickname}! Esperando al anfitrión."
+            if game.tournament is not None:
+                welcome_message = f"¡Bienvenido a la sala {game.game_code} del torneo, {nickname}! Esperando a que empiece."
+            else:
+                welcome_message = f"¡Bienvenido a la partida {game.game_code}, {nickname}! Esperando al anfitrión."
+            # Solo los jugadores reales pueden reanudar sesión (si el host se va, la partida termina)
+            player.reconnect_token = _capture(game, secrets.token_urlsafe(16))
+            game.player_tokens[player.reconnect_token] = conn_id
+            game.connections.views[conn_id] = option_view(player.reconnect_token)
 
         # --- MODIFICADO: Enviar confirmación personal (Join ACK) con el contador de jugadores ---
         await send_personal_message(websocket, WebSocketMessage(
@@ -340,22 +676,33 @@ async def handle_join_game(games_dict: Dict[str, Game], game: Game, websocket: W
             payload=JoinAckPayload(
                 nickname=nickname,
                 message=welcome_message,
-                player_count=real_player_count # Incluir el contador
+                player_count=real_player_count, # Incluir el contador
+                reconnect_token=player.reconnect_token,
+                team=team_name if team_id is not None else None
             )
         ))
         # ----------------------------------------------------------------------------------
+        # Imágenes del quiz (si ya está cargado): se descargan mientras se espera en el lobby
+        prefetch = _media_prefetch_message(game)
+        if prefetch is not None:
+            await send_personal_message(websocket, prefetch)
 
         # Notificar a todos los demás jugadores (Broadcast Player Joined)
         # El contador aquí ya es el actualizado.
-        await broadcast(games_dict, game.game_code, WebSocketMessage(
+        await broadcast_lobby_update(games_dict, game, WebSocketMessage(
             type="player_joined",
-            payload=PlayerJoinedPayload(nickname=nickname, player_count=real_player_count)
-        ), exclude_connection=websocket) # Excluir al que acaba de unirse
-
-        # Log con el contador total y el de jugadores reales
-        total_connections = len(game.players) # Incluye host si está en players
-        current_players_nicknames = [p.nickname for p in game.players.values()]
-        logger.info(f"Player '{nickname}' joined game '{game.game_code}'. Total connections in players dict: {total_connections}. Real player count: {real_player_count}. Current players: {current_players_nicknames}")
+            payload=PlayerJoinedPayload(nickname=nickname, player_count=real_player_count,
+                                        team=team_name if team_id is not None else None)
+        ), exclude_id=conn_id) # Excluir al que acaba de unirse
+
+        # Log con el contador total y el de jugadores reales (la lista completa de nicknames, solo en DEBUG)
+        if should_log(game.game_code, "join_game"):
+            logger.info("Player '%s' joined game '%s'.", nickname, game.game_code,
+                        extra={"game_code": game.game_code, "event": "join_game",
+                               "fields": {"connections": len(game.players), "players": real_player_count}})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Current players in game '%s': %s", game.game_code, [p.nickname for p in game.players.values()],
+                         extra={"game_code": game.game_code, "event": "join_game"})
 
     except ValidationError as e:
         logger.warning(f"Invalid join_game payload: {e}")
@@ -373,7 +720,191 @@ async def handle_join_game(games_dict: Dict[str, Game], game: Game, websocket: W
             pass
 
 
-async def handle_start_game(games_dict: Dict[str, Game], game: Game, websocket: WebSocket):
+async def handle_resume_session(games_dict: Dict[str, Game], game: Game, conn_id: int, payload_data: dict):
+    """
+    Procesa la solicitud de un jugador para reanudar su sesión tras una desconexión.
+
+    Busca el token de reconexión entre los jugadores desconectados en periodo
+    de gracia (o entre los conectados, si el servidor aún no ha detectado la
+    caída de la conexión anterior, que se sustituye). Reasocia al jugador con
+    la nueva conexión conservando su puntuación y le envía una única
+    instantánea ('session_resumed') con la pregunta en curso, el tiempo
+    restante y su puntuación. No se envía nada al resto de la sala.
+
+    Args:
+        games_dict: El diccionario global de partidas activas.
+        game: El objeto Game en el que se intenta reanudar.
+        conn_id: ID de la nueva conexión del jugador.
+        payload_data: El diccionario con los datos del payload 'resume_session'.
+    """
+    websocket = game.connections.get(conn_id)
+    connections = game.connections
+    try:
+        payload = ResumeSessionPayload(**payload_data)
+        token = payload.reconnect_token
+
+        if game.state == GameStateEnum.FINISHED:
+            await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="La partida ya ha terminado.", code="RESUME_FAILED")))
+            await close_connection(websocket, 1008)
+            return
+
+        if game.host_reconnect_token and secrets.compare_digest(token, game.host_reconnect_token):
+            await _resume_host(game, conn_id)
+            return
+
+        detached = game.detached_players.pop(token, None)
+        if detached is not None:
+            answered = (detached.answered_question_index == game.current_question_index and game.state == GameStateEnum.QUESTION_DISPLAY)
+            player = Player(nickname=detached.nickname, conn_id=conn_id, reconnect_token=token, team_id=detached.team_id)
+            connections.scores[conn_id] = detached.score
+            connections.answered[conn_id] = 1 if answered else 0
+            connections.answer_times[conn_id] = detached.last_answer_time or 0.0
+            connections.views[conn_id] = option_view(token) # La misma vista que antes de desconectarse
+        else:
+            # Puede que la conexión anterior siga registrada (caída aún no detectada): sustituirla
+            old_id = game.player_tokens.get(token)
+            player = game.players.pop(old_id, None) if old_id is not None else None
+            if player is None:
+                logger.warning(f"Invalid or expired reconnect token in game {game.game_code}.")
+                await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="No se pudo recuperar la sesión.", code="RESUME_FAILED")))
+                await close_connection(websocket, 1008)
+                return
+            # El hueco antiguo lo libera su propio bucle de recepción al cerrarse
+            connections.deactivate(old_id)
+            connections.copy_player_state(old_id, conn_id)
+            player.conn_id = conn_id
+            old_websocket = connections.get(old_id)
+            if old_websocket is not None:
+                asyncio.create_task(_close_quietly(old_websocket))
+
+        game.players[conn_id] = player
+        game.player_tokens[token] = conn_id
+        connections.activate(conn_id)
+        sessions_resumed_total.inc()
+
+        # Construir la instantánea de estado
+        scoreboard = get_player_only_scoreboard(game)
+        rank = next((entry.rank for entry in scoreboard if entry.nickname == player.nickname), None)
+        question_payload = None
+        time_remaining = None
+        if game.state == GameStateEnum.QUESTION_DISPLAY and game.current_question_payload and game.question_start_time:
+            question_payload = _payload_for_player(game, conn_id, game.current_question_payload)
+            time_remaining = min(question_payload.time_limit,
+                                 max(0.0, game.question_start_time + question_payload.time_limit - _capture(game, time.time())))
+
+        await send_personal_message(websocket, WebSocketMessage(
+            type="session_resumed",
+            payload=SessionResumedPayload(
+                nickname=player.nickname,
+                state=game.state,
+                score=connections.scores[conn_id],
+                rank=rank,
+                player_count=get_real_player_count(game),
+                question=question_payload,
+                time_remaining=time_remaining,
+                has_answered=bool(connections.answered[conn_id])
+            )
+        ))
+        await _resend_prefetch(game, conn_id)
+        logger.info(f"Player '{player.nickname}' resumed session in game '{game.game_code}' (state {game.state.value}, score {connections.scores[conn_id]}).")
+
+    except ValidationError as e:
+        logger.warning(f"Invalid resume_session payload: {e}")
+        await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Datos de reconexión inválidos.", code="RESUME_FAILED")))
+    except WebSocketDisconnect:
+        logger.warning(f"Client disconnected during resume process for game {game.game_code}.")
+    except Exception as e:
+        logger.error(f"Error handling resume_session for game {game.game_code}: {e}", exc_info=True)
+        try:
+            await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Error interno al reanudar la sesión.", code="RESUME_FAILED")))
+        except Exception:
+            pass
+
+
+async def _resume_host(game: Game, conn_id: int):
+    """Reasocia al host de una partida restaurada tras un reinicio con su nueva conexión."""
+    websocket = game.connections.get(conn_id)
+    nickname = game.detached_host.nickname
+    game.detached_host = None
+    game.host_reconnect_token = None
+    game.players[conn_id] = Player(nickname=nickname, conn_id=conn_id)
+    game.host_id = conn_id
+    game.connections.activate(conn_id)
+    sessions_resumed_total.inc()
+    question_payload = None
+    time_remaining = None
+    if game.state == GameStateEnum.QUESTION_DISPLAY and game.current_question_payload and game.question_start_time:
+        question_payload = game.current_question_payload
+        time_remaining = min(question_payload.time_limit,
+                             max(0.0, game.question_start_time + question_payload.time_limit - _capture(game, time.time())))
+    await send_personal_message(websocket, WebSocketMessage(
+        type="session_resumed",
+        payload=SessionResumedPayload(
+            nickname=nickname,
+            state=game.state,
+            score=0,
+            player_count=get_real_player_count(game),
+            question=question_payload,
+            time_remaining=time_remaining
+        )
+    ))
+    await _resend_prefetch(game, conn_id)
+    logger.info(f"Host '{nickname}' resumed session in restored game '{game.game_code}' (state {game.state.value}).")
+
+
+async def _resend_prefetch(game: Game, conn_id: int):
+    """Reenvía la siguiente pregunta oculta a quien reanuda la sesión durante el marcador (se perdió el envío)."""
+    if game.prefetched_question is not None and game.state in (GameStateEnum.LOBBY, GameStateEnum.LEADERBOARD):
+        payload = _payload_for_player(game, conn_id, game.prefetched_question.payload)
+        await send_personal_message(game.connections.get(conn_id), WebSocketMessage(type="question_prefetch", payload=payload))
+
+
+async def _close_quietly(websocket: WebSocket):
+    """Cierra una conexión ignorando errores (puede estar ya muerta)."""
+    try:
+        await close_connection(websocket, 1000)
+    except Exception:
+        pass
+
+
+async def handle_load_quiz_data(games_dict: Dict[str, Game], game: Game, conn_id: int, quiz_data: QuizData):
+    """
+    Asigna a la partida un cuestionario enviado por el host ('load_quiz_data').
+
+    El payload ya llega validado (main.py); aquí solo se comprueba que la
+    partida siga en LOBBY, ya que otro comando pudo iniciarla mientras tanto.
+    Si el quiz tiene imágenes, los que ya esperan en el lobby reciben
+    'media_prefetch' para descargarlas antes de empezar.
+
+    Args:
+        games_dict: El diccionario global de partidas activas.
+        game: El objeto Game al que se asigna el cuestionario.
+        conn_id: ID de la conexión del host.
+        quiz_data: El cuestionario validado.
+    """
+    websocket = game.connections.get(conn_id)
+    if game.state != GameStateEnum.LOBBY:
+        logger.warning(f"Host tried to load quiz data in wrong state ({game.state}) for game {game.game_code}.")
+        await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="No se pueden cargar datos del cuestionario una vez iniciada la partida.")))
+        return
+    game.quiz_data = quiz_data # Asignar al estado del juego
+    logger.info(f"Successfully validated and loaded quiz data for game {game.game_code} via WebSocket. Title: '{quiz_data.title}', Questions: {len(quiz_data.questions)}")
+    # Confirmar al host que se cargó
+    await send_personal_message(websocket, WebSocketMessage(type="quiz_loaded_ack", payload={"title": quiz_data.title, "question_count": len(quiz_data.questions)}))
+    prefetch = _media_prefetch_message(game)
+    if prefetch is not None:
+        await broadcast(games_dict, game.game_code, prefetch)
+
+
+def _media_prefetch_message(game: Game) -> Optional[WebSocketMessage]:
+    """Mensaje 'media_prefetch' con las imágenes del quiz de la partida, o None si no tiene."""
+    media_ids = quiz_media_ids(game.quiz_data) if game.quiz_data else []
+    if not media_ids:
+        return None
+    return WebSocketMessage(type="media_prefetch", payload=MediaPrefetchPayload(urls=[media_url(media_id) for media_id in media_ids]))
+
+
+async def handle_start_game(games_dict: Dict[str, Game], game: Game, conn_id: int):
     """
     Procesa la solicitud del host para iniciar la partida.
 
@@ -386,10 +917,11 @@ async def handle_start_game(games_dict: Dict[str, Game], game: Game, websocket:
     Args:
         games_dict: El diccionario global de partidas activas (para broadcast y llamadas).
         game: El objeto Game que se intenta iniciar.
-        websocket: La conexión WebSocket del cliente que envió el mensaje 'start_game'.
+        conn_id: ID de la conexión del cliente que envió el mensaje 'start_game'.
     """
-    # Validaciones
-    if game.host_connection != websocket:
+    websocket = game.connections.get(conn_id)
+    # Validaciones (las salas de un torneo no tienen host: las inicia el torneo, con conn_id None)
+    if game.host_id != conn_id:
         await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Solo el anfitrión puede iniciar la partida.")))
         return
     if game.state != GameStateEnum.LOBBY:
@@ -413,9 +945,11 @@ async def handle_start_game(games_dict: Dict[str, Game], game: Game, websocket:
 
     # Notificar a todos que el juego ha comenzado
     await broadcast(games_dict, game.game_code, WebSocketMessage(type="game_started", payload=GameStartedPayload()))
+    game.spectators.publish("game_started", GameStartedPayload())
 
-    # Pequeña pausa antes de enviar la pregunta para que el cliente procese 'game_started'
-    await asyncio.sleep(0.1)
+    # La primera pregunta viaja oculta junto a 'game_started'; el 'reveal' ya se programa
+    # REVEAL_LEAD_MS por delante, así que no hace falta pausar el actor
+    await prefetch_next_question(games_dict, game, 0)
     # Enviar la primera pregunta
     await send_current_question(games_dict, game)
 
@@ -424,18 +958,25 @@ async def send_current_question(games_dict: Dict[str, Game], game: Game):
     """
     Prepara y envía la pregunta actual a todos los jugadores.
 
-    Llama a `get_current_question` para obtener la pregunta procesada.
-    Si se obtiene una pregunta válida, actualiza el estado del juego
-    (QUESTION_DISPLAY, hora de inicio, resetea respuestas), construye el
-    payload `NewQuestionPayload` y lo envía a todos los jugadores.
+    Si la pregunta ya se envió oculta durante el marcador
+    (`prefetch_next_question`), solo se envía un fotograma 'reveal' pequeño
+    con la hora de inicio programada (REVEAL_LEAD_MS por delante), y la
+    puntuación se mide desde esa hora: todos la ven a la vez,
+    independientemente de lo que tarde el fan-out. Si no (reanudación tras un
+    reinicio), se procesa con `get_current_question` y se envía completa en
+    'new_question', como siempre.
     Si no hay más preguntas o falla la obtención, finaliza la partida.
 
     Args:
         games_dict: El diccionario global de partidas activas (para broadcast y llamadas).
         game: El objeto Game para el cual enviar la pregunta.
     """
+    prefetched = game.prefetched_question
+    game.prefetched_question = None
+    if prefetched is not None and prefetched.payload.question_number != game.current_question_index + 1:
+        prefetched = None # Preparada para otra pregunta (no debería pasar)
     # Obtener y procesar la pregunta actual
-    question: Optional[Question] = get_current_question(game)
+    question: Optional[Question] = prefetched.question if prefetched is not None else get_current_question(game)
 
     if not question:
         # Si no hay pregunta, puede ser el fin del quiz o un error
@@ -449,126 +990,267 @@ async def send_current_question(games_dict: Dict[str, Game], game: Game):
 
     # Actualizar estado del juego para la nueva pregunta
     game.state = GameStateEnum.QUESTION_DISPLAY
-    game.question_start_time = time.time() # Registrar cuándo empieza la pregunta
+    now = _capture(game, time.time())
+    # Registrar cuándo empieza la pregunta (la hora de revelación programada si ya la tienen los clientes)
+    game.question_start_time = now + REVEAL_LEAD_MS / 1000 if prefetched is not None else now
+    game.current_correct_answer_id = question.correct_answer_id # Para handle_submit_answers
     game.answers_received_this_round = {} # Limpiar respuestas de la ronda anterior
-    # Resetear el flag de respuesta para todos los jugadores
-    for p in game.players.values():
-        p.has_answered_current_question = False
+    game.answer_counts = {option.id: 0 for option in question.options}
+    game.answered_count = 0
+    # Resetear el flag de respuesta para todos los jugadores (una sola copia de memoria)
+    game.connections.reset_answered()
+
+    payload = prefetched.payload if prefetched is not None else _new_question_payload(game, question, game.current_question_index)
+
+    game.current_question_payload = payload # Para reenviarlo a quien reanude sesión durante la pregunta
+    game.answer_log.begin_question(game.current_question_index, question.text, question.options)
+    # Los espectadores reciben el mismo fotograma desde su propia tarea de envío
+    game.spectators.publish("new_question", payload, replaces=("update_scoreboard",))
+    if prefetched is not None:
+        logger.info(f"Game {game.game_code}: Revealing question {payload.question_number}/{payload.total_questions} in {REVEAL_LEAD_MS}ms: {question.text}")
+        await broadcast(games_dict, game.game_code, WebSocketMessage(type="reveal", payload=RevealPayload(
+            question_id=payload.question_id,
+            question_number=payload.question_number,
+            starts_at=game.question_start_time,
+            delay_ms=REVEAL_LEAD_MS
+        )))
+    else:
+        logger.info(f"Game {game.game_code}: Sending question {payload.question_number}/{payload.total_questions}: {question.text}")
+        # Enviar la pregunta a todos los jugadores activos (cada uno con su orden de opciones)
+        await broadcast_views(games_dict, game.game_code, _question_frames(game, "new_question", payload))
+    asyncio.create_task(run_answer_stats_ticker(game, game.current_question_index))
 
-    total_questions = len(game.quiz_data.questions) if game.quiz_data else 0
-    # Preparar payload para enviar al cliente (sin la respuesta correcta)
-    payload = NewQuestionPayload(
+
+def _new_question_payload(game: Game, question: Question, question_index: int) -> NewQuestionPayload:
+    """Payload 'new_question' de una pregunta procesada (sin la respuesta correcta)."""
+    return NewQuestionPayload(
         question_id=question.id,
         question_text=question.text,
         options=question.options, # Opciones con IDs
         time_limit=question.time_limit,
-        question_number=game.current_question_index + 1, # Número legible (1-based)
-        total_questions=total_questions
+        question_number=question_index + 1, # Número legible (1-based)
+        total_questions=len(game.quiz_data.questions) if game.quiz_data else 0,
+        media_url=question.media_url
     )
 
-    logger.info(f"Game {game.game_code}: Sending question {payload.question_number}/{payload.total_questions}: {question.text}")
-    # Enviar la pregunta a todos los jugadores activos
-    await broadcast(games_dict, game.game_code, WebSocketMessage(type="new_question", payload=payload))
 
+async def prefetch_next_question(games_dict: Dict[str, Game], game: Game, question_index: int):
+    """
+    Envía oculta la pregunta `question_index` a todos para revelarla después.
 
-async def handle_submit_answer(game: Game, websocket: WebSocket, payload_data: dict):
+    Se llama mientras se muestra el marcador (y al iniciar la partida): el
+    contenido de la pregunta viaja en 'question_prefetch' sin prisa, y al
+    empezar la ronda `send_current_question` solo envía un 'reveal' pequeño.
+    No hace nada si no queda esa pregunta o no se puede procesar (entonces se
+    envía completa al empezar, como antes).
     """
-    Procesa la respuesta enviada por un jugador a la pregunta actual.
+    question = get_current_question(game, question_index)
+    if question is None:
+        return
+    payload = _new_question_payload(game, question, question_index)
+    game.prefetched_question = PrefetchedQuestion(question, payload)
+    await broadcast_views(games_dict, game.game_code, _question_frames(game, "question_prefetch", payload))
 
-    Valida el estado, jugador y respuesta. Calcula puntos si es correcta.
-    Actualiza la puntuación. Registra la respuesta. Envía el resultado
-    personal ('answer_result') con el ranking basado solo en jugadores reales.
 
-    Args:
-        game: El objeto Game al que pertenece la respuesta.
-        websocket: La conexión WebSocket del jugador que envió la respuesta.
-        payload_data: El diccionario con los datos del payload 'submit_answer'.
+def option_view(reconnect_token: str) -> int:
     """
-    # Validaciones de estado y jugador
-    if game.state != GameStateEnum.QUESTION_DISPLAY:
-        logger.warning(f"Answer received in wrong state ({game.state}) for game {game.game_code}. Ignoring.")
-        return
-    player = game.players.get(websocket)
-    if not player:
-        logger.error(f"Received answer from unknown websocket in game {game.game_code}. Ignoring.")
-        return
-    if player.has_answered_current_question:
-        logger.warning(f"Player {player.nickname} tried to answer twice for question {game.current_question_index} in game {game.game_code}. Ignoring.")
-        return
+    Vista de opciones de un jugador (0..OPTION_VIEWS-1), derivada de su token de reconexión.
 
-    try:
-        payload = SubmitAnswerPayload(**payload_data)
-        answer_id = payload.answer_id
-        received_time = time.time()
-
-        correct_answer_id = game.current_correct_answer_id
-        question_time_limit = 30 # Default value if fetching fails
-        if game.quiz_data and 0 <= game.current_question_index < len(game.quiz_data.questions):
-             current_question_data = game.quiz_data.questions[game.current_question_index]
-             question_time_limit = current_question_data.time_limit
-        else:
-             logger.warning(f"Could not get specific time limit for Q{game.current_question_index} in {game.game_code}. Using default: {question_time_limit}s")
+    Así es estable durante toda la sesión (reanudaciones y reinicios del
+    servidor incluidos) sin guardarla aparte. El host no tiene token y
+    conserva la vista 0 (orden original), igual que los espectadores.
+    """
+    return zlib.crc32(reconnect_token.encode()) % OPTION_VIEWS
 
 
-        if not correct_answer_id:
-            logger.error(f"Cannot process answer: Missing correct answer ID in game state for {game.game_code}. Player: {player.nickname}")
-            await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Error interno del servidor (ID correcto no encontrado).")))
-            return
-        if game.question_start_time is None:
-            logger.error(f"Cannot process answer: Missing question start time in game state for {game.game_code}. Player: {player.nickname}")
-            await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Error interno del servidor (tiempo inválido).")))
-            return
+def _option_permutations(game: Game, option_count: int) -> Tuple[Tuple[int, ...], ...]:
+    """Órdenes de opciones que se reparten en esta partida (solo el original si el quiz no baraja)."""
+    permutations = OPTION_PERMUTATIONS.get(option_count)
+    if permutations is None or game.quiz_data is None or not game.quiz_data.shuffle_options:
+        return (tuple(range(option_count)),)
+    return permutations
 
-        player.has_answered_current_question = True
-        player.last_answer_time = received_time
 
-        is_correct = (answer_id == correct_answer_id)
-        points = 0
-        if is_correct:
-            if received_time >= game.question_start_time:
-                points = calculate_points(game.question_start_time, received_time, question_time_limit)
-            else:
-                logger.warning(f"Received answer time {received_time:.2f} is before question start time {game.question_start_time:.2f} for player {player.nickname}. Awarding 0 points.")
-
-        player.score += points
-        answer_record = AnswerRecord(
-            player_nickname=player.nickname,
-            answer_id=answer_id,
-            received_at=received_time,
-            score_awarded=points,
-            is_correct=is_correct
-        )
-        game.answers_received_this_round[player.nickname] = answer_record
-
-        # Calcular el ranking actual excluyendo al host
-        current_player_scoreboard = get_player_only_scoreboard(game)
-        current_rank = next((entry.rank for entry in current_player_scoreboard if entry.nickname == player.nickname), 0)
-
-        result_payload = AnswerResultPayload(
-            is_correct=is_correct,
-            correct_answer_id=correct_answer_id,
-            points_awarded=points,
-            current_score=player.score,
-            current_rank=current_rank # Enviar el rango basado solo en jugadores
-        )
-        await send_personal_message(websocket, WebSocketMessage(type="answer_result", payload=result_payload))
+def _permuted_payload(payload: NewQuestionPayload, permutation: Tuple[int, ...]) -> NewQuestionPayload:
+    """
+    Payload con las opciones en el orden `permutation`.
 
-        logger.info(f"Game {game.game_code}: Player {player.nickname} answered Q{game.current_question_index+1} ({answer_id}) -> Correct: {is_correct}, Points: {points}, Total Score: {player.score}, Player Rank: {current_rank}")
+    Los IDs de las opciones no cambian: la respuesta del jugador se puntúa
+    igual (búsqueda O(1) por ID) y el cliente encuentra la opción correcta de
+    'answer_result' en su propia lista.
+    """
+    if permutation == tuple(range(len(permutation))):
+        return payload
+    return payload.model_copy(update={"options": [payload.options[i] for i in permutation]})
 
-    except ValidationError as e:
-        nick = player.nickname if player else "unknown connection"
-        logger.warning(f"Invalid submit_answer payload in game {game.game_code} from {nick}: {e}")
-        await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Datos de respuesta inválidos.")))
-    except Exception as e:
-        nick = player.nickname if player else "unknown connection"
-        logger.error(f"Error handling submit_answer for {nick} in {game.game_code}: {e}", exc_info=True)
-        try:
-            await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Error interno al procesar tu respuesta.")))
-        except Exception:
-            pass
+
+def _question_frames(game: Game, message_type: str, payload: NewQuestionPayload) -> List[EncodedMessage]:
+    """Un mensaje por orden de opciones, cada uno serializado una sola vez por codificación (ver `broadcast_views`)."""
+    return [EncodedMessage(WebSocketMessage(type=message_type, payload=_permuted_payload(payload, permutation)))
+            for permutation in _option_permutations(game, len(payload.options))]
+
+
+def _payload_for_player(game: Game, conn_id: int, payload: NewQuestionPayload) -> NewQuestionPayload:
+    """La pregunta tal como la ve un jugador concreto (para reenvíos individuales al reanudar sesión)."""
+    permutations = _option_permutations(game, len(payload.options))
+    return _permuted_payload(payload, permutations[game.connections.views[conn_id] % len(permutations)])
 
 
-async def handle_next_question(games_dict: Dict[str, Game], game: Game, websocket: WebSocket):
+async def run_answer_stats_ticker(game: Game, question_index: int):
+    """
+    Envía al host la distribución de respuestas de una pregunta mientras está abierta.
+
+    Como mucho ANSWER_STATS_RATE_HZ mensajes por segundo, y solo si llegaron
+    respuestas nuevas desde el último envío: el coste para el host es constante
+    sea cual sea el tamaño de la sala. Al cerrarse la pregunta se envía una
+    última actualización si quedaba alguna pendiente.
+
+    Args:
+        game: El objeto Game cuya pregunta se está mostrando.
+        question_index: Índice de la pregunta que cubre esta tarea.
+    """
+    interval = 1.0 / ANSWER_STATS_RATE_HZ
+    last_sent_count = 0
+    while True:
+        await asyncio.sleep(interval)
+        question_open = (game.state == GameStateEnum.QUESTION_DISPLAY and game.current_question_index == question_index)
+        if game.current_question_index != question_index or game.actor.closed:
+            return # Ya empezó otra pregunta (sus contadores no son los de esta) o la partida se cerró
+        if overload_controller.level >= LEVEL_PAUSE_BACKGROUND:
+            shed_total.inc("answer_stats") # Sobrecarga: pausado; al bajar de nivel el siguiente envío lleva los contadores acumulados
+        elif game.answered_count != last_sent_count:
+            last_sent_count = game.answered_count
+            host_websocket = game.connections.get(game.host_id)
+            if host_websocket is not None:
+                await send_personal_message(host_websocket, WebSocketMessage(type="answer_stats", payload=AnswerStatsPayload(
+                    question_number=question_index + 1,
+                    answered_count=game.answered_count,
+                    player_count=get_real_player_count(game),
+                    counts=game.answer_counts
+                )))
+        if not question_open:
+            return
+
+
+async def handle_submit_answers(game: Game, commands: List[GameCommand]):
+    """
+    Procesa un micro-lote de respuestas a la pregunta actual.
+
+    Las respuestas que llegan casi a la vez (misma ventana del actor) se
+    validan una a una y se puntúan con `calculate_points_batch` sobre el
+    timestamp de recepción de cada una (fijado en main.py al recibir el
+    mensaje, no al procesarlo), de modo que agruparlas no cambia los puntos
+    de nadie. El puesto de cada jugador sale del índice incremental
+    `game.ranking` (una búsqueda binaria por respuesta, sin ordenar la sala),
+    y todos los 'answer_result' se envían en una única pasada concurrente.
+
+    Args:
+        game: El objeto Game al que pertenecen las respuestas.
+        commands: Comandos 'submit_answer'; su payload es
+            (payload del mensaje, timestamp de recepción).
+    """
+    # Validaciones de estado
+    if game.state != GameStateEnum.QUESTION_DISPLAY:
+        logger.warning(f"{len(commands)} answer(s) received in wrong state ({game.state}) for game {game.game_code}. Ignoring.")
+        return
+    connections = game.connections
+    correct_answer_id = game.current_correct_answer_id
+    start_time = game.question_start_time
+    question_time_limit = 30 # Default value if fetching fails
+    if game.quiz_data and 0 <= game.current_question_index < len(game.quiz_data.questions):
+        question_time_limit = game.quiz_data.questions[game.current_question_index].time_limit
+    else:
+        logger.warning(f"Could not get specific time limit for Q{game.current_question_index} in {game.game_code}. Using default: {question_time_limit}s")
+
+    sends = []
+    if not correct_answer_id or start_time is None:
+        logger.error(f"Cannot process answers: Missing correct answer ID or question start time in game state for {game.game_code}.")
+        error_message = WebSocketMessage(type="error", payload=ErrorPayload(message="Error interno del servidor (pregunta no inicializada)."))
+        await asyncio.gather(*(send_personal_message(connections.get(command.conn_id), error_message)
+                               for command in commands if command.conn_id in game.players))
+        return
+
+    # 1. Validar cada respuesta y marcarla como recibida (columnas por conn_id)
+    accepted_ids: List[int] = []
+    answer_ids: List[str] = []
+    received_times: List[float] = []
+    for command in commands:
+        conn_id = command.conn_id
+        player = game.players.get(conn_id)
+        if not player:
+            logger.error(f"Received answer from unknown connection {conn_id} in game {game.game_code}. Ignoring.")
+            continue
+        payload_data, received_time = command.payload
+        if received_time < start_time:
+            # Enviada durante la pregunta anterior y encolada tras el cambio: no consume esta
+            logger.debug(f"Stale answer from {player.nickname} (received before Q{game.current_question_index + 1} started) in game {game.game_code}. Ignoring.")
+            continue
+        if connections.answered[conn_id]:
+            logger.warning(f"Player {player.nickname} tried to answer twice for question {game.current_question_index} in game {game.game_code}. Ignoring.")
+            continue
+        try:
+            payload = SubmitAnswerPayload(**payload_data)
+        except ValidationError as e:
+            logger.warning(f"Invalid submit_answer payload in game {game.game_code} from {player.nickname}: {e}")
+            sends.append(send_personal_message(connections.get(conn_id), WebSocketMessage(type="error", payload=ErrorPayload(message="Datos de respuesta inválidos."))))
+            continue
+        connections.answered[conn_id] = 1
+        connections.answer_times[conn_id] = received_time
+        accepted_ids.append(conn_id)
+        answer_ids.append(payload.answer_id)
+        received_times.append(received_time)
+
+    if accepted_ids:
+        # 2. Puntuar todo el lote en una pasada (cada respuesta con su propio timestamp)
+        points_if_correct = calculate_points_batch(start_time, received_times, question_time_limit)
+        scores = connections.scores
+        answer_counts = game.answer_counts
+        teams = game.teams
+        ranking = game.ranking
+        results = []
+        for conn_id, answer_id, received_time, points in zip(accepted_ids, answer_ids, received_times, points_if_correct):
+            is_correct = (answer_id == correct_answer_id)
+            if not is_correct:
+                points = 0
+            if points:
+                ranking.move(scores[conn_id], scores[conn_id] + points)
+                scores[conn_id] += points
+            player = game.players[conn_id]
+            if player.team_id is not None:
+                teams.add_points(player.team_id, points) # Agregado del equipo en O(1), sin recorrer a sus miembros
+            nickname = player.nickname
+            # model_construct: datos ya validados, sin coste de validación por respuesta
+            game.answers_received_this_round[nickname] = AnswerRecord.model_construct(
+                player_nickname=nickname, answer_id=answer_id, received_at=received_time,
+                score_awarded=points, is_correct=is_correct
+            )
+            game.answer_log.record(game.current_question_index, nickname, answer_id, is_correct,
+                                   points, int((received_time - start_time) * 1000))
+            # Contadores agregados para 'answer_stats' (O(1) por respuesta)
+            if answer_id in answer_counts:
+                answer_counts[answer_id] += 1
+            results.append((conn_id, nickname, answer_id, is_correct, points))
+        game.answered_count += len(accepted_ids)
+
+        # 3. Resultados personales: la respuesta correcta es común, el resto se empalma por jugador
+        result_message = PersonalizedMessage("answer_result", {"correct_answer_id": correct_answer_id},
+                                             ("is_correct", "points_awarded", "current_score", "current_rank"))
+        recipients = []
+        for conn_id, nickname, answer_id, is_correct, points in results:
+            current_rank = ranking.rank_of(scores[conn_id]) # Con el lote ya puntuado: búsqueda binaria, sin ordenar la sala
+            recipients.append((connections.get(conn_id), (is_correct, points, scores[conn_id], current_rank)))
+            if should_log(game.game_code, "submit_answer"):
+                logger.info("Game %s: Player %s answered Q%d (%s) -> Correct: %s, Points: %d, Total Score: %d, Player Rank: %d",
+                            game.game_code, nickname, game.current_question_index + 1, answer_id,
+                            is_correct, points, scores[conn_id], current_rank,
+                            extra={"game_code": game.game_code, "event": "submit_answer"})
+        sends.append(send_personalized(game, result_message, recipients))
+
+    if sends:
+        await asyncio.gather(*sends) # send_personal_message ya captura los errores de envío
+
+
+async def handle_next_question(games_dict: Dict[str, Game], game: Game, conn_id: int):
     """
     Maneja la solicitud del anfitrión para avanzar a la siguiente etapa.
 
@@ -581,10 +1263,11 @@ async def handle_next_question(games_dict: Dict[str, Game], game: Game, websocke
     Args:
         games_dict: El diccionario global de partidas activas (para llamadas).
         game: El objeto Game cuyo estado se intenta avanzar.
-        websocket: La conexión WebSocket del cliente que envió la solicitud (debe ser el host).
+        conn_id: ID de la conexión del cliente que envió la solicitud (debe ser el host).
     """
+    websocket = game.connections.get(conn_id)
     # Validación de Host
-    if game.host_connection != websocket:
+    if game.host_id != conn_id:
         await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Solo el anfitrión puede controlar el avance del juego.")))
         return
 
@@ -611,33 +1294,26 @@ async def handle_next_question(games_dict: Dict[str, Game], game: Game, websocke
 
 async def trigger_next_stage_after_delay(games_dict: Dict[str, Game], game: Game, delay: int = AUTO_ADVANCE_DELAY):
     """
-    Función auxiliar (tarea) que espera un tiempo y luego avanza el juego.
+    Función auxiliar (tarea) que espera un tiempo y luego pide avanzar el juego.
 
     Se programa para ejecutarse después de mostrar el marcador. Espera `delay`
-    segundos y luego llama a `advance_to_next_stage` para pasar a la
-    siguiente pregunta o finalizar el juego. Incluye una verificación para
-    asegurarse de que el juego todavía existe y está en el estado esperado
-    (`LEADERBOARD`) antes de proceder.
+    segundos y encola un comando 'auto_advance' en el actor de la partida. El
+    actor solo avanza si la partida sigue en el marcador de la misma pregunta
+    (el host pudo terminarla o avanzarla durante la espera), y nunca a la vez
+    que otro comando: un 'next_question' del host no puede saltarse preguntas.
 
     Args:
-        games_dict: El diccionario global de partidas activas (para verificación y llamadas).
+        games_dict: El diccionario global de partidas activas.
         game: El objeto Game que debe avanzar.
         delay: El número de segundos a esperar antes de avanzar.
     """
+    if _replaying(game):
+        return # El avance automático original está en el registro como comando
+    question_index = game.current_question_index
     logger.info(f"Game {game.game_code}: Auto-advance timer started ({delay}s delay) after showing leaderboard.")
     await asyncio.sleep(delay)
-
-    # Verificar si el juego aún existe y está en el estado correcto antes de avanzar
-    # Esto evita errores si el juego fue eliminado o el host lo terminó manually durante la espera.
-    # Usar get() para evitar KeyError si el juego ya no existe
-    current_game_state_obj = games_dict.get(game.game_code)
-    if current_game_state_obj and current_game_state_obj.state == GameStateEnum.LEADERBOARD:
-        logger.info(f"Game {game.game_code}: Auto-advance delay finished. Triggering next stage from LEADERBOARD.")
-        await advance_to_next_stage(games_dict, current_game_state_obj) # Llamar a la lógica principal de avance
-    else:
-        # Si el juego ya no existe o cambió de estado (ej: finalizado por host), cancelar el avance automático
-        current_state_val = current_game_state_obj.state.value if current_game_state_obj else 'N/A (Game Removed)'
-        logger.info(f"Game {game.game_code}: Auto-advance cancelled. Game no longer exists or state changed during delay (Current state: {current_state_val}).")
+    # Si la partida ya se eliminó, su actor está cerrado y el comando se descarta
+    submit_command(games_dict, game, CMD_AUTO_ADVANCE, payload=question_index)
 
 
 async def advance_to_next_stage(games_dict: Dict[str, Game], game: Game):
@@ -646,8 +1322,8 @@ async def advance_to_next_stage(games_dict: Dict[str, Game], game: Game):
 
     - Si estado es `QUESTION_DISPLAY`:
         - Cambia estado a `LEADERBOARD`.
-        - Calcula y envía marcador de jugadores reales (`update_scoreboard`).
-        - Programa `trigger_next_stage_after_delay`.
+        - Calcula y envía marcador de jugadores reales (`update_scoreboard`, ver `send_scoreboard`).
+        - Programa `trigger_next_stage_after_delay` (salvo en las salas de un torneo, que avanza `run_tournament`).
     - Si estado es `LEADERBOARD`:
         - Incrementa índice de pregunta.
         - Si hay más, llama a `send_current_question`.
@@ -665,13 +1341,21 @@ async def advance_to_next_stage(games_dict: Dict[str, Game], game: Game):
         game.state = GameStateEnum.LEADERBOARD
         # --- Calcular y enviar marcador SOLO de jugadores ---
         player_scoreboard = get_player_only_scoreboard(game)
-        await broadcast(games_dict, game.game_code, WebSocketMessage(
-            type="update_scoreboard",
-            payload=UpdateScoreboardPayload(scoreboard=player_scoreboard) # Enviar marcador filtrado
-        ))
-
-        logger.info(f"Game {game.game_code}: Scheduling auto-advance task from LEADERBOARD in {AUTO_ADVANCE_DELAY}s.")
-        asyncio.create_task(trigger_next_stage_after_delay(games_dict, game))
+        await send_scoreboard(game, player_scoreboard)
+        game.spectators.publish("update_scoreboard",
+                                UpdateScoreboardPayload(scoreboard=player_scoreboard[:SPECTATOR_LEADERBOARD_TOP_K],
+                                                        teams=get_team_scoreboard(game)),
+                                replaces=("new_question",))
+        if game.tournament is not None:
+            # El marcador ya está ordenado: es la lista que el torneo mezcla con las de las demás salas
+            game.tournament.update_room(game.game_code, [(entry.score, entry.nickname) for entry in player_scoreboard])
+        # Mientras se ve el marcador, la siguiente pregunta viaja oculta a todos los clientes
+        await prefetch_next_question(games_dict, game, game.current_question_index + 1)
+
+        if game.tournament is None:
+            logger.info(f"Game {game.game_code}: Scheduling auto-advance task from LEADERBOARD in {AUTO_ADVANCE_DELAY}s.")
+            asyncio.create_task(trigger_next_stage_after_delay(games_dict, game))
+        # Las salas de un torneo no tienen temporizador propio: las avanza a la vez run_tournament
 
     elif current_state == GameStateEnum.LEADERBOARD:
         # Transición: Marcador -> Siguiente Pregunta O Fin del Juego
@@ -694,10 +1378,46 @@ async def advance_to_next_stage(games_dict: Dict[str, Game], game: Game):
         logger.error(f"advance_to_next_stage called from unexpected state {current_state.value} in game {game.game_code}. No action taken.")
 
 
+async def send_scoreboard(game: Game, player_scoreboard: List[ScoreboardEntry]):
+    """
+    Envía 'update_scoreboard': el marcador completo al host y una ventana a cada jugador.
+
+    Cada jugador recibe los SCOREBOARD_WINDOW_TOP_K primeros (comunes a
+    todos, serializados una vez) más su propia puntuación y puesto, en lugar
+    del marcador completo: con N jugadores se envían O(N) entradas, no O(N²).
+    Con sobrecarga (LEVEL_TRIM_SCOREBOARD) el host también recibe solo los primeros.
+    Si hay equipos, todos reciben además la clasificación de equipos completa.
+    """
+    positions = {entry.nickname: (entry.score, entry.rank) for entry in player_scoreboard}
+    team_scoreboard = get_team_scoreboard(game)
+    shared = {"scoreboard": [entry.model_dump(mode="json") for entry in player_scoreboard[:SCOREBOARD_WINDOW_TOP_K]]}
+    if team_scoreboard is not None:
+        shared["teams"] = [entry.model_dump(mode="json") for entry in team_scoreboard]
+    window = PersonalizedMessage("update_scoreboard", shared, ("current_score", "current_rank"))
+    recipients = []
+    host_websocket = None
+    for conn_id, websocket in game.connections.iter_active():
+        if conn_id == game.host_id:
+            host_websocket = websocket
+            continue
+        player = game.players.get(conn_id)
+        if player:
+            recipients.append((websocket, positions.get(player.nickname, (None, None))))
+    sends = [send_personalized(game, window, recipients)]
+    if host_websocket is not None:
+        if overload_controller.level >= LEVEL_TRIM_SCOREBOARD:
+            shed_total.inc("scoreboard")
+            player_scoreboard = player_scoreboard[:SCOREBOARD_WINDOW_TOP_K] # Sobrecarga: el host también recibe solo los primeros
+        sends.append(send_personal_message(host_websocket, WebSocketMessage(
+            type="update_scoreboard", payload=UpdateScoreboardPayload(scoreboard=player_scoreboard, teams=team_scoreboard))))
+    await asyncio.gather(*sends)
+
+
 async def handle_game_over(games_dict: Dict[str, Game], game: Game):
     """
     Finaliza la partida, cambia estado a FINISHED, calcula rangos finales
-    (excluyendo host) y envía mensajes personalizados a cada jugador.
+    (excluyendo host) y envía mensajes personalizados a cada jugador
+    (el podio común más su puesto y puntuación, en paralelo).
     """
     if game.state == GameStateEnum.FINISHED:
         logger.warning(f"Game {game.game_code} is already in FINISHED state. Ignoring duplicate handle_game_over call.")
@@ -719,96 +1439,118 @@ async def handle_game_over(games_dict: Dict[str, Game], game: Game):
     # Obtener el podio (top 3) del marcador de solo jugadores
     podium = players_only_scoreboard_sorted[:3]
     logger.info(f"Calculated final player ranks for {game.game_code}. Podium: {[p.nickname for p in podium]}")
-
-    # Enviar mensajes personalizados a cada conexión activa
-    connections_to_notify = list(game.active_connections)
-    for websocket in connections_to_notify:
-        player = game.players.get(websocket)
-        is_host = (game.host_connection == websocket)
-
-        payload: Optional[GameOverPayload] = None
-
-        if player and not is_host: # Es un jugador real
+    team_scoreboard = get_team_scoreboard(game)
+    game.spectators.publish("game_over", GameOverPayload(podium=podium, teams=team_scoreboard), replaces=("new_question", "update_scoreboard"))
+
+    tournament = game.tournament
+    # El podio (y la clasificación de equipos) se serializa una vez; a cada jugador solo se le añaden sus puestos y puntuación
+    shared = {"podium": [entry.model_dump(mode="json") for entry in podium]}
+    personal_fields = ("my_final_rank", "my_final_score", "my_global_rank")
+    if team_scoreboard is not None:
+        shared["teams"] = [entry.model_dump(mode="json") for entry in team_scoreboard]
+        personal_fields += ("my_team_rank",)
+    game_over = PersonalizedMessage("game_over", shared, personal_fields)
+    teams = game.teams if team_scoreboard is not None else None
+    recipients = []
+    for conn_id, websocket in game.connections.iter_active():
+        player = game.players.get(conn_id)
+        if conn_id == game.host_id:
+            recipients.append((websocket, (None,) * len(personal_fields))) # Solo el podio para el host
+        elif player: # Es un jugador real
             player_nickname = player.nickname
-            my_rank = final_player_ranks.get(player_nickname)
-            my_score = final_player_scores.get(player_nickname)
-            payload = GameOverPayload(
-                podium=podium,
-                my_final_rank=my_rank,
-                my_final_score=my_score
+            values = (
+                final_player_ranks.get(player_nickname),
+                final_player_scores.get(player_nickname),
+                tournament.rank_of(game.game_code, player_nickname) if tournament is not None else None,
             )
-            logger.debug(f"Sending personalized game_over to player {player_nickname} in {game.game_code}. Rank: {my_rank}, Score: {my_score}")
-
-        elif is_host: # Es el host
-             payload = GameOverPayload(podium=podium) # Enviar solo el podio al host
-             logger.debug(f"Sending podium-only game_over to host in {game.game_code}.")
-
+            if teams is not None:
+                values += (teams.rank_of(player.team_id),)
+            recipients.append((websocket, values))
         else: # Conexión desconocida o ya desconectada?
              logger.warning(f"Skipping game_over message for a non-player/non-host connection in {game.game_code}")
+    logger.debug(f"Sending game_over to {len(recipients)} connection(s) in {game.game_code}.")
+    await send_personalized(game, game_over, recipients)
 
-        if payload:
-             await send_personal_message(websocket, WebSocketMessage(type="game_over", payload=payload))
 
-
-async def handle_disconnect(games_dict: Dict[str, Game], game_code: str, websocket: WebSocket):
+async def handle_disconnect(games_dict: Dict[str, Game], game_code: str, conn_id: int, allow_resume: bool = False):
     """
     Maneja la desconexión de un cliente WebSocket.
 
     Elimina al jugador/conexión. Si era el host, termina el juego. Si se va un
     jugador real, notifica a los demás con el nuevo contador de jugadores reales.
-    Si no quedan conexiones, elimina el juego.
+    Si la desconexión fue inesperada (`allow_resume`), el jugador se conserva en
+    forma compacta durante RESUME_GRACE_PERIOD segundos sin notificar a nadie,
+    para que pueda reanudar su sesión. Si no quedan conexiones, elimina el juego.
+
+    Es idempotente: el `conn_id` no se libera aquí sino en el bucle de
+    recepción de la conexión, así que una segunda llamada no encuentra nada.
 
     Args:
         games_dict: Diccionario global de partidas.
         game_code: Código de la partida.
-        websocket: Conexión desconectada.
+        conn_id: ID de la conexión desconectada.
+        allow_resume: Si es True, los jugadores reales pasan a periodo de gracia
+            en lugar de abandonar la partida.
     """
     game = games_dict.get(game_code)
     if not game:
         logger.debug(f"Disconnect event for an already removed or non-existent game {game_code}. No action needed.")
         return
 
-    logger.info(f"Handling disconnect for websocket in game {game_code}.")
+    logger.debug("Handling disconnect for connection %d in game %s.", conn_id, game_code)
 
-    # Remover de la lista de conexiones activas primero
-    if websocket in game.active_connections:
-        game.active_connections.remove(websocket)
-        logger.debug(f"Removed websocket from active_connections for game {game_code}. Remaining: {len(game.active_connections)}")
+    # Remover de la lista de fan-out primero
+    if game.connections.deactivate(conn_id):
+        logger.debug("Removed connection %d from fan-out list for game %s. Remaining: %d", conn_id, game_code, len(game.connections))
     else:
-        logger.debug(f"Websocket was not in active_connections list for game {game_code} upon disconnect.")
+        logger.debug("Connection %d was not in the fan-out list for game %s upon disconnect.", conn_id, game_code)
 
     disconnected_player: Optional[Player] = None
-    was_host = (game.host_connection == websocket)
+    was_host = (game.host_id == conn_id)
     was_real_player = False # Flag para saber si era jugador (no host)
     disconnected_nickname = "Unknown"
 
-    if websocket in game.players:
-        disconnected_player = game.players.pop(websocket, None)
+    if conn_id in game.players:
+        disconnected_player = game.players.pop(conn_id, None)
         if disconnected_player:
             disconnected_nickname = disconnected_player.nickname
-            logger.info(f"Player '{disconnected_nickname}' (was host: {was_host}) disconnected from game '{game.game_code}'. Players dict size: {len(game.players)}")
+            if was_host or should_log(game_code, "disconnect"):
+                logger.info("Player '%s' (was host: %s) disconnected from game '%s'. Players dict size: %d",
+                            disconnected_nickname, was_host, game.game_code, len(game.players),
+                            extra={"game_code": game_code, "event": "disconnect"})
             if not was_host: # Si no era el host, era un jugador real
                  was_real_player = True
         else:
-             logger.warning(f"Websocket was in game.players dict but pop returned None for game {game_code}")
+             logger.warning(f"Connection was in game.players dict but pop returned None for game {game_code}")
     else:
-         logger.debug(f"Websocket was not associated with any player in game {game_code} upon disconnect.")
+         logger.debug("Connection %d was not associated with any player in game %s upon disconnect.", conn_id, game_code)
+
+    if disconnected_player and disconnected_player.reconnect_token:
+        game.player_tokens.pop(disconnected_player.reconnect_token, None)
+        if was_real_player and allow_resume and game.state != GameStateEnum.FINISHED:
+            # Periodo de gracia: sin broadcast 'player_left' (se enviará solo si expira)
+            _detach_player(games_dict, game, disconnected_player)
+            was_real_player = False
+    if was_real_player:
+        # Abandona la partida: su puntuación deja de contar para los puestos y para el equipo (sin recorrer al resto)
+        game.ranking.remove(game.connections.scores[conn_id])
+        if disconnected_player.team_id is not None:
+            game.teams.remove_member(disconnected_player.team_id, game.connections.scores[conn_id])
 
     # Calcular nuevo contador de jugadores reales *después* de quitar al jugador (si se quitó)
     real_player_count = get_real_player_count(game)
 
     # Notificar a los demás si se fue un jugador real y el juego no ha terminado
     if was_real_player and game.state != GameStateEnum.FINISHED:
-        await broadcast(games_dict, game.game_code,
-                        WebSocketMessage(type="player_left",
-                                         payload=PlayerLeftPayload(nickname=disconnected_nickname, player_count=real_player_count)), # Enviar contador real
-                        exclude_connection=None) # Notificar a TODOS los restantes
+        await broadcast_lobby_update(games_dict, game,
+                                     WebSocketMessage(type="player_left",
+                                                      payload=PlayerLeftPayload(nickname=disconnected_nickname, player_count=real_player_count))) # Enviar contador real a TODOS los restantes
 
     # Lógica si el host se desconecta
     if was_host:
         host_nickname = disconnected_nickname if disconnected_player else "Host"
         logger.warning(f"Host '{host_nickname}' disconnected from game '{game.game_code}'.")
-        game.host_connection = None
+        game.host_id = None
 
         if game.state != GameStateEnum.FINISHED:
             logger.info(f"Ending game {game.game_code} because host disconnected.")
@@ -819,18 +1561,299 @@ async def handle_disconnect(games_dict: Dict[str, Game], game_code: str, websock
                 ))
             except Exception as send_error:
                 logger.error(f"Error broadcasting host disconnect message for {game_code}: {send_error}")
-            # Usar asyncio.create_task para no bloquear el handle_disconnect
-            asyncio.create_task(handle_game_over(games_dict, game))
+            # Dentro del actor: nada más puede modificar la partida mientras termina
+            await handle_game_over(games_dict, game)
         else:
              logger.info(f"Host disconnected from game {game.game_code} but game was already FINISHED.")
 
-    # Limpieza final del juego si ya no quedan conexiones activas
-    if not game.active_connections and game_code in games_dict:
+    # Limpieza final del juego si ya no quedan conexiones activas (ni jugadores en periodo de gracia)
+    _remove_game_if_empty(games_dict, game)
+
+
+def _remove_game_if_empty(games_dict: Dict[str, Game], game: Game):
+    """Elimina la partida de memoria si no le quedan conexiones ni jugadores en periodo de gracia."""
+    game_code = game.game_code
+    if not game.connections and not game.detached_players and game.detached_host is None and games_dict.get(game_code) is game:
         logger.info(f"Game '{game.game_code}' has no active connections remaining. Removing game object from memory.")
         del games_dict[game_code]
-        logger.info(f"Remaining active games: {list(games_dict.keys())}")
-    # Opcional: Podríamos remover el juego FINISHED antes si todos se desconectan
-    # elif game.state == GameStateEnum.FINISHED and not game.active_connections and game_code in games_dict:
-    #    logger.info(f"Finished game '{game.game_code}' has no active connections. Removing game object from memory.")
-    #    del games_dict[game_code]
-    #    logger.info(f"Remaining active games: {list(games_dict.keys())}")
+        game.actor.close() # Los comandos pendientes se descartan
+        if game.event_log is not None:
+            game.event_log.close()
+        if game.tournament is not None:
+            game.tournament.remove_room(game_code)
+        asyncio.create_task(game.spectators.close())
+        forget_game(game_code)
+        admission.forget_game(game_code)
+        logger.info("Remaining active games: %d", len(games_dict))
+
+
+def _detach_player(games_dict: Dict[str, Game], game: Game, player: Player):
+    """Guarda a un jugador desconectado en forma compacta y programa su expiración."""
+    connections = game.connections
+    answered_index = game.current_question_index if connections.answered[player.conn_id] else None
+    detached_at = _capture(game, time.time())
+    game.detached_players[player.reconnect_token] = DetachedPlayer(
+        nickname=player.nickname,
+        score=connections.scores[player.conn_id],
+        last_answer_time=connections.answer_times[player.conn_id] or None,
+        answered_question_index=answered_index,
+        detached_at=detached_at,
+        team_id=player.team_id
+    )
+    sessions_detached_total.inc()
+    # Un TimerHandle por jugador: mucho más barato que una tarea dormida
+    asyncio.get_running_loop().call_later(
+        RESUME_GRACE_PERIOD, _on_detached_expired, games_dict, game, player.reconnect_token, detached_at
+    )
+
+
+def _on_detached_expired(games_dict: Dict[str, Game], game: Game, token: str, detached_at: float):
+    """
+    Temporizador del periodo de gracia de una desconexión concreta (la de `detached_at`).
+
+    Quien reanuda conserva su token, así que si vuelve a caerse hay otro
+    temporizador en marcha para el mismo token: el de la desconexión anterior
+    no debe expirar la nueva antes de tiempo.
+    """
+    if _replaying(game):
+        return # La expiración original está en el registro como comando
+    if token == game.host_reconnect_token:
+        detached = game.detached_host
+    else:
+        detached = game.detached_players.get(token)
+    if detached is not None and detached.detached_at == detached_at:
+        submit_command(games_dict, game, CMD_EXPIRE_SESSION, payload=token)
+
+
+async def expire_detached_player(games_dict: Dict[str, Game], game: Game, token: str):
+    """
+    Elimina definitivamente a un jugador cuyo periodo de gracia terminó sin reanudar.
+
+    Ahora sí notifica 'player_left' al resto y elimina la partida si quedó vacía.
+    """
+    if token == game.host_reconnect_token:
+        await _expire_detached_host(games_dict, game)
+        return
+    detached = game.detached_players.pop(token, None)
+    if detached is None:
+        return # Reanudó la sesión a tiempo
+    sessions_expired_total.inc()
+    game.ranking.remove(detached.score)
+    if detached.team_id is not None:
+        game.teams.remove_member(detached.team_id, detached.score)
+    logger.info(f"Reconnect grace period expired for '{detached.nickname}' in game '{game.game_code}'.")
+    if game.state != GameStateEnum.FINISHED and game.connections:
+        await broadcast_lobby_update(games_dict, game, WebSocketMessage(
+            type="player_left",
+            payload=PlayerLeftPayload(nickname=detached.nickname, player_count=get_real_player_count(game))
+        ))
+    _remove_game_if_empty(games_dict, game)
+
+
+async def _expire_detached_host(games_dict: Dict[str, Game], game: Game):
+    """El host de una partida restaurada no volvió a tiempo: la partida termina como si se hubiera desconectado."""
+    nickname = game.detached_host.nickname if game.detached_host else "Host"
+    game.detached_host = None
+    game.host_reconnect_token = None
+    sessions_expired_total.inc()
+    logger.warning(f"Host '{nickname}' did not reconnect to restored game '{game.game_code}'. Ending game.")
+    if game.state != GameStateEnum.FINISHED:
+        await broadcast(games_dict, game.game_code, WebSocketMessage(
+            type="error",
+            payload=ErrorPayload(message="El anfitrión se ha desconectado. La partida terminará.", code="HOST_DISCONNECTED")
+        ))
+        await handle_game_over(games_dict, game)
+    _remove_game_if_empty(games_dict, game)
+
+
+# --- Reinicios del Servidor (ver snapshot.py) ---
+
+def resume_restored_game(games_dict: Dict[str, Game], game: Game):
+    """
+    Reprograma los temporizadores de una partida restaurada desde una instantánea.
+
+    Todos sus jugadores (y el host) están en periodo de gracia desde el
+    arranque. Si estaba en el marcador, se vuelve a programar el avance
+    automático (salvo en las salas de un torneo: las avanza su director, ver
+    `resume_restored_tournament`); si estaba mostrando una pregunta, el
+    envío de 'answer_stats'.
+    """
+    loop = asyncio.get_running_loop()
+    detached = [(token, player.detached_at) for token, player in game.detached_players.items()]
+    if game.host_reconnect_token and game.detached_host is not None:
+        detached.append((game.host_reconnect_token, game.detached_host.detached_at))
+    for token, detached_at in detached:
+        loop.call_later(RESUME_GRACE_PERIOD, _on_detached_expired, games_dict, game, token, detached_at)
+    if game.state == GameStateEnum.LEADERBOARD:
+        if game.tournament is None:
+            asyncio.create_task(trigger_next_stage_after_delay(games_dict, game))
+    elif game.state == GameStateEnum.QUESTION_DISPLAY:
+        asyncio.create_task(run_answer_stats_ticker(game, game.current_question_index))
+
+
+def resume_restored_tournament(games_dict: Dict[str, Game], tournament: Tournament):
+    """
+    Relanza el director de un torneo restaurado desde una instantánea.
+
+    Solo si ya había empezado y no había terminado: retoma la pregunta de sus
+    salas (la menos avanzada, por si el drenado llegó a mitad de un comando
+    del director). Uno que no había empezado sigue esperando a
+    POST /tournaments/{id}/start.
+    """
+    if not tournament.started or tournament.finished:
+        return
+    rooms = [games_dict[code] for code in tournament.game_codes if code in games_dict]
+    if not rooms:
+        tournament.finished = True # Todas sus salas habían terminado
+        return
+    resume_index = None # Alguna sala seguía en el lobby: el director vuelve a iniciarlas
+    if all(room.state != GameStateEnum.LOBBY for room in rooms):
+        resume_index = min(room.current_question_index for room in rooms)
+    logger.info(f"Tournament {tournament.tournament_id}: resuming director for {len(rooms)} restored rooms.")
+    tournament.task = asyncio.create_task(run_tournament(games_dict, tournament, rooms, resume_index))
+
+
+async def close_for_restart(game: Game, host_token: Optional[str], close_code: int):
+    """
+    Avisa a todas las conexiones de una partida de que el servidor se reinicia y las cierra.
+
+    Cada jugador recibe su propio token de reconexión (el host, `host_token`)
+    en 'server_restarting'; los clientes reanudan la sesión al volver el
+    servidor. Se llama después de cerrar el actor de la partida, así que las
+    desconexiones resultantes ya no modifican su estado.
+    """
+    connections = game.connections
+    sends = []
+    for conn_id, websocket in connections.iter_active():
+        player = game.players.get(conn_id)
+        token = host_token if conn_id == game.host_id else (player.reconnect_token if player else None)
+        message = WebSocketMessage(type="server_restarting", payload=ServerRestartingPayload(
+            message="El servidor se está reiniciando. Reconectando...", reconnect_token=token))
+        sends.append(_send_and_close(websocket, message, close_code))
+    await asyncio.gather(*sends)
+    await game.spectators.close(close_code) # watch.html vuelve a conectarse tras un reinicio
+
+
+async def _send_and_close(websocket: WebSocket, message: WebSocketMessage, close_code: int):
+    await send_personal_message(websocket, message)
+    try:
+        await close_connection(websocket, close_code)
+    except Exception:
+        pass
+
+
+# --- Torneos (ver tournament.py) ---
+
+def start_tournament(games_dict: Dict[str, Game], tournament: Tournament) -> List[str]:
+    """
+    Inicia a la vez todas las salas listas de un torneo y lanza su director.
+
+    Una sala está lista si sigue en LOBBY con al menos un jugador. Las que no
+    lo están quedan fuera del torneo. Si no hay ninguna, el torneo no empieza.
+
+    Returns:
+        Códigos de las salas iniciadas.
+    """
+    rooms = [
+        games_dict[code] for code in tournament.game_codes
+        if code in games_dict and games_dict[code].state == GameStateEnum.LOBBY and get_real_player_count(games_dict[code]) > 0
+    ]
+    if not rooms:
+        return []
+    tournament.started = True
+    tournament.game_codes = [room.game_code for room in rooms]
+    tournament.task = asyncio.create_task(run_tournament(games_dict, tournament, rooms))
+    return tournament.game_codes
+
+
+async def run_tournament(games_dict: Dict[str, Game], tournament: Tournament, rooms: List[Game],
+                         resume_index: Optional[int] = None):
+    """
+    Dirige las salas de un torneo en paralelo (tarea de fondo).
+
+    Inicia todas las salas a la vez y, para cada pregunta, espera su tiempo
+    límite (más TOURNAMENT_CLOSE_GRACE), la cierra en todas las salas con un
+    comando 'close_question', mezcla una sola vez sus marcadores en la
+    clasificación global y pide a cada sala que la envíe. Tras
+    AUTO_ADVANCE_DELAY, avanza todas las salas a la siguiente pregunta (o al
+    final) con el mismo comando 'auto_advance' de su temporizador, así que
+    siguen sincronizadas.
+
+    Con `resume_index` (torneo restaurado tras un reinicio) no inicia las
+    salas: retoma esa pregunta y la cierra cuando le tocaba según la hora de
+    inicio guardada en cada sala. Como 'close_question' y 'auto_advance'
+    comprueban el estado y la pregunta de la sala, las salas que ya la
+    habían cerrado o avanzado simplemente los ignoran.
+    """
+    try:
+        questions = rooms[0].quiz_data.questions if rooms[0].quiz_data else []
+        if resume_index is None:
+            logger.info(f"Tournament {tournament.tournament_id}: starting {len(rooms)} rooms.")
+            await asyncio.gather(*(submit_command(games_dict, room, CMD_START, wait=True) for room in rooms))
+            first_index = 0
+        else:
+            logger.info(f"Tournament {tournament.tournament_id}: resuming {len(rooms)} rooms at Q{resume_index + 1}.")
+            first_index = resume_index
+        for question_index in range(first_index, len(questions)):
+            question = questions[question_index]
+            close_delay = question.time_limit + TOURNAMENT_CLOSE_GRACE
+            if question_index == resume_index:
+                now = time.time()
+                close_delay = max((room.question_start_time + close_delay - now for room in rooms
+                                   if room.state == GameStateEnum.QUESTION_DISPLAY and room.current_question_index == question_index),
+                                  default=0.0)
+            await asyncio.sleep(max(0.0, close_delay))
+            rooms = [room for room in rooms if games_dict.get(room.game_code) is room]
+            if not rooms:
+                break # Todas las salas se vaciaron
+            await asyncio.gather(*(submit_command(games_dict, room, CMD_CLOSE_QUESTION, payload=question_index, wait=True)
+                                   for room in rooms))
+            tournament.merge(question_index)
+            logger.info(f"Tournament {tournament.tournament_id}: Q{question_index + 1} closed in {len(rooms)} rooms, "
+                        f"{tournament.player_count} players ranked.")
+            for room in rooms:
+                submit_command(games_dict, room, CMD_GLOBAL_LEADERBOARD, payload=question_index)
+            # Avanzar todas las salas a la vez (no tienen temporizador de avance propio, ver advance_to_next_stage)
+            await asyncio.sleep(AUTO_ADVANCE_DELAY)
+            await asyncio.gather(*(submit_command(games_dict, room, CMD_AUTO_ADVANCE, payload=question_index, wait=True)
+                                   for room in rooms))
+    except Exception as e:
+        logger.exception(f"Tournament {tournament.tournament_id} director failed: {e}")
+    finally:
+        tournament.finished = True
+
+
+async def send_global_leaderboard(games_dict: Dict[str, Game], game: Game, question_index: int):
+    """
+    Envía a una sala la clasificación global calculada tras una pregunta.
+
+    El top-K es el mismo mensaje para todas las salas (se construye una vez
+    por mezcla); cada jugador recibe además su puesto global ('global_rank'),
+    que es una consulta O(1) en el índice del torneo. 'global_rank' se
+    serializa una vez por sala y a cada jugador solo se le empalman su
+    puesto y su puntuación (`PersonalizedMessage`).
+    """
+    tournament = game.tournament
+    if tournament is None or tournament.question_index != question_index:
+        return # Ya hay una mezcla más reciente (o la sala no es de un torneo)
+    if tournament.top_message is None:
+        tournament.top_message = WebSocketMessage(type="global_leaderboard", payload=GlobalLeaderboardPayload(
+            tournament_id=tournament.tournament_id,
+            question_number=question_index + 1,
+            room_count=len(tournament.game_codes),
+            player_count=tournament.player_count,
+            top=[GlobalScoreboardEntry(rank=rank, nickname=nickname, score=score, game_code=code)
+                 for rank, nickname, score, code in tournament.top()]
+        ))
+    await broadcast(games_dict, game.game_code, tournament.top_message)
+    game.spectators.publish("global_leaderboard", tournament.top_message.payload)
+    scores = game.connections.scores
+    recipients = []
+    for conn_id, websocket in game.connections.iter_active():
+        player = game.players.get(conn_id)
+        rank = tournament.rank_of(game.game_code, player.nickname) if player is not None else None
+        if rank is not None:
+            recipients.append((websocket, (rank, scores[conn_id])))
+    if recipients:
+        rank_message = PersonalizedMessage("global_rank", {"player_count": tournament.player_count}, ("rank", "score"))
+        await send_personalized(game, rank_message, recipients)
@@ -0,0 +1,202 @@
+# heartbeat.py
+"""
+Detección rápida de conexiones muertas (portátiles cerrados, móviles en
+reposo...) mediante un único planificador de heartbeat por proceso.
+
+- Cada conexión WebSocket aceptada se registra con `register()`; cualquier
+  mensaje recibido la marca como viva con `touch()` (una asignación).
+- Una sola tarea recorre las conexiones por lotes y envía un 'ping' de
+  aplicación solo a las que llevan un intervalo sin dar señales. Los clientes
+  responden con 'pong'.
+- Si tras un ping no llega nada antes del plazo, la conexión se da por muerta:
+  se encola un 'disconnect' en el actor de su partida (con posibilidad de
+  reanudar la sesión) y se cierra en segundo plano.
+- El intervalo se adapta a la carga: crece con el número de conexiones (para
+  no superar un presupuesto de pings por segundo) y con el lag del bucle.
+  Los plazos de cada conexión llevan jitter para repartir los pings.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket, status
+
+from diagnostics import loop_monitor
+from game_actor import CMD_DISCONNECT
+from game_logic import submit_command
+from logging_setup import should_log
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+HEARTBEAT_MIN_INTERVAL = 15.0     # Segundos sin actividad antes de enviar un ping (con poca carga)
+HEARTBEAT_MAX_INTERVAL = 60.0     # Intervalo máximo aunque la carga sea muy alta
+HEARTBEAT_PING_BUDGET = 500.0     # Pings por segundo como máximo (en media) para todo el proceso
+HEARTBEAT_TIMEOUT = 10.0          # Segundos para responder a un ping antes de dar la conexión por muerta
+HEARTBEAT_TICK = 1.0              # Periodo de la tarea de planificación (con jitter)
+HEARTBEAT_JITTER = 0.2            # Variación aleatoria (+/-) aplicada a plazos y ticks
+HEARTBEAT_BATCH_SIZE = 500        # Conexiones revisadas antes de ceder el bucle de eventos
+HEARTBEAT_LAG_BACKOFF_MS = 100.0  # Con un lag medio del bucle mayor que esto, se duplica el intervalo
+CLOSE_TIMEOUT = 5.0               # Tiempo máximo esperando el cierre de una conexión muerta
+
+PING_FRAME = '{"type":"ping","payload":null}' # Serializado una sola vez
+
+
+class _Entry:
+    """Estado de heartbeat de una conexión."""
+    __slots__ = ("game_code", "conn_id", "last_seen", "next_ping_at", "ping_sent_at")
+
+    def __init__(self, game_code: str, conn_id: int, now: float, next_ping_at: float):
+        self.game_code = game_code
+        self.conn_id = conn_id
+        self.last_seen = now
+        self.next_ping_at = next_ping_at
+        self.ping_sent_at: Optional[float] = None
+
+
+class HeartbeatScheduler:
+    """Planificador de pings y plazos de respuesta para todas las conexiones del proceso."""
+
+    def __init__(self):
+        self._entries: Dict[WebSocket, _Entry] = {}
+        self._games_dict: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.interval = HEARTBEAT_MIN_INTERVAL
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, games_dict: Dict[str, Any]):
+        """Arranca la tarea de heartbeat (idempotente). `games_dict` es el registro de partidas."""
+        self._games_dict = games_dict
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Heartbeat scheduler started (interval %.0fs, timeout %.0fs).", self.interval, HEARTBEAT_TIMEOUT)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def register(self, websocket: WebSocket, game_code: str, conn_id: int):
+        now = time.monotonic()
+        self._entries[websocket] = _Entry(game_code, conn_id, now, now + self._jittered(self.interval))
+
+    def unregister(self, websocket: WebSocket):
+        self._entries.pop(websocket, None)
+
+    def touch(self, websocket: WebSocket):
+        """Marca la conexión como viva. Se llama con cada mensaje recibido."""
+        entry = self._entries.get(websocket)
+        if entry is not None:
+            entry.last_seen = time.monotonic()
+            entry.ping_sent_at = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_s": round(self.interval, 1),
+            "timeout_s": HEARTBEAT_TIMEOUT,
+            "tracked_connections": len(self._entries),
+            "awaiting_pong": sum(1 for entry in self._entries.values() if entry.ping_sent_at is not None),
+        }
+
+    # --- Internos ---
+
+    @staticmethod
+    def _jittered(value: float) -> float:
+        return value * random.uniform(1.0 - HEARTBEAT_JITTER, 1.0 + HEARTBEAT_JITTER)
+
+    def _adapt_interval(self):
+        # Repartir los pings para no superar el presupuesto por segundo
+        interval = max(HEARTBEAT_MIN_INTERVAL, len(self._entries) / HEARTBEAT_PING_BUDGET)
+        if loop_monitor.running and loop_monitor.avg_lag_ms > HEARTBEAT_LAG_BACKOFF_MS:
+            interval *= 2 # Bucle saturado: menos trabajo de fondo
+        self.interval = min(HEARTBEAT_MAX_INTERVAL, interval)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._jittered(HEARTBEAT_TICK))
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Heartbeat tick failed")
+
+    async def _tick(self):
+        self._adapt_interval()
+        now = time.monotonic()
+        to_ping = []
+        dead = []
+        # Copia de las claves: el diccionario cambia mientras se cede el bucle
+        for index, websocket in enumerate(list(self._entries)):
+            entry = self._entries.get(websocket)
+            if entry is None:
+                continue
+            if entry.ping_sent_at is not None:
+                if now - entry.ping_sent_at > HEARTBEAT_TIMEOUT:
+                    dead.append((websocket, entry))
+            elif now >= entry.next_ping_at and now - entry.last_seen >= self.interval:
+                entry.ping_sent_at = now
+                entry.next_ping_at = now + self._jittered(self.interval)
+                to_ping.append(websocket)
+            elif now >= entry.next_ping_at:
+                # Hubo actividad reciente: no hace falta ping, reprogramar desde la última señal
+                entry.next_ping_at = entry.last_seen + self._jittered(self.interval)
+            if len(to_ping) >= HEARTBEAT_BATCH_SIZE:
+                await self._send_pings(to_ping)
+                to_ping = []
+            elif index % HEARTBEAT_BATCH_SIZE == HEARTBEAT_BATCH_SIZE - 1:
+                await asyncio.sleep(0)
+        if to_ping:
+            await self._send_pings(to_ping)
+        for websocket, entry in dead:
+            await self._expire(websocket, entry)
+
+    async def _send_pings(self, websockets):
+        pings_sent_total.inc(amount=len(websockets))
+        # Los fallos de envío se ignoran: la conexión se detectará por el plazo
+        await asyncio.gather(*(websocket.send_text(PING_FRAME) for websocket in websockets), return_exceptions=True)
+
+    async def _expire(self, websocket: WebSocket, entry: _Entry):
+        if self._entries.get(websocket) is not entry or entry.ping_sent_at is None:
+            return # Se desregistró o respondió mientras tanto
+        del self._entries[websocket]
+        timeouts_total.inc()
+        if should_log(entry.game_code, "heartbeat_timeout"):
+            logger.info("Heartbeat timeout: no pong for %.0fs in game %s. Dropping connection.",
+                        time.monotonic() - entry.ping_sent_at, entry.game_code,
+                        extra={"game_code": entry.game_code, "event": "heartbeat_timeout"})
+        game = self._games_dict.get(entry.game_code)
+        if game is not None:
+            # handle_disconnect es idempotente: el bucle de recepción de main.py
+            # encolará otro 'disconnect' cuando la conexión termine de cerrarse.
+            submit_command(self._games_dict, game, CMD_DISCONNECT, entry.conn_id, True)
+        asyncio.create_task(self._close(websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=status.WS_1001_GOING_AWAY), CLOSE_TIMEOUT)
+        except Exception:
+            pass
+
+
+heartbeat_scheduler = HeartbeatScheduler()
+
+# --- Métricas ---
+pings_sent_total = Counter("quiz_heartbeat_pings_total", "Pings de heartbeat enviados")
+timeouts_total = Counter("quiz_heartbeat_timeouts_total", "Conexiones cerradas por no responder al heartbeat")
+Gauge("quiz_heartbeat_interval_seconds", "Intervalo de inactividad actual antes de enviar un ping",
+      callback=lambda: {(): heartbeat_scheduler.interval})
+Gauge("quiz_heartbeat_tracked_connections", "Conexiones WebSocket vigiladas por el heartbeat",
+      callback=lambda: {(): float(len(heartbeat_scheduler))})
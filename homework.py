@@ -0,0 +1,289 @@
+# homework.py
+"""
+Tareas (modo "a tu ritmo"): un quiz que cada alumno hace cuando quiere
+antes de una fecha límite, sin host y sin WebSocket por jugador.
+
+Cada alumno se inscribe una vez y recibe un token; después pide su pregunta
+actual y envía su respuesta con peticiones HTTP cortas (ver los endpoints
+`/assignments` de main.py). Entre petición y petición no queda nada abierto,
+así que miles de alumnos repartidos en varios días no ocupan sockets.
+
+El estado por alumno es compacto y vive en columnas indexadas por su ID
+(posición de inscripción), como `ConnectionRegistry`:
+
+- `question_index`: pregunta por la que va.
+- `question_started`: cuándo vio esa pregunta (0.0 = aún no la ha pedido).
+  Es el inicio que usa `calculate_points`, así que la puntuación por rapidez
+  es la misma que en una partida en directo.
+- `scores`: puntuación acumulada.
+
+El token no se guarda: es el ID del alumno firmado con HMAC con un secreto de
+la tarea. El marcador se mantiene de forma incremental en un array ordenado
+de claves enteras (puntuación y ID en un solo entero); cada respuesta
+correcta mueve una sola clave con búsqueda binaria, y el puesto de un alumno
+es la posición de su clave. Con 100.000 alumnos el estado completo ocupa unos
+pocos MB (más el registro de respuestas para exportar resultados).
+"""
+import bisect
+import hashlib
+import hmac
+import secrets
+import time
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from game_logic import OPTION_PERMUTATIONS, calculate_points
+from media import media_url
+from models import AnswerResultPayload, NewQuestionPayload, Option, QuizData, ScoreboardEntry
+from results import AnswerLog
+
+# --- Constantes de Configuración ---
+HOMEWORK_MAX_PLAYERS = 200_000 # Alumnos como máximo por tarea
+HOMEWORK_TOP_K = 10 # Entradas del marcador que devuelve GET /assignments/{id}/leaderboard por defecto
+
+_PLAYER_ID_SPAN = 1 << 24 # Las claves del marcador son -puntuación * _PLAYER_ID_SPAN + ID (ID < 2^24)
+
+
+class _HomeworkQuestion(NamedTuple):
+    payloads: Tuple[NewQuestionPayload, ...] # Lo que recibe el alumno (sin la respuesta correcta), uno por orden de opciones
+    correct_answer_id: str
+    time_limit: int
+
+
+class HomeworkError(Exception):
+    """Petición no válida en el estado actual de la tarea (el mensaje es para el alumno)."""
+
+
+class HomeworkAssignment:
+    """Una tarea: quiz común, alumnos inscritos con su progreso y marcador incremental."""
+
+    def __init__(self, assignment_id: str, quiz: QuizData, closes_at: float):
+        self.assignment_id = assignment_id
+        self.title = quiz.title
+        self.created_at = time.time()
+        self.closes_at = closes_at
+        self._secret = secrets.token_bytes(16) # Firma de los tokens de los alumnos
+        self._questions = _prepare_questions(quiz)
+        self.answer_log = AnswerLog() # Mismo registro que las partidas en directo (exportación de resultados)
+        for index, question in enumerate(self._questions):
+            self.answer_log.begin_question(index, question.payloads[0].question_text, question.payloads[0].options)
+        self._nicknames: List[str] = []            # ID de alumno -> nickname
+        self._nickname_ids: Dict[str, int] = {}    # nickname en minúsculas -> ID (nicknames únicos)
+        # Columnas por alumno, indexadas por ID
+        self.question_index = array("H")           # Pregunta por la que va (== nº de preguntas si terminó)
+        self.question_started = array("d")         # Cuándo vio la pregunta actual (0.0 = aún no)
+        self.scores = array("q")                   # Puntuación acumulada
+        self._ranking = array("q")                 # Claves del marcador, ordenadas (ver _rank_key)
+        self.finished_count = 0
+
+    @property
+    def player_count(self) -> int:
+        return len(self._nicknames)
+
+    @property
+    def question_count(self) -> int:
+        return len(self._questions)
+
+    def is_open(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else time.time()) < self.closes_at
+
+    # --- Alumnos ---
+
+    def enroll(self, nickname: str) -> Tuple[int, str]:
+        """
+        Inscribe a un alumno.
+
+        Returns:
+            (ID del alumno, token para las siguientes peticiones).
+
+        Raises:
+            HomeworkError: Si la tarea está cerrada o llena, o el nickname ya está en uso.
+        """
+        nickname = nickname.strip()
+        if not nickname:
+            raise HomeworkError("El nickname no puede estar vacío.")
+        if not self.is_open():
+            raise HomeworkError("La tarea ya está cerrada.")
+        if len(self._nicknames) >= HOMEWORK_MAX_PLAYERS:
+            raise HomeworkError("La tarea está completa.")
+        key = nickname.lower()
+        if key in self._nickname_ids:
+            raise HomeworkError("El nickname ya está en uso.")
+        player_id = len(self._nicknames)
+        self._nicknames.append(nickname)
+        self._nickname_ids[key] = player_id
+        self.question_index.append(0)
+        self.question_started.append(0.0)
+        self.scores.append(0)
+        self._ranking.append(_rank_key(0, player_id)) # Puntuación 0 y el ID más alto: siempre va al final
+        return player_id, self._sign(player_id)
+
+    def player_from_token(self, token: Optional[str]) -> Optional[int]:
+        """ID del alumno de un token de esta tarea, o None si no es válido."""
+        if not token:
+            return None
+        player_id_text, _, _ = token.partition(".")
+        if not player_id_text.isdigit():
+            return None
+        player_id = int(player_id_text)
+        if player_id >= len(self._nicknames) or not hmac.compare_digest(token, self._sign(player_id)):
+            return None
+        return player_id
+
+    def nickname(self, player_id: int) -> str:
+        return self._nicknames[player_id]
+
+    # --- Preguntas y respuestas ---
+
+    def current_question(self, player_id: int, now: float) -> Tuple[Optional[NewQuestionPayload], Optional[float]]:
+        """
+        Pregunta actual del alumno y segundos que le quedan.
+
+        La primera vez que la pide empieza a contar su tiempo; pedirla de nuevo
+        (recargar la página) no lo reinicia. Las opciones llegan en el orden
+        que toca a su ID (alumnos consecutivos ven órdenes distintos).
+
+        Returns:
+            (pregunta, tiempo restante), o (None, None) si ya terminó.
+        """
+        index = self.question_index[player_id]
+        if index >= len(self._questions):
+            return None, None
+        question = self._questions[index]
+        started = self.question_started[player_id]
+        if started == 0.0:
+            if not self.is_open(now):
+                raise HomeworkError("La tarea ya está cerrada.")
+            started = self.question_started[player_id] = now
+        payload = question.payloads[player_id % len(question.payloads)]
+        return payload, max(0.0, started + question.time_limit - now)
+
+    def submit_answer(self, player_id: int, answer_id: str, answer_time: float) -> AnswerResultPayload:
+        """
+        Puntúa la respuesta del alumno a su pregunta actual y pasa a la siguiente.
+
+        Una respuesta fuera de tiempo se acepta con 0 puntos (como en directo),
+        así el alumno puede seguir con la tarea.
+
+        Raises:
+            HomeworkError: Si la tarea está cerrada o el alumno no ha pedido aún la pregunta.
+        """
+        if not self.is_open(answer_time):
+            raise HomeworkError("La tarea ya está cerrada.")
+        index = self.question_index[player_id]
+        started = self.question_started[player_id]
+        if index >= len(self._questions):
+            raise HomeworkError("Ya has terminado la tarea.")
+        if started == 0.0:
+            raise HomeworkError("Pide primero la pregunta.")
+        question = self._questions[index]
+        is_correct = answer_id == question.correct_answer_id
+        points = calculate_points(started, answer_time, question.time_limit) if is_correct else 0
+        if points:
+            self._move_in_ranking(player_id, self.scores[player_id] + points)
+        self.answer_log.record(index, self._nicknames[player_id], answer_id, is_correct, points,
+                               int((answer_time - started) * 1000))
+        self.question_index[player_id] = index + 1
+        self.question_started[player_id] = 0.0
+        if index + 1 == len(self._questions):
+            self.finished_count += 1
+        return AnswerResultPayload(
+            is_correct=is_correct,
+            correct_answer_id=question.correct_answer_id,
+            points_awarded=points,
+            current_score=self.scores[player_id],
+            current_rank=self.rank_of(player_id),
+        )
+
+    # --- Marcador ---
+
+    def _move_in_ranking(self, player_id: int, new_score: int):
+        """Sube la puntuación de un alumno moviendo su clave en el marcador ordenado."""
+        ranking = self._ranking
+        old_position = bisect.bisect_left(ranking, _rank_key(self.scores[player_id], player_id))
+        key = _rank_key(new_score, player_id)
+        new_position = bisect.bisect_left(ranking, key, 0, old_position)
+        # La puntuación solo sube: se desplaza un hueco el tramo intermedio (una sola copia de memoria)
+        ranking[new_position + 1:old_position + 1] = ranking[new_position:old_position]
+        ranking[new_position] = key
+        self.scores[player_id] = new_score
+
+    def rank_of(self, player_id: int) -> int:
+        """Puesto del alumno (1 es el primero; los empates, por orden de inscripción)."""
+        return bisect.bisect_left(self._ranking, _rank_key(self.scores[player_id], player_id)) + 1
+
+    def top(self, count: int = HOMEWORK_TOP_K) -> List[ScoreboardEntry]:
+        """Los `count` primeros del marcador."""
+        return [
+            ScoreboardEntry(rank=rank, nickname=self._nicknames[key % _PLAYER_ID_SPAN], score=-(key // _PLAYER_ID_SPAN))
+            for rank, key in enumerate(self._ranking[:count], start=1)
+        ]
+
+    def final_ranks(self) -> Dict[str, Tuple[int, int]]:
+        """nickname -> (puesto, puntuación) de todos los alumnos (para la exportación de resultados)."""
+        return {
+            self._nicknames[key % _PLAYER_ID_SPAN]: (rank, -(key // _PLAYER_ID_SPAN))
+            for rank, key in enumerate(self._ranking, start=1)
+        }
+
+    def snapshot(self) -> dict:
+        """Estado de la tarea para el endpoint de administración."""
+        return {
+            "assignment_id": self.assignment_id,
+            "title": self.title,
+            "question_count": len(self._questions),
+            "closes_at": self.closes_at,
+            "open": self.is_open(),
+            "player_count": len(self._nicknames),
+            "finished_count": self.finished_count,
+            "answer_count": len(self.answer_log),
+            "top": [entry.model_dump() for entry in self.top()],
+        }
+
+    def _sign(self, player_id: int) -> str:
+        digest = hmac.new(self._secret, f"{self.assignment_id}:{player_id}".encode(), hashlib.sha256).hexdigest()
+        return f"{player_id}.{digest[:24]}"
+
+
+def _rank_key(score: int, player_id: int) -> int:
+    """Clave entera del marcador: ordena por puntuación descendente y, a igualdad, por ID."""
+    return -score * _PLAYER_ID_SPAN + player_id
+
+
+def _prepare_questions(quiz: QuizData) -> List[_HomeworkQuestion]:
+    """
+    Prepara una vez las preguntas de la tarea (opciones con ID en cada orden, respuesta correcta).
+
+    Raises:
+        HomeworkError: Si alguna pregunta no tiene respuesta correcta o el quiz está vacío.
+    """
+    if not quiz.questions:
+        raise HomeworkError("El cuestionario no tiene preguntas.")
+    prepared = []
+    total = len(quiz.questions)
+    for number, question in enumerate(quiz.questions, start=1):
+        options = []
+        correct_id = None
+        for option_data in question.options:
+            option_id = option_data.id or f"opt_{number}_{len(options)}"
+            options.append(Option(id=option_id, text=option_data.text))
+            if option_data.is_correct and correct_id is None:
+                correct_id = option_id
+        if correct_id is None:
+            raise HomeworkError(f"La pregunta {number} no tiene respuesta correcta.")
+        payload = NewQuestionPayload(
+            question_id=question.id or f"q_{number}",
+            question_text=question.text,
+            options=options,
+            time_limit=question.time_limit,
+            question_number=number,
+            total_questions=total,
+            media_url=media_url(question.media_id) if question.media_id else None,
+        )
+        permutations = (OPTION_PERMUTATIONS.get(len(options)) if quiz.shuffle_options else None) or (tuple(range(len(options))),)
+        prepared.append(_HomeworkQuestion(
+            payloads=tuple(payload.model_copy(update={"options": [options[i] for i in permutation]}) for permutation in permutations),
+            correct_answer_id=correct_id,
+            time_limit=question.time_limit,
+        ))
+    return prepared
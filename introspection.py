@@ -0,0 +1,147 @@
+# introspection.py
+"""
+Vistas de administración de las partidas activas (`GET /games` y
+`GET /games/{game_code}`, ver main.py).
+
+Todo sale de contadores que la partida ya mantiene de forma incremental
+(tamaño de `players`, de la lista de fan-out, de la cola del actor,
+`answered_count`, `connections.outbound_pending`...): ninguna petición
+recorre los jugadores de todas las partidas. El listado solo lee unos pocos
+atributos por partida y cede el bucle de eventos cada GAMES_SCAN_BATCH
+partidas; la vista detallada devuelve los jugadores paginados. Así se puede
+consultar con frecuencia durante un evento grande sin picos de latencia
+para los jugadores.
+"""
+import asyncio
+import time
+from itertools import islice
+from typing import Dict, Optional
+
+from models import Game, GameDetail, GamePage, GamePlayerInfo, GameStateEnum, GameSummary
+
+# --- Constantes de Configuración ---
+GAMES_PAGE_DEFAULT = 50        # Partidas por página por defecto
+GAMES_PAGE_MAX = 500           # Partidas por página como máximo
+GAME_PLAYERS_PAGE_DEFAULT = 100 # Jugadores por página en la vista detallada por defecto
+GAME_PLAYERS_PAGE_MAX = 1000   # Jugadores por página como máximo
+GAMES_SCAN_BATCH = 1000        # Partidas filtradas antes de ceder el bucle de eventos
+
+
+def game_summary(game: Game, now: float) -> GameSummary:
+    """Resumen O(1) de una partida."""
+    return GameSummary(**_summary_fields(game, now))
+
+
+def _summary_fields(game: Game, now: float) -> dict:
+    quiz = game.quiz_data
+    started = game.current_question_index >= 0 and game.state != GameStateEnum.LOBBY
+    return {
+        "game_code": game.game_code,
+        "state": game.state,
+        "quiz_title": quiz.title if quiz else None,
+        "player_count": _real_player_count(game),
+        "connected_count": len(game.connections),
+        "detached_count": len(game.detached_players),
+        "spectator_count": len(game.spectators),
+        "question_number": game.current_question_index + 1 if started else None,
+        "total_questions": len(quiz.questions) if quiz else None,
+        "answered_count": game.answered_count,
+        "age_seconds": round(now - game.created_at, 3),
+        "tournament_id": game.tournament.tournament_id if game.tournament is not None else None,
+    }
+
+
+def _real_player_count(game: Game) -> int:
+    return len(game.players) - (1 if game.host_id in game.players else 0)
+
+
+def _matches(game: Game, now: float, state: Optional[GameStateEnum], min_players: Optional[int],
+             max_players: Optional[int], min_age: Optional[float], max_age: Optional[float], quiz: Optional[str]) -> bool:
+    if state is not None and game.state != state:
+        return False
+    if min_players is not None or max_players is not None:
+        players = _real_player_count(game)
+        if (min_players is not None and players < min_players) or (max_players is not None and players > max_players):
+            return False
+    if min_age is not None or max_age is not None:
+        age = now - game.created_at
+        if (min_age is not None and age < min_age) or (max_age is not None and age > max_age):
+            return False
+    if quiz is not None and (game.quiz_data is None or quiz not in game.quiz_data.title.lower()):
+        return False
+    return True
+
+
+async def list_games(games_dict: Dict[str, Game], offset: int = 0, limit: int = GAMES_PAGE_DEFAULT,
+                     state: Optional[GameStateEnum] = None, min_players: Optional[int] = None,
+                     max_players: Optional[int] = None, min_age: Optional[float] = None,
+                     max_age: Optional[float] = None, quiz: Optional[str] = None) -> GamePage:
+    """
+    Una página de las partidas activas que cumplen los filtros, por orden de creación.
+
+    Args:
+        games_dict: El diccionario global de partidas activas.
+        offset: Partidas a saltar (entre las que cumplen los filtros).
+        limit: Tamaño de la página.
+        state: Solo partidas en este estado.
+        min_players, max_players: Rango de jugadores reales (sin host).
+        min_age, max_age: Rango de antigüedad en segundos.
+        quiz: Texto que debe aparecer en el título del cuestionario (sin distinguir mayúsculas).
+    """
+    now = time.time()
+    quiz = quiz.lower() if quiz else None
+    total = 0
+    page = []
+    # Copia de los valores: el diccionario cambia mientras se cede el bucle
+    for index, game in enumerate(list(games_dict.values()), start=1):
+        if _matches(game, now, state, min_players, max_players, min_age, max_age, quiz):
+            if offset <= total < offset + limit:
+                page.append(game_summary(game, now))
+            total += 1
+        if index % GAMES_SCAN_BATCH == 0:
+            await asyncio.sleep(0)
+    return GamePage(total=total, offset=offset, limit=limit, games=page)
+
+
+def game_detail(game: Game, players_offset: int = 0, players_limit: int = GAME_PLAYERS_PAGE_DEFAULT) -> GameDetail:
+    """
+    Vista detallada de una partida: resumen, temporizadores, colas y una página de jugadores.
+
+    El coste es O(players_offset + players_limit), no O(jugadores).
+    """
+    now = time.time()
+    connections = game.connections
+    question_time_limit = None
+    question_time_remaining = None
+    if game.quiz_data and 0 <= game.current_question_index < len(game.quiz_data.questions):
+        question_time_limit = game.quiz_data.questions[game.current_question_index].time_limit
+        if game.state == GameStateEnum.QUESTION_DISPLAY and game.question_start_time is not None:
+            remaining = game.question_start_time + question_time_limit - now
+            question_time_remaining = round(max(0.0, min(float(question_time_limit), remaining)), 3)
+    # Se recorta antes de construir nada: solo se crean los modelos de la página
+    connected_count = len(game.players)
+    teams = game.teams
+    players = [
+        GamePlayerInfo(nickname=player.nickname, score=connections.scores[conn_id], connected=True,
+                       answered=bool(connections.answered[conn_id]), is_host=(conn_id == game.host_id),
+                       team=teams.name(player.team_id) if player.team_id is not None else None)
+        for conn_id, player in islice(game.players.items(), players_offset, players_offset + players_limit)
+    ]
+    detached_start = max(0, players_offset - connected_count)
+    players.extend(
+        GamePlayerInfo(nickname=player.nickname, score=player.score, connected=False,
+                       answered=player.answered_question_index == game.current_question_index,
+                       team=teams.name(player.team_id) if player.team_id is not None else None)
+        for player in islice(game.detached_players.values(), detached_start, detached_start + players_limit - len(players))
+    )
+    return GameDetail(
+        **_summary_fields(game, now),
+        question_started_at=game.question_start_time,
+        question_time_limit=question_time_limit,
+        question_time_remaining=question_time_remaining,
+        actor_queue_depth=len(game.actor),
+        actor_last_queue_delay_ms=round(game.actor.last_queue_delay_ms, 3),
+        outbound_pending=connections.outbound_pending,
+        players_offset=players_offset,
+        players=players,
+    )
@@ -133,6 +133,7 @@ function addQuestionBlock(questionData = null) {
          questionTextInput.value = questionData.text || '';
          // questionTimeInput.value ya se estableció arriba
          questionBlock.dataset.id = questionData.id || '';
+         setQuestionImage(questionBlock, questionData.media_id || null);
 
          if (questionData.options && Array.isArray(questionData.options) && questionData.options.length >= 2) {
             questionData.options.forEach(opt => addOptionBlock(optionsCont, radioGroupName, opt));
@@ -150,6 +151,46 @@ function addQuestionBlock(questionData = null) {
      updateMoveButtonStates();
  }
 
+ // Muestra (o quita) la imagen de una pregunta en el editor. El ID es el que devolvió POST /media.
+ function setQuestionImage(questionBlock, mediaId) {
+     const preview = questionBlock.querySelector('.question-image-preview');
+     const removeBtn = questionBlock.querySelector('.remove-question-image-btn');
+     if (mediaId) {
+         questionBlock.dataset.mediaId = mediaId;
+         if (preview) { preview.src = `/media/${mediaId}`; preview.style.display = 'block'; }
+         if (removeBtn) removeBtn.style.display = '';
+     } else {
+         delete questionBlock.dataset.mediaId;
+         if (preview) { preview.removeAttribute('src'); preview.style.display = 'none'; }
+         if (removeBtn) removeBtn.style.display = 'none';
+     }
+ }
+
+ // Sube la imagen elegida (cuerpo binario, sin multipart) y la asocia a la pregunta
+ async function uploadQuestionImage(questionBlock, fileInput) {
+     const file = fileInput.files && fileInput.files[0];
+     if (!file) return;
+     fileInput.disabled = true;
+     try {
+         const response = await fetch('/media', {
+             method: 'POST',
+             headers: { 'Content-Type': file.type || 'application/octet-stream' },
+             body: file
+         });
+         const data = await response.json().catch(() => ({}));
+         if (!response.ok) {
+             throw new Error(data.detail || `Error ${response.status}`);
+         }
+         setQuestionImage(questionBlock, data.media_id);
+     } catch (error) {
+         console.error("Image upload failed:", error);
+         showInfoModal(`No se pudo subir la imagen: ${error.message}`, "Error al Subir Imagen");
+     } finally {
+         fileInput.value = '';
+         fileInput.disabled = false;
+     }
+ }
+
  function addOptionBlock(optionsContainer, radioGroupName, optionData = null) {
      optionTemplate = optionTemplate || document.getElementById('option-template');
      if (!optionTemplate) return;
@@ -323,6 +364,7 @@ function addQuestionBlock(questionData = null) {
                  id: questionId,
                  text: questionText,
                  time_limit: questionTime, // Guardar el tiempo de esta pregunta
+                 media_id: qb.dataset.mediaId || null,
                  options: optionsData
              });
          });
@@ -631,6 +673,7 @@ function handleDefaultTimeChange(event) {
              const deleteQuestionButton = e.target.closest('.delete-question-btn');
              const moveUpButton = e.target.closest('.move-question-up-btn');
              const moveDownButton = e.target.closest('.move-question-down-btn');
+             const removeImageButton = e.target.closest('.remove-question-image-btn');
              const questionBlock = e.target.closest('.question-block');
 
              if (addOptionButton && questionBlock) {
@@ -667,8 +710,15 @@ function handleDefaultTimeChange(event) {
                      questionsContainer.insertBefore(questionBlock, nextSibling.nextSibling);
                      updateMoveButtonStates();
                  }
+             } else if (removeImageButton && questionBlock) {
+                 setQuestionImage(questionBlock, null);
              }
          });
+         quizBuilderView.addEventListener('change', (e) => {
+             const imageInput = e.target.closest('.question-image-input');
+             const questionBlock = e.target.closest('.question-block');
+             if (imageInput && questionBlock) uploadQuestionImage(questionBlock, imageInput);
+         });
     }
 
     if (!document.getElementById('infoModal')) {
@@ -98,11 +98,50 @@ function createWaitingIndicatorHTML() {
     return `<li class="list-group-item text-muted waiting-indicator">Esperando jugadores<span class="dots">...</span></li>`;
 }
 
+// Reinicio del servidor: token con el que el host reanuda la partida al volver el servidor
+let hostRestartToken = null;
+let hostRestartAttempts = 0;
+const MAX_HOST_RESTART_ATTEMPTS = 8; // Reintentos cada 3s (dentro del periodo de gracia del servidor)
+const HOST_RESTART_RETRY_MS = 3000;
+
+// Siguiente pregunta recibida oculta ('question_prefetch') durante el marcador, pendiente de 'reveal'
+let prefetchedQuestion = null;
+
+// Reabre la conexión del host tras un reinicio del servidor y reanuda la partida
+function resumeHostAfterRestart(gameCode) {
+     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+     console.log(`Host resuming game ${gameCode} after server restart (attempt ${hostRestartAttempts}).`);
+     window.hostWebSocket = new WebSocket(`${wsProtocol}//${window.location.host}/ws/${gameCode}?caps=batch`);
+     window.hostWebSocket.onopen = () => {
+         sendHostCommand("resume_session", { reconnect_token: hostRestartToken });
+     };
+     window.hostWebSocket.onmessage = (event) => {
+         try {
+             handleHostWebSocketMessage(JSON.parse(event.data));
+         } catch (error) {
+             console.error("Host failed to parse message:", error, event.data);
+         }
+     };
+     window.hostWebSocket.onclose = (event) => {
+         if (hostRestartToken && event.code !== 1000 && hostRestartAttempts < MAX_HOST_RESTART_ATTEMPTS) {
+             hostRestartAttempts++;
+             setTimeout(() => resumeHostAfterRestart(gameCode), HOST_RESTART_RETRY_MS);
+             return;
+         }
+         if (hostRestartToken) {
+             alert("No se pudo recuperar la partida tras el reinicio del servidor.");
+             hostRestartToken = null;
+             resetHostState();
+             showView('dashboard-view');
+         }
+     };
+}
+
 function connectHostWebSocket(gameCode) {
      // Use actual hostname if deployed, or localhost/port during development
      const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
      // Make sure this points to your backend WebSocket endpoint
-     const wsUrl = `${wsProtocol}//${window.location.host}/ws/${gameCode}`; // Adjust if backend runs elsewhere
+     const wsUrl = `${wsProtocol}//${window.location.host}/ws/${gameCode}?caps=batch`; // Adjust if backend runs elsewhere ('batch': acepta mensajes agrupados)
 
      console.log(`Host connecting to WebSocket: ${wsUrl}`);
      gameCodeDisplay = gameCodeDisplay || document.getElementById('game-code-display');
@@ -172,6 +211,7 @@ function connectHostWebSocket(gameCode) {
 
      window.hostWebSocket.onerror = (error) => {
          console.error("Host WebSocket error:", error);
+         if (hostRestartToken) return; // Reinicio del servidor: onclose reanudará la partida
          alert("Error de conexión WebSocket como anfitrión. La partida no puede continuar.");
          // onclose will handle cleanup
          showView('dashboard-view');
@@ -179,6 +219,11 @@ function connectHostWebSocket(gameCode) {
 
      window.hostWebSocket.onclose = (event) => {
          console.log("Host WebSocket closed:", event.code, event.reason, `WasClean: ${event.wasClean}`);
+         if (hostRestartToken) {
+             hostRestartAttempts = 0;
+             setTimeout(() => resumeHostAfterRestart(gameCode), HOST_RESTART_RETRY_MS);
+             return;
+         }
          hostEndView = hostEndView || document.getElementById('host-end-view'); // Ensure element is checked
          const gameEndedNormally = hostEndView && hostEndView.style.display !== 'none';
 
@@ -201,6 +246,14 @@ function connectHostWebSocket(gameCode) {
 function handleHostWebSocketMessage(message) {
      const type = message.type;
      const payload = message.payload;
+     if (type === 'batch') { // Varios mensajes agrupados por el servidor, en orden
+         payload.forEach(handleHostWebSocketMessage);
+         return;
+     }
+     if (type === 'ping') { // Heartbeat del servidor: responder sin tocar la UI
+         window.hostWebSocket.send(JSON.stringify({ type: 'pong', payload: null }));
+         return;
+     }
      console.log("Host processing message:", type, payload);
 
      // Ensure UI elements are available
@@ -256,11 +309,52 @@ function handleHostWebSocketMessage(message) {
 
           case 'new_question':
               console.log("Host received new question data.");
-              window.currentQuestionData = payload;
-              displayHostQuestion(payload);
-              updateLeaderboard([]); // Clear leaderboard for new question
-              if(resultsDisplay) resultsDisplay.style.display = 'none';
-              if(nextQuestionBtn) nextQuestionBtn.disabled = false; // Habilitar "Siguiente" para mostrar marcador
+              showHostNewQuestion(payload);
+              break;
+
+          case 'media_prefetch':
+              // Imágenes del quiz: se descargan antes de empezar, no durante las preguntas
+              (payload.urls || []).forEach(url => { (new Image()).src = url; });
+              break;
+
+          case 'question_prefetch':
+              // La pregunta llega oculta durante el marcador; se muestra con 'reveal'
+              prefetchedQuestion = payload;
+              if (payload.media_url) (new Image()).src = payload.media_url;
+              break;
+
+          case 'reveal':
+              if (prefetchedQuestion && prefetchedQuestion.question_id === payload.question_id) {
+                  const question = prefetchedQuestion;
+                  prefetchedQuestion = null;
+                  setTimeout(() => showHostNewQuestion(question), payload.delay_ms);
+              } else {
+                  console.warn("'reveal' received without a prefetched question:", payload.question_id);
+              }
+              break;
+
+          case 'server_restarting':
+              console.log("Server restarting:", payload.message);
+              hostRestartToken = payload.reconnect_token;
+              if (quizLoadStatus) quizLoadStatus.textContent = payload.message;
+              break;
+
+          case 'session_resumed':
+              // El host recupera la partida tras el reinicio del servidor
+              console.log("Host session resumed after server restart:", payload.state);
+              hostRestartToken = null;
+              updatePlayerCount(payload.player_count);
+              if (payload.state === 'QUESTION_DISPLAY' && payload.question) {
+                  showView('host-game-view');
+                  displayHostQuestion({ ...payload.question, time_limit: Math.max(1, Math.floor(payload.time_remaining ?? 0)) });
+              } else if (payload.state !== 'LOBBY') {
+                  showView('host-game-view');
+              }
+              break;
+
+          case 'answer_stats':
+              // Distribución agregada de respuestas (como mucho unas pocas por segundo)
+              renderAnswerStats(payload);
               break;
 
           case 'update_scoreboard':
@@ -272,6 +366,7 @@ function handleHostWebSocketMessage(message) {
                    timerBar.classList.remove('progress-bar-animated', 'bg-danger', 'bg-info');
                }
               updateLeaderboard(payload.scoreboard);
+              updateTeamStandings('team-leaderboard-card', 'team-leaderboard', payload.teams);
               if(resultsDisplay) resultsDisplay.style.display = 'block';
               // El avance será automático o por clic del host (dejamos el botón habilitado)
               if(nextQuestionBtn) nextQuestionBtn.disabled = false;
@@ -403,6 +498,38 @@ function sendHostCommand(commandType, data = {}) {
      }
  }
 
+function renderAnswerStats(statsPayload) {
+    const statsContainer = document.getElementById('answer-stats');
+    const summaryChart = document.getElementById('answer-summary-chart');
+    const question = window.currentQuestionData;
+    if (!statsContainer || !question || question.question_number !== statsPayload.question_number) return;
+
+    const symbols = ['▲', '◆', '●', '■'];
+    const colors = ['bg-danger', 'bg-primary', 'bg-warning', 'bg-success'];
+    const total = statsPayload.answered_count || 0;
+    let html = `<div class="text-muted mb-1">Respuestas: ${total} / ${statsPayload.player_count}</div>`;
+    question.options.forEach((opt, index) => {
+        const count = statsPayload.counts[opt.id] || 0;
+        const percent = total > 0 ? Math.round((count / total) * 100) : 0;
+        html += `<div class="d-flex align-items-center mb-1">
+                    <span class="me-2" style="width: 1.5em;">${symbols[index % 4]}</span>
+                    <div class="progress flex-grow-1" style="height: 18px;">
+                        <div class="progress-bar ${colors[index % 4]}" style="width: ${percent}%">${count}</div>
+                    </div>
+                 </div>`;
+    });
+    statsContainer.innerHTML = html;
+    if (summaryChart) summaryChart.innerHTML = html; // Resumen final visible junto al marcador
+}
+
+function showHostNewQuestion(questionPayload) {
+    window.currentQuestionData = questionPayload;
+    displayHostQuestion(questionPayload);
+    updateLeaderboard([]); // Clear leaderboard for new question
+    if(resultsDisplay) resultsDisplay.style.display = 'none';
+    if(nextQuestionBtn) nextQuestionBtn.disabled = false; // Habilitar "Siguiente" para mostrar marcador
+}
+
 function displayHostQuestion(questionPayload) {
     questionNumberDisplay = questionNumberDisplay || document.getElementById('question-number');
     questionTextDisplay = questionTextDisplay || document.getElementById('question-text');
@@ -414,6 +541,18 @@ function displayHostQuestion(questionPayload) {
 
     questionNumberDisplay.textContent = `Pregunta ${questionPayload.question_number} / ${window.totalQuestionsInGame}`;
     questionTextDisplay.textContent = questionPayload.question_text;
+    const questionImage = document.getElementById('question-image');
+    if (questionImage) {
+        if (questionPayload.media_url) {
+            questionImage.src = questionPayload.media_url;
+            questionImage.style.display = 'inline-block';
+        } else {
+            questionImage.removeAttribute('src');
+            questionImage.style.display = 'none';
+        }
+    }
+    const statsContainer = document.getElementById('answer-stats');
+    if (statsContainer) statsContainer.innerHTML = '';
 
     hostOptionsPreview.innerHTML = '';
     const symbols = ['▲', '◆', '●', '■'];
@@ -510,7 +649,32 @@ function updateLeaderboard(leaderboardData) {
      }
  }
 
+// Clasificación de equipos: nombre, miembros, puntuación total y media; se oculta si la partida no tiene equipos
+function updateTeamStandings(containerId, listId, teams) {
+     const container = document.getElementById(containerId);
+     const list = document.getElementById(listId);
+     if (!container || !list) return;
+     if (!teams || teams.length === 0) {
+         container.style.display = 'none';
+         return;
+     }
+     list.innerHTML = '';
+     teams.forEach(team => {
+         const li = document.createElement('li');
+         li.className = 'list-group-item d-flex justify-content-between align-items-center';
+         const name = document.createElement('span');
+         name.textContent = `${team.rank}. ${team.team} (${team.members})`;
+         const score = document.createElement('span');
+         score.className = 'badge bg-success rounded-pill';
+         score.textContent = `${team.score} pts · media ${team.average_score}`;
+         li.append(name, score);
+         list.appendChild(li);
+     });
+     container.style.display = 'block';
+ }
+
 function displayHostFinalPodium(podiumData) {
+     updateTeamStandings('final-team-standings-host', 'final-team-standings-list-host', podiumData && podiumData.teams);
      finalPodiumListHost = finalPodiumListHost || document.getElementById('final-podium-list-host');
      if (!finalPodiumListHost) return;
      console.log("!!!!!! Entered displayHostFinalPodium", podiumData); // DEBUG
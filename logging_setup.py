@@ -0,0 +1,240 @@
+# logging_setup.py
+"""
+Configuración del logging del servidor: asíncrono, estructurado y con
+limitación de frecuencia en los caminos calientes.
+
+- Los registros se encolan sin formatear mediante un `QueueHandler`, y un
+  hilo de fondo (`QueueListener`) los formatea y escribe en stderr. Así el
+  bucle de eventos nunca formatea mensajes ni bloquea escribiendo logs.
+- Cada registro lleva campos estructurados (`game_code`, `event` y los que
+  se pasen con `extra={"fields": {...}}`). Si no se indican, `game_code` y
+  `event` se toman de la contextvar `current_dispatch` de diagnostics.
+- Los eventos de alta frecuencia (ej: 'submit_answer') se protegen con
+  `should_log()`, que aplica muestreo y un límite de frecuencia por partida
+  antes de construir siquiera el registro.
+- Se puede pedir "loggear todo" (incluido DEBUG) para partidas concretas con
+  `set_game_debug()`, sin cambiar el nivel global.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from diagnostics import current_dispatch
+from overload import LEVEL_PAUSE_BACKGROUND, overload_controller
+
+# --- Constantes de Configuración ---
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = os.environ.get("QUIZ_LOG_FORMAT", "text") # 'text' (clave=valor) o 'json' (una línea JSON por registro)
+
+# Fracción de eventos de alta frecuencia que se consideran para el log (1.0 = todos)
+HOT_EVENT_SAMPLE_RATES: Dict[str, float] = {
+    "submit_answer": 0.1,
+    "connect": 1.0,
+    "join_game": 1.0,
+    "disconnect": 1.0,
+    "send_error": 1.0,
+    "admission": 1.0,
+}
+HOT_EVENT_RATE_PER_GAME = 5.0 # Registros por segundo permitidos por partida y evento (tras el muestreo)
+HOT_EVENT_BURST = 20          # Ráfaga máxima permitida por partida y evento
+
+# Loggers de la aplicación que se bajan a DEBUG mientras haya partidas en depuración
+APP_LOGGERS = ("main", "game_logic", "heartbeat")
+
+# --- Estado del Módulo ---
+debug_games: Set[str] = set() # Partidas para las que se loggea todo, sin muestreo ni límites
+# (game_code, event) -> [tokens disponibles, último refresco (monotonic), registros suprimidos]
+_hot_buckets: Dict[tuple, List[float]] = {}
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def should_log(game_code: str, event: str) -> bool:
+    """
+    Decide si se debe emitir un registro de un evento de alta frecuencia.
+
+    Pensado para usarse antes de llamar al logger en los caminos calientes,
+    de modo que los registros descartados no cuestan ni su construcción:
+
+        if should_log(game.game_code, "submit_answer"):
+            logger.info("...", ..., extra={"event": "submit_answer", ...})
+
+    Guarda estado por (partida, evento) hasta `forget_game()`, así que solo
+    debe llamarse con partidas que existen (nunca con un código sin validar).
+
+    Args:
+        game_code: Partida a la que pertenece el evento.
+        event: Nombre del evento (ver HOT_EVENT_SAMPLE_RATES).
+
+    Returns:
+        True si el registro debe emitirse.
+    """
+    if game_code in debug_games:
+        return True
+    if overload_controller.level >= LEVEL_PAUSE_BACKGROUND:
+        return False # Sobrecarga: los logs de alta frecuencia se pausan
+    key = (game_code, event)
+    bucket = _hot_buckets.get(key)
+    now = time.monotonic()
+    if bucket is None:
+        bucket = _hot_buckets[key] = [float(HOT_EVENT_BURST), now, 0]
+    sample_rate = HOT_EVENT_SAMPLE_RATES.get(event, 1.0)
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        bucket[2] += 1
+        return False
+    bucket[0] = min(float(HOT_EVENT_BURST), bucket[0] + (now - bucket[1]) * HOT_EVENT_RATE_PER_GAME)
+    bucket[1] = now
+    if bucket[0] < 1.0:
+        bucket[2] += 1
+        return False
+    bucket[0] -= 1.0
+    return True
+
+
+def forget_game(game_code: str):
+    """Libera el estado de limitación de una partida eliminada."""
+    for key in [k for k in _hot_buckets if k[0] == game_code]:
+        del _hot_buckets[key]
+    debug_games.discard(game_code)
+    _update_app_logger_levels()
+
+
+def set_game_debug(game_code: str, enabled: bool):
+    """Activa o desactiva el modo "loggear todo" (incluido DEBUG) para una partida."""
+    if enabled:
+        debug_games.add(game_code)
+    else:
+        debug_games.discard(game_code)
+    _update_app_logger_levels()
+
+
+def _update_app_logger_levels():
+    # Solo con partidas en depuración se crean registros DEBUG; el filtro
+    # de contexto descarta después los que no son de esas partidas.
+    level = logging.DEBUG if debug_games else logging.NOTSET
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(level)
+
+
+def get_logging_status() -> Dict[str, Any]:
+    """Devuelve la configuración actual y los registros suprimidos por evento."""
+    suppressed: Dict[str, int] = {}
+    for (_, event), bucket in _hot_buckets.items():
+        suppressed[event] = suppressed.get(event, 0) + int(bucket[2])
+    return {
+        "format": LOG_FORMAT,
+        "level": logging.getLevelName(LOG_LEVEL),
+        "debug_games": sorted(debug_games),
+        "sample_rates": HOT_EVENT_SAMPLE_RATES,
+        "rate_per_game": HOT_EVENT_RATE_PER_GAME,
+        "burst": HOT_EVENT_BURST,
+        "suppressed": suppressed,
+        "queue_size": _listener.queue.qsize() if _listener else 0,
+    }
+
+
+class DispatchContextFilter(logging.Filter):
+    """
+    Completa los campos estructurados de cada registro en el hilo que lo emite.
+
+    Toma `game_code` y `event` de la contextvar `current_dispatch` si no se
+    pasaron explícitamente, y descarta los registros por debajo de LOG_LEVEL
+    que no pertenezcan a una partida en depuración.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "game_code"):
+            game_code, event = current_dispatch.get()
+            record.game_code = game_code
+            if not hasattr(record, "event"):
+                record.event = event
+        elif not hasattr(record, "event"):
+            record.event = "-"
+        if record.levelno < LOG_LEVEL and record.game_code not in debug_games:
+            return False
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatea registros como texto 'clave=valor' o como una línea JSON."""
+
+    def __init__(self, fmt_kind: str = LOG_FORMAT):
+        super().__init__()
+        self.fmt_kind = fmt_kind
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields: Dict[str, Any] = {}
+        if getattr(record, "game_code", "-") != "-":
+            fields["game"] = record.game_code
+        if getattr(record, "event", "-") != "-":
+            fields["event"] = record.event
+        fields.update(getattr(record, "fields", None) or {})
+        message = record.getMessage() # El formateo '%' se hace aquí, en el hilo de fondo
+
+        if self.fmt_kind == "json":
+            entry = {
+                "ts": round(record.created, 6),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": message,
+                **fields,
+            }
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        line = f"{self.formatTime(record)} {record.levelname}:{record.name}: {message}"
+        if fields:
+            line += " | " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no formatea en el hilo emisor; lo hace el listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging():
+    """
+    Instala el pipeline de logging en el logger raíz (idempotente).
+
+    Sustituye los manejadores existentes del logger raíz por un
+    `QueueHandler` y arranca el `QueueListener` que escribe en stderr.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DispatchContextFilter())
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(StructuredFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(shutdown_logging) # Vaciar la cola al salir del proceso
+
+
+def shutdown_logging():
+    """Detiene el hilo de escritura vaciando antes la cola."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
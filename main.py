@@ -8,39 +8,79 @@ durante las partidas. Gestiona el diccionario global `active_games` que
 almacena el estado de todas las partidas en curso. Delega la lógica
 específica del juego al módulo `game_logic`.
 """
+import asyncio
 import json
 import logging
+import os
 import secrets
 import string # <<< Añadido para el conjunto de caracteres
+import time
 from typing import Dict, Optional
 
 # Importaciones FastAPI y Pydantic
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, status
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import ValidationError
 
 # Importar lógica del juego y modelos
 # Las funciones de game_logic operarán sobre el diccionario active_games definido aquí.
 from game_logic import (
-     broadcast, handle_disconnect, handle_join_game, handle_next_question,
-     handle_start_game, handle_submit_answer, send_personal_message,
-     handle_game_over, load_quiz # load_quiz puede ser usado indirectamente por game_logic
+     broadcast, send_personal_message, submit_command,
+     load_quiz, # load_quiz puede ser usado indirectamente por game_logic
+     get_real_player_count, get_player_only_scoreboard, resume_restored_game, close_for_restart,
+     start_tournament, resume_restored_tournament
+)
+from game_actor import (
+    CMD_ANSWER, CMD_DISCONNECT, CMD_END, CMD_JOIN, CMD_LOAD_QUIZ, CMD_NEXT,
+    CMD_RESUME, CMD_START
 )
 from models import (
-    Game, GameStateEnum, WebSocketMessage, ErrorPayload, QuizData,
+    Game, GameStateEnum, WebSocketMessage, ErrorPayload, QuizData, DiagnosticsSettings,
+    AdmissionLimits, SpectateAckPayload, TournamentCreateRequest, SubmitAnswerPayload,
+    HomeworkCreateRequest, HomeworkEnrollRequest, HomeworkQuestionPayload, HomeworkLeaderboardPayload,
+    OverloadSettings, GameDetail, GamePage,
     # Importar solo los modelos necesarios directamente en main si se usan aquí
     # o confiar en que game_logic los usa internamente.
 )
+from diagnostics import (
+    PROFILE_MAX_SECONDS, handler_tracer, loop_monitor, sampling_profiler,
+    set_dispatch_context
+)
+from logging_setup import get_logging_status, set_game_debug, setup_logging, should_log
+from metrics import render_metrics
+import admission
+from heartbeat import heartbeat_scheduler
+from overload import LEVEL_REJECT_NEW_GAMES, OVERLOAD_COOLDOWN_S, OVERLOAD_ENABLED, overload_controller, shed_total
+from snapshot import load_snapshot, save_snapshot
+from results import EXPORT_FORMATS, stream_results
+from introspection import GAME_PLAYERS_PAGE_DEFAULT, GAME_PLAYERS_PAGE_MAX, GAMES_PAGE_DEFAULT, GAMES_PAGE_MAX, game_detail, list_games
+from event_log import open_event_log
+from tournament import Tournament
+from homework import HOMEWORK_TOP_K, HomeworkAssignment, HomeworkError
+from media import (
+    MEDIA_CACHE_CONTROL, MEDIA_MAX_BYTES, MediaError, content_type, is_media_id, media_store,
+    media_url, missing_media
+)
+from wire import (
+    FrameDecodeError, WS_PER_MESSAGE_DEFLATE, close_connection, decode_frame, negotiate, receive_frame,
+    set_capabilities, set_encoding
+)
 
-# Configuración básica de logging
-logging.basicConfig(level=logging.INFO)
+# Configuración de logging: cola + hilo de escritura, campos estructurados (ver logging_setup.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # --- Estado Global del Servidor ---
 # Diccionario que almacena todas las partidas activas, mapeando game_code -> Game object.
 # Este diccionario es compartido y modificado por las funciones de game_logic.
 active_games: Dict[str, Game] = {}
+# Torneos creados por el administrador, mapeando tournament_id -> Tournament (ver tournament.py)
+active_tournaments: Dict[str, Tournament] = {}
+# Tareas a tu ritmo, mapeando assignment_id -> HomeworkAssignment (ver homework.py)
+active_assignments: Dict[str, HomeworkAssignment] = {}
+# True tras 'drenar' el servidor (ver drain_server): no se aceptan partidas ni conexiones nuevas
+draining = False
 # ------------------------------------
 
 # --- Constantes de Generación de Código ---
@@ -49,6 +89,11 @@ GAME_CODE_LENGTH = 4
 GAME_CODE_CHARACTER_SET = string.ascii_uppercase + string.digits # A-Z, 0-9
 MAX_CODE_GENERATION_ATTEMPTS = 10 # Límite de intentos para evitar bucles infinitos
 
+# --- Autenticación de Endpoints de Administración ---
+# Token que deben enviar las peticiones a /debug/* en la cabecera 'X-Admin-Token'.
+# Si no se define la variable de entorno, se genera uno aleatorio al arrancar (se muestra en el log).
+ADMIN_TOKEN = os.environ.get("QUIZ_ADMIN_TOKEN") or secrets.token_urlsafe(16)
+
 # Crear instancia de la aplicación FastAPI
 app = FastAPI(title="QuizMaster Live Server")
 
@@ -65,12 +110,31 @@ async def startup_event():
     logger.info("Static files mounted from './static' and './js'.")
     logger.info("WebSocket endpoint ready at /ws/{game_code}")
     logger.info("REST endpoint for game creation ready at POST /create_game/")
+    if "QUIZ_ADMIN_TOKEN" not in os.environ:
+        logger.warning(f"QUIZ_ADMIN_TOKEN not set. Generated admin token for this run: {ADMIN_TOKEN}")
+    # Restaurar las partidas de un reinicio anterior antes de aceptar tráfico
+    for game in load_snapshot():
+        active_games[game.game_code] = game
+        resume_restored_game(active_games, game)
+        if game.tournament is not None:
+            active_tournaments[game.tournament.tournament_id] = game.tournament
+    for tournament in active_tournaments.values():
+        resume_restored_tournament(active_games, tournament)
+    heartbeat_scheduler.start(active_games)
+    if OVERLOAD_ENABLED:
+        overload_controller.start(active_games)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Acciones a realizar al apagar el servidor."""
     logger.info("QuizMaster Live Server shutting down.")
+    if not draining and active_games:
+        # Sin drenado previo las conexiones ya se cerraron: se guarda lo que quede
+        await drain_server()
+    loop_monitor.stop()
+    heartbeat_scheduler.stop()
+    overload_controller.stop()
     # Opcional: Podrías intentar notificar a los juegos activos, pero puede ser complejo.
 
 # --- RUTA para /favicon.ico ---
@@ -88,6 +152,35 @@ async def favicon():
         raise HTTPException(status_code=500, detail="Internal server error serving favicon")
 
 
+# --- Dependencia de Autenticación para Endpoints de Administración ---
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Rechaza la petición (401) si la cabecera 'X-Admin-Token' no coincide con ADMIN_TOKEN."""
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or missing admin token.")
+
+
+def _generate_game_code() -> str:
+    """
+    Genera un código de partida único de 4 caracteres alfanuméricos en mayúsculas.
+
+    Raises:
+        HTTPException 500 si no se encuentra un código libre tras MAX_CODE_GENERATION_ATTEMPTS intentos.
+    """
+    attempts = 0
+    while attempts < MAX_CODE_GENERATION_ATTEMPTS:
+         game_code = ''.join(secrets.choice(GAME_CODE_CHARACTER_SET) for _ in range(GAME_CODE_LENGTH))
+         if game_code not in active_games:
+             break # Código único encontrado
+         attempts += 1
+    else:
+        # Si se superan los intentos, es un problema (quizás demasiados juegos activos para 4 chars?)
+        logger.critical(f"Failed to generate a unique {GAME_CODE_LENGTH}-character game code after {MAX_CODE_GENERATION_ATTEMPTS} attempts!")
+        raise HTTPException(status_code=500, detail=f"Internal server error: Could not generate unique game code. Too many active games?")
+
+    logger.info(f"Generated unique {GAME_CODE_LENGTH}-character game code: {game_code}")
+    return game_code
+
+
 # --- Endpoint REST para Crear una Nueva Partida ---
 @app.post("/create_game/", status_code=status.HTTP_201_CREATED, response_model=dict)
 async def create_game():
@@ -104,24 +197,18 @@ async def create_game():
         HTTPException 500 si ocurre un error inesperado o no se puede generar código único.
     """
     logger.info("Received request to create a new game shell.")
+    if draining:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="El servidor se está reiniciando. Inténtalo de nuevo en unos segundos.")
+    if overload_controller.level >= LEVEL_REJECT_NEW_GAMES:
+        # Sobrecarga: las partidas en curso tienen prioridad sobre las nuevas
+        shed_total.inc("create_game")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="El servidor está muy ocupado. Inténtalo de nuevo en unos segundos.",
+                            headers={"Retry-After": str(int(OVERLOAD_COOLDOWN_S))})
     try:
-        # --- MODIFICADO: Generación de código de 4 caracteres alfanuméricos ---
-        attempts = 0
-        while attempts < MAX_CODE_GENERATION_ATTEMPTS:
-             game_code = ''.join(secrets.choice(GAME_CODE_CHARACTER_SET) for _ in range(GAME_CODE_LENGTH))
-             if game_code not in active_games:
-                 break # Código único encontrado
-             attempts += 1
-        else:
-            # Si se superan los intentos, es un problema (quizás demasiados juegos activos para 4 chars?)
-            logger.critical(f"Failed to generate a unique {GAME_CODE_LENGTH}-character game code after {MAX_CODE_GENERATION_ATTEMPTS} attempts!")
-            raise HTTPException(status_code=500, detail=f"Internal server error: Could not generate unique game code. Too many active games?")
-
-        logger.info(f"Generated unique {GAME_CODE_LENGTH}-character game code: {game_code}")
-        # --------------------------------------------------------------------
+        game_code = _generate_game_code()
 
         # Crear el objeto Game inicial (placeholder)
-        new_game = Game(game_code=game_code, quiz_data=None) # Sin quiz cargado aún
+        new_game = Game(game_code=game_code, quiz_data=None, event_log=open_event_log(game_code)) # Sin quiz cargado aún
 
         # Almacenar el nuevo juego en el diccionario global
         active_games[game_code] = new_game
@@ -147,8 +234,9 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
     Valida el `game_code` (ahora de 4 caracteres), acepta la conexión si el
     juego existe, y entra en un bucle para recibir y procesar mensajes JSON
     del cliente. Delega el manejo de cada tipo de mensaje a las funciones
-    correspondientes en `game_logic`. Maneja la desconexión del cliente
-    llamando a `handle_disconnect`.
+    correspondientes en `game_logic` encolándolo en el actor de la partida
+    (`submit_command`), que los aplica en orden. Maneja la desconexión del
+    cliente con un comando 'disconnect'.
 
     Args:
         websocket: La conexión WebSocket entrante.
@@ -156,7 +244,6 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
     """
     client_host = websocket.client.host
     client_port = websocket.client.port
-    logger.info(f"WebSocket connection attempt from {client_host}:{client_port} for game code '{game_code_from_url}'")
 
     # --- MODIFICADO: Normalización sigue siendo importante (a mayúsculas) ---
     # Asegura que 'aBc1' se trate igual que 'ABC1'
@@ -168,6 +255,11 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
     #    return
     # --------------------------------------------------------------------
 
+    if draining:
+        # Reinicio en curso: el cliente reintentará (1012 = Service Restart)
+        await websocket.close(code=status.WS_1012_SERVICE_RESTART)
+        return
+
     # Buscar la partida en el diccionario global
     game = active_games.get(game_code)
 
@@ -184,26 +276,62 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
             pass # Ignorar errores si el cliente ya cerró al recibir el accept
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION) # Código de cierre por política
         return
+    # El límite de frecuencia guarda estado por partida: solo para partidas que existen
+    # (con el código de la URL tal cual, cada código inventado dejaría una entrada para siempre)
+    if should_log(game_code, "connect"):
+        logger.info("WebSocket connection attempt from %s:%s for game code '%s'", client_host, client_port, game_code_from_url,
+                    extra={"game_code": game_code, "event": "connect"})
+    rejection = admission.check_new_connection(game_code, len(game.players))
+    if rejection:
+        # Rechazo barato: cerrar antes de aceptar (el handshake termina en HTTP 403)
+        if should_log(game_code, "admission"):
+            logger.warning("Rejecting WebSocket connection from %s:%s to game %s: %s", client_host, client_port, game_code, rejection,
+                           extra={"game_code": game_code, "event": "admission"})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
     else:
         # Juego encontrado, aceptar la conexión
-        logger.info(f"Game '{game_code}' found. Accepting WebSocket connection from {client_host}:{client_port}")
-        await websocket.accept()
+        logger.debug("Game '%s' found. Accepting WebSocket connection from %s:%s", game_code, client_host, client_port,
+                     extra={"game_code": game_code, "event": "connect"})
+        # Codificación de los mensajes según el subprotocolo que ofrece el cliente (JSON por defecto, ver wire.py)
+        subprotocol, encoding = negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        set_encoding(websocket, encoding)
+        set_capabilities(websocket, websocket.query_params.get("caps", ""), game.connections) # Ej: '?caps=batch' (mensajes agrupados)
+        conn_id = game.connections.add(websocket) # ID entero de esta conexión dentro de la partida
+        heartbeat_scheduler.register(websocket, game_code, conn_id)
         # Añadir la conexión a la lista general de conexiones activas del juego
         # game.active_connections.append(websocket) # Se hace en handle_join_game ahora
 
 
     has_joined = False # Flag para asegurar que el primer mensaje sea 'join_game'
     player_nickname = "Unknown" # Para logging antes del join
+    conn_admission = admission.ConnectionAdmission() # Límites de tamaño/ritmo de esta conexión
 
     try:
         # Bucle principal para recibir mensajes del cliente conectado
         while True:
-            raw_data = await websocket.receive_text()
-            # Intentar parsear el mensaje JSON
+            raw_data = await receive_frame(websocket) # Texto JSON o fotograma binario (subprotocolo binario)
+            heartbeat_scheduler.touch(websocket) # Cualquier mensaje cuenta como señal de vida
+            # Control de admisión antes de cualquier parseo
+            is_host = game.host_id == conn_id
+            rejection = conn_admission.check_frame(raw_data, is_host)
+            if rejection:
+                if should_log(game_code, "admission"):
+                    logger.warning("Disconnecting %s (%s:%s) from game %s: %s (%d chars)", player_nickname, client_host, client_port,
+                                   game_code, rejection, len(raw_data), extra={"game_code": game_code, "event": "admission"})
+                close_code = status.WS_1009_MESSAGE_TOO_BIG if rejection == admission.REJECT_FRAME_TOO_LARGE else status.WS_1008_POLICY_VIOLATION
+                await close_connection(websocket, close_code)
+                break
+            message_type: Optional[str] = None
+            # Intentar parsear el mensaje (JSON o binario según la conexión)
             try:
-                data = json.loads(raw_data)
+                # El límite tras descomprimir es el mismo que el del fotograma: un jugador no puede inflar 4 KB hasta el máximo del host
+                max_frame_bytes = admission.limits.max_frame_bytes_host if is_host else admission.limits.max_frame_bytes_player
+                data = decode_frame(raw_data, encoding, max_frame_bytes)
                 message = WebSocketMessage.model_validate(data) # Validar estructura básica
                 message_type = message.type
+                set_dispatch_context(game_code, message_type) # Etiqueta para perfilado/diagnóstico
                 payload = message.payload or {} # Usar diccionario vacío si no hay payload
 
                 # Loggear mensaje recibido (cuidado con payloads muy grandes en producción)
@@ -211,16 +339,29 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
 
                 # --- Enrutamiento de Mensajes ---
 
+                # 0. Respuesta al heartbeat: ya se registró la actividad al recibirla
+                if message_type == "pong":
+                    continue
+
                 # 1. Mensaje 'join_game': Debe ser el primero
                 if message_type == "join_game":
+                    if not has_joined and admission.check_join(len(game.players)):
+                        await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="La partida está llena.", code="GAME_FULL")))
+                        await close_connection(websocket, status.WS_1008_POLICY_VIOLATION)
+                        break
                     if not has_joined:
-                        # Pasar el diccionario global `active_games` a la función de lógica
-                        await handle_join_game(active_games, game, websocket, payload)
-                        # Verificar si el join fue exitoso (si el websocket está ahora en players)
-                        if websocket in game.players:
+                        # El actor de la partida aplica el join; esperar a su resultado
+                        joined = await submit_command(active_games, game, CMD_JOIN, conn_id, payload, wait=True)
+                        if joined:
                             has_joined = True
-                            player_nickname = game.players[websocket].nickname # Actualizar para logs
-                            logger.info(f"Player '{player_nickname}' successfully joined game {game_code}.")
+                            player_nickname = game.players[conn_id].nickname # Actualizar para logs
+                            if should_log(game_code, "join_game"):
+                                logger.info("Player '%s' successfully joined game %s.", player_nickname, game_code)
+                        elif active_games.get(game_code) is not game:
+                            # La partida se eliminó mientras esperaba en cola
+                            await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Código de partida no encontrado.", code="INVALID_GAME_CODE")))
+                            await close_connection(websocket, status.WS_1008_POLICY_VIOLATION)
+                            break
                         else:
                             # Join falló la validación interna en handle_join_game
                             logger.warning(f"Join attempt failed validation for {client_host} in game {game_code}. Connection might be closed by handler.")
@@ -231,15 +372,24 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
                         await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Ya te has unido a la partida.")))
                     continue # Procesado el mensaje 'join_game', esperar el siguiente
 
+                # 1b. Mensaje 'resume_session': alternativa a 'join_game' para reanudar tras una caída
+                if message_type == "resume_session" and not has_joined:
+                    resumed = await submit_command(active_games, game, CMD_RESUME, conn_id, payload, wait=True)
+                    if not resumed:
+                        break # Token inválido (el handler ya cerró la conexión) o partida eliminada
+                    has_joined = True
+                    player_nickname = game.players[conn_id].nickname
+                    continue
+
                 # 2. Comprobar si el cliente ya se ha unido para otros mensajes
                 if not has_joined:
                     logger.warning(f"Received message '{message_type}' before joining game {game_code} from {client_host}. Closing connection.")
                     await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Debes unirte ('join_game') primero.")))
-                    await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA) # Código por datos no aceptables
+                    await close_connection(websocket, status.WS_1003_UNSUPPORTED_DATA) # Código por datos no aceptables
                     break # Salir del bucle receive
 
                 # 3. Determinar si el remitente es el host (solo después de unirse)
-                is_host = (game.host_connection == websocket)
+                is_host = (game.host_id == conn_id)
 
                 # --- Enrutamiento para Clientes ya Unidos ---
 
@@ -247,18 +397,18 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
                     if not is_host:
                         logger.warning(f"Non-host '{player_nickname}' tried to load quiz data in game {game_code}.")
                         await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Solo el anfitrión puede cargar datos del cuestionario.")))
-                    elif game.state != GameStateEnum.LOBBY:
-                        logger.warning(f"Host '{player_nickname}' tried to load quiz data in wrong state ({game.state}) for game {game.game_code}.")
-                        await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="No se pueden cargar datos del cuestionario una vez iniciada la partida.")))
                     else:
                         logger.info(f"Host '{player_nickname}' attempting to load quiz data via WebSocket for game {game_code}.")
                         try:
-                            # Asumir que el payload es el QuizData completo en formato dict/json
+                            # Asumir que el payload es el QuizData completo en formato dict/json.
+                            # Se valida aquí (fuera del actor); el actor comprueba el estado y lo asigna.
                             loaded_quiz = QuizData.model_validate(payload)
-                            game.quiz_data = loaded_quiz # Asignar al estado del juego
-                            logger.info(f"Successfully validated and loaded quiz data for game {game_code} via WebSocket. Title: '{loaded_quiz.title}', Questions: {len(loaded_quiz.questions)}")
-                            # Confirmar al host que se cargó
-                            await send_personal_message(websocket, WebSocketMessage(type="quiz_loaded_ack", payload={"title": loaded_quiz.title, "question_count": len(loaded_quiz.questions)}))
+                            missing = missing_media(loaded_quiz, media_store)
+                            if missing:
+                                logger.warning(f"Quiz for game {game_code} references missing media in questions {missing}.")
+                                await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message=f"Falta la imagen de la(s) pregunta(s) {', '.join(map(str, missing))}. Vuelve a subirla.")))
+                            else:
+                                submit_command(active_games, game, CMD_LOAD_QUIZ, conn_id, loaded_quiz)
                         except ValidationError as e:
                             logger.error(f"Invalid quiz data received via WebSocket from host '{player_nickname}' in game {game_code}: {e}")
                             await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Formato de cuestionario inválido.")))
@@ -269,14 +419,15 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
                 elif message_type == "start_game":
                     if is_host:
                         logger.info(f"Host '{player_nickname}' requested to start game {game_code}.")
-                        await handle_start_game(active_games, game, websocket)
+                        submit_command(active_games, game, CMD_START, conn_id)
                     else:
                         logger.warning(f"Non-host '{player_nickname}' tried to start game {game_code}.")
                         await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Solo el anfitrión puede iniciar la partida.")))
 
                 elif message_type == "submit_answer":
                      if not is_host: # El host no debería enviar respuestas
-                         await handle_submit_answer(game, websocket, payload)
+                         # El timestamp se toma al recibir (no al procesar): es el que se puntúa
+                         submit_command(active_games, game, CMD_ANSWER, conn_id, (payload, time.time()))
                      else:
                          logger.warning(f"Host '{player_nickname}' attempted to submit an answer in {game_code}. Ignored.")
                          # Opcional: enviar error al host
@@ -285,7 +436,7 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
                 elif message_type == "next_question": # El host pide avanzar
                     if is_host:
                         logger.info(f"Host '{player_nickname}' requested next stage for game {game_code}.")
-                        await handle_next_question(active_games, game, websocket)
+                        submit_command(active_games, game, CMD_NEXT, conn_id)
                     else:
                         logger.warning(f"Non-host '{player_nickname}' tried to advance question in game {game_code}.")
                         await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Solo el anfitrión puede avanzar la partida.")))
@@ -293,7 +444,7 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
                 elif message_type == "end_game": # El host pide terminar prematuramente
                     if is_host:
                         logger.info(f"Host '{player_nickname}' requested to manually end game {game_code}.")
-                        await handle_game_over(active_games, game)
+                        submit_command(active_games, game, CMD_END, conn_id)
                     else:
                         logger.warning(f"Non-host '{player_nickname}' tried to end game {game_code}.")
                         await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Solo el anfitrión puede finalizar la partida.")))
@@ -304,21 +455,21 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
                     await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message=f"Tipo de mensaje desconocido: '{message_type}'")))
 
             # Manejo de Errores en la Recepción/Procesamiento del Mensaje
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received in game {game_code} from {player_nickname} ({client_host}). Closing connection.")
+            except (json.JSONDecodeError, FrameDecodeError) as e:
+                logger.error(f"Invalid message received in game {game_code} from {player_nickname} ({client_host}): {e}. Closing connection.")
                 # Intentar enviar error antes de cerrar
                 try:
-                    await websocket.send_text(WebSocketMessage(type="error", payload=ErrorPayload(message="Mensaje JSON inválido.")).model_dump_json())
+                    await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message="Mensaje inválido.")))
                 except Exception: pass
-                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                await close_connection(websocket, status.WS_1003_UNSUPPORTED_DATA)
                 break # Salir del bucle receive
             except ValidationError as ve:
                  # Error si la estructura básica del WebSocketMessage (type/payload) falla
                  logger.error(f"Invalid WebSocket message structure in game {game_code} from {player_nickname} ({client_host}): {ve}. Closing connection.")
                  try:
-                     await websocket.send_text(WebSocketMessage(type="error", payload=ErrorPayload(message=f"Estructura de mensaje inválida: {ve}")).model_dump_json())
+                     await send_personal_message(websocket, WebSocketMessage(type="error", payload=ErrorPayload(message=f"Estructura de mensaje inválida: {ve}")))
                  except Exception: pass
-                 await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                 await close_connection(websocket, status.WS_1003_UNSUPPORTED_DATA)
                  break # Salir del bucle receive
             except Exception as e:
                 # Capturar cualquier otro error inesperado durante el procesamiento del mensaje
@@ -330,21 +481,554 @@ async def websocket_endpoint(websocket: WebSocket, game_code_from_url: str):
                 # No necesariamente cerramos la conexión por errores internos,
                 # pero podríamos considerarlo si son graves.
 
+        # Se sale del bucle con 'break' tras cerrar la conexión desde el servidor:
+        # limpiar al jugador igual que en una desconexión del cliente.
+        if has_joined:
+            await submit_command(active_games, game, CMD_DISCONNECT, conn_id, False, wait=True)
+
     # Manejo de Desconexión del Cliente (esperada o por error)
-    except WebSocketDisconnect:
-        logger.info(f"WebSocket disconnected: {player_nickname} ({client_host}:{client_port}) from game: {game_code}.")
-        # Llamar a la lógica de limpieza, pasando el diccionario global
-        await handle_disconnect(active_games, game_code, websocket)
+    except WebSocketDisconnect as disconnect:
+        if should_log(game_code, "disconnect"):
+            logger.info("WebSocket disconnected: %s (%s:%s) from game: %s.", player_nickname, client_host, client_port, game_code,
+                        extra={"game_code": game_code, "event": "disconnect"})
+        # Limpieza a través del actor; esperar a que se aplique antes de liberar el conn_id.
+        # Un cierre normal (1000) es una salida voluntaria; cualquier otro permite reanudar la sesión
+        await submit_command(active_games, game, CMD_DISCONNECT, conn_id,
+                             disconnect.code != status.WS_1000_NORMAL_CLOSURE, wait=True)
     except Exception as e:
         # Error inesperado en el bucle principal de WebSocket (no en el procesamiento de un mensaje)
         logger.exception(f"Unhandled error in WebSocket connection loop for game {game_code}, client {player_nickname} ({client_host}:{client_port}): {e}")
         # Asegurarse de llamar a la limpieza también en este caso
-        await handle_disconnect(active_games, game_code, websocket)
+        await submit_command(active_games, game, CMD_DISCONNECT, conn_id, True, wait=True)
         # Intentar cerrar la conexión si aún está abierta
         try:
-            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            await close_connection(websocket, status.WS_1011_INTERNAL_ERROR)
         except Exception:
             pass
+    finally:
+        heartbeat_scheduler.unregister(websocket)
+        game.connections.remove(conn_id, websocket) # Solo aquí se libera el ID para reutilizarlo
+
+
+# --- Endpoint WebSocket de Espectadores (solo lectura) ---
+@app.websocket("/ws/{game_code_from_url}/watch")
+async def spectator_endpoint(websocket: WebSocket, game_code_from_url: str):
+    """
+    Conexión de solo lectura para espectadores (ej: público viendo el proyector).
+
+    El espectador no se une como jugador: se registra en `game.spectators` y
+    recibe los fotogramas compartidos (pregunta, top del marcador, podio) que
+    envía la tarea de fan-out de la partida. Cualquier mensaje que envíe se
+    considera una violación de política y cierra la conexión.
+
+    Args:
+        websocket: La conexión WebSocket entrante.
+        game_code_from_url: El código de la partida a observar.
+    """
+    game_code = game_code_from_url.strip().upper()
+    game = active_games.get(game_code)
+    if not game:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    rejection = admission.check_new_spectator(len(game.spectators))
+    if rejection:
+        if should_log(game_code, "admission"):
+            logger.warning("Rejecting spectator for game %s: %s", game_code, rejection,
+                           extra={"game_code": game_code, "event": "admission"})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    await websocket.accept()
+    await send_personal_message(websocket, WebSocketMessage(type="spectate_ack", payload=SpectateAckPayload(
+        game_code=game_code,
+        state=game.state,
+        player_count=get_real_player_count(game),
+        spectator_count=len(game.spectators) + 1
+    )))
+    await game.spectators.add(websocket)
+    try:
+        await websocket.receive_text()
+        # Los espectadores no envían nada: cualquier mensaje cierra la conexión
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.debug("Spectator connection error in game %s: %s", game_code, e)
+    finally:
+        game.spectators.remove(websocket)
+
+
+# --- Drenado para Reinicios sin Cortes ---
+
+async def drain_server() -> int:
+    """
+    Prepara el servidor para reiniciarse sin perder las partidas.
+
+    Deja de aceptar partidas y conexiones nuevas, cierra el actor de cada
+    partida (su estado ya no cambia), guarda una instantánea de todas (ver
+    snapshot.py), y avisa a los clientes con 'server_restarting' antes de
+    cerrar sus conexiones con el código 1012. Los clientes reanudan la sesión
+    con su token cuando el servidor vuelve a arrancar y restaura la
+    instantánea. Es idempotente.
+
+    Los torneos en curso también sobreviven: sus salas se guardan con el
+    estado del torneo y, tras guardar, se detiene su director. Al arrancar se
+    reconstruye `active_tournaments` y el director se relanza desde la
+    pregunta en la que estaban las salas (ver `resume_restored_tournament`).
+
+    Returns:
+        Número de partidas guardadas.
+    """
+    global draining
+    if draining:
+        return 0
+    draining = True
+    heartbeat_scheduler.stop()
+    games = list(active_games.values())
+    for game in games:
+        game.actor.close()
+    # Token nuevo para cada host conectado: los hosts no tienen token de reconexión propio
+    host_tokens = {game.game_code: secrets.token_urlsafe(16) for game in games if game.host_id in game.players}
+    saved = save_snapshot(active_games, host_tokens)
+    for tournament in active_tournaments.values():
+        if tournament.task is not None:
+            tournament.task.cancel() # Sus salas ya no aceptan comandos; el nuevo proceso lo relanza
+    await asyncio.gather(*(close_for_restart(game, host_tokens.get(game.game_code), status.WS_1012_SERVICE_RESTART)
+                           for game in games), return_exceptions=True)
+    logger.warning("Server drained: %d games saved, ready to restart.", saved)
+    return saved
+
+
+# --- Endpoints de Diagnóstico (requieren token de administración) ---
+
+@app.post("/debug/drain", dependencies=[Depends(require_admin)])
+async def drain():
+    """Drena el servidor antes de un despliegue (ver `drain_server`). Después se puede reiniciar el proceso."""
+    saved = await drain_server()
+    return {"draining": True, "games_saved": saved}
+
+
+@app.get("/debug/performance", dependencies=[Depends(require_admin)])
+async def get_performance_diagnostics():
+    """
+    Devuelve el estado del monitor de lag del bucle de eventos y las
+    estadísticas de latencia por tipo de mensaje, incluyendo los N
+    eventos más lentos registrados.
+    """
+    return {
+        "loop_lag": loop_monitor.snapshot(),
+        "handlers": handler_tracer.snapshot(),
+        "heartbeat": heartbeat_scheduler.snapshot(),
+        "overload": overload_controller.snapshot(),
+        "active_games": len(active_games),
+    }
+
+@app.post("/debug/performance", dependencies=[Depends(require_admin)])
+async def update_performance_diagnostics(settings: DiagnosticsSettings):
+    """
+    Activa/desactiva en caliente el monitor de lag y el trazado de manejadores,
+    ajusta el umbral de manejador lento y, opcionalmente, reinicia las estadísticas.
+    """
+    if settings.loop_monitor is True:
+        loop_monitor.start()
+    elif settings.loop_monitor is False:
+        loop_monitor.stop()
+    if settings.handler_tracing is not None:
+        handler_tracer.enabled = settings.handler_tracing
+        logger.info(f"Handler latency tracing {'enabled' if settings.handler_tracing else 'disabled'}.")
+    if settings.slow_threshold_ms is not None:
+        handler_tracer.threshold_ms = settings.slow_threshold_ms
+    if settings.reset:
+        loop_monitor.reset()
+        handler_tracer.reset()
+    return await get_performance_diagnostics()
+
+@app.post("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def run_sampling_profile(seconds: float = 5.0, interval_ms: float = 5.0, game_code: Optional[str] = None, include_idle: bool = False):
+    """
+    Ejecuta un perfil por muestreo del bucle de eventos durante `seconds` segundos.
+
+    Cada muestra se etiqueta con la partida y el tipo de mensaje en curso.
+    Devuelve pilas colapsadas (una por línea, 'frame;frame;... N'), listas para
+    `flamegraph.pl` o speedscope. Con `game_code` se filtra a una sola partida.
+
+    Raises:
+        HTTPException 400 si los parámetros están fuera de rango.
+        HTTPException 409 si ya hay un perfil en curso.
+    """
+    if not (0 < seconds <= PROFILE_MAX_SECONDS) or not (0.5 <= interval_ms <= 1000):
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}] and interval_ms in [0.5, 1000].")
+    try:
+        counts = await sampling_profiler.profile(
+            seconds, interval_ms / 1000.0,
+            game_code=game_code.strip().upper() if game_code else None,
+            include_idle=include_idle,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+@app.get("/debug/admission", dependencies=[Depends(require_admin)])
+async def get_admission_limits():
+    """Devuelve los límites de admisión vigentes."""
+    return admission.limits
+
+@app.put("/debug/admission", dependencies=[Depends(require_admin)])
+async def set_admission_limits(new_limits: AdmissionLimits):
+    """Sustituye los límites de admisión en caliente (las conexiones nuevas usan los nuevos valores)."""
+    admission.update_limits(new_limits)
+    return admission.limits
+
+@app.get("/debug/overload", dependencies=[Depends(require_admin)])
+async def get_overload_state():
+    """Devuelve el nivel de sobrecarga actual y las medidas que lo determinan."""
+    return overload_controller.snapshot()
+
+@app.put("/debug/overload", dependencies=[Depends(require_admin)])
+async def set_overload_level(settings: OverloadSettings):
+    """Fija a mano el nivel de sobrecarga (para pruebas o emergencias); `level: null` vuelve al modo automático."""
+    overload_controller.force(settings.level)
+    return overload_controller.snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Expone las métricas del servidor en formato de texto de Prometheus."""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/logging", dependencies=[Depends(require_admin)])
+async def get_logging_settings():
+    """Devuelve la configuración de logging, las partidas en depuración y los registros suprimidos."""
+    return get_logging_status()
+
+@app.put("/debug/logging/games/{game_code}", dependencies=[Depends(require_admin)])
+async def enable_game_debug_logging(game_code: str):
+    """Loggea todo (incluido DEBUG, sin muestreo ni límites) para la partida indicada."""
+    set_game_debug(game_code.strip().upper(), True)
+    return get_logging_status()
+
+@app.delete("/debug/logging/games/{game_code}", dependencies=[Depends(require_admin)])
+async def disable_game_debug_logging(game_code: str):
+    """Devuelve la partida indicada al logging normal (muestreado y limitado)."""
+    set_game_debug(game_code.strip().upper(), False)
+    return get_logging_status()
+
+
+# --- Imágenes de las Preguntas (ver media.py) ---
+
+def _require_quiz_media(quiz: QuizData):
+    """Rechaza (400) un quiz que usa imágenes que no están en el almacén."""
+    missing = missing_media(quiz, media_store)
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Falta la imagen de la(s) pregunta(s) {', '.join(map(str, missing))}.")
+
+
+@app.post("/media", status_code=status.HTTP_201_CREATED)
+async def upload_media(request: Request):
+    """
+    Sube una imagen (cuerpo: los bytes de la imagen) y devuelve su ID para `media_id` en las preguntas.
+
+    El ID es el hash del contenido: subir la misma imagen de nuevo devuelve el mismo ID.
+    """
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MEDIA_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"La imagen supera el tamaño máximo ({MEDIA_MAX_BYTES // 1024} KB).")
+        chunks.append(chunk)
+    try:
+        media_id = await asyncio.to_thread(media_store.put, b"".join(chunks))
+    except MediaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"media_id": media_id, "url": media_url(media_id)}
+
+
+@app.get("/media/{media_id}", include_in_schema=False)
+async def get_media(media_id: str, range: Optional[str] = Header(default=None), if_none_match: Optional[str] = Header(default=None)):
+    """
+    Sirve una imagen con caché "immutable", ETag y soporte de rangos (`Range: bytes=a-b`).
+
+    Se sirve desde la caché en memoria si está; si no, se lee del disco en un hilo.
+    """
+    if not is_media_id(media_id):
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    etag = f'"{media_id.split(".", 1)[0]}"'
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if if_none_match is not None and etag in if_none_match:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    data = media_store.get_cached(media_id)
+    if data is None:
+        data = await asyncio.to_thread(media_store.get, media_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    media_type = content_type(media_id)
+    if range is None:
+        return Response(content=data, media_type=media_type, headers=headers)
+    byte_range = _parse_byte_range(range, len(data))
+    if byte_range is None:
+        headers["Content-Range"] = f"bytes */{len(data)}"
+        return Response(status_code=416, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    return Response(content=data[start:end + 1], status_code=status.HTTP_206_PARTIAL_CONTENT, media_type=media_type, headers=headers)
+
+
+def _parse_byte_range(header: str, size: int) -> Optional[tuple]:
+    """(inicio, fin) inclusivos de una cabecera 'Range: bytes=...' con un solo rango, o None si no es satisfacible."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            length = int(last) # Sufijo: los últimos N bytes
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+# --- Torneos (ver tournament.py) ---
+
+@app.post("/tournaments", status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_admin)])
+async def create_tournament(request: TournamentCreateRequest):
+    """
+    Crea un torneo: `rooms` salas con el mismo quiz ya cargado y sin host.
+
+    Los jugadores se unen a las salas con su código, como a cualquier
+    partida; el torneo empieza en todas a la vez con POST /tournaments/{id}/start.
+    """
+    if draining:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="El servidor se está reiniciando. Inténtalo de nuevo en unos segundos.")
+    _require_quiz_media(request.quiz)
+    # Olvidar los torneos terminados cuyas salas ya se cerraron
+    for tournament_id, old in list(active_tournaments.items()):
+        if old.finished and not any(code in active_games for code in old.game_codes):
+            del active_tournaments[tournament_id]
+    tournament = Tournament(secrets.token_hex(4), [])
+    for _ in range(request.rooms):
+        game_code = _generate_game_code()
+        active_games[game_code] = Game(game_code=game_code, quiz_data=request.quiz, tournament=tournament,
+                                       event_log=open_event_log(game_code))
+        tournament.game_codes.append(game_code)
+    active_tournaments[tournament.tournament_id] = tournament
+    logger.info(f"Tournament {tournament.tournament_id} created with {request.rooms} rooms for quiz '{request.quiz.title}'.")
+    return {"tournament_id": tournament.tournament_id, "game_codes": tournament.game_codes}
+
+
+@app.get("/tournaments/{tournament_id}", dependencies=[Depends(require_admin)])
+async def get_tournament(tournament_id: str):
+    """Estado de un torneo: salas (estado y jugadores) y última clasificación global."""
+    tournament = active_tournaments.get(tournament_id)
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Torneo no encontrado")
+    result = tournament.snapshot()
+    result["rooms"] = [
+        {"game_code": code, "state": game.state.value, "players": get_real_player_count(game)}
+        if (game := active_games.get(code)) is not None else {"game_code": code, "state": "closed", "players": 0}
+        for code in tournament.game_codes
+    ]
+    return result
+
+
+@app.post("/tournaments/{tournament_id}/start", dependencies=[Depends(require_admin)])
+async def start_tournament_rooms(tournament_id: str):
+    """
+    Inicia el torneo en todas sus salas a la vez.
+
+    Las salas que siguen vacías quedan fuera del torneo (se indican en 'skipped').
+    """
+    tournament = active_tournaments.get(tournament_id)
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Torneo no encontrado")
+    if draining:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="El servidor se está reiniciando. Inténtalo de nuevo en unos segundos.")
+    if tournament.started:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El torneo ya ha empezado")
+    all_codes = list(tournament.game_codes)
+    started = start_tournament(active_games, tournament)
+    if not started:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ninguna sala tiene jugadores")
+    return {"tournament_id": tournament_id, "started": started,
+            "skipped": [code for code in all_codes if code not in started]}
+
+
+# --- Tareas a tu ritmo (ver homework.py) ---
+
+def _get_assignment(assignment_id: str) -> HomeworkAssignment:
+    assignment = active_assignments.get(assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return assignment
+
+
+def _get_homework_player(assignment: HomeworkAssignment, token: Optional[str]) -> int:
+    player_id = assignment.player_from_token(token)
+    if player_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token de alumno inválido o ausente.")
+    return player_id
+
+
+@app.post("/assignments", status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_admin)])
+async def create_assignment(request: HomeworkCreateRequest):
+    """
+    Crea una tarea: un quiz que cada alumno hace a su ritmo hasta `due_in_hours`.
+
+    Los alumnos usan los endpoints /assignments/{id}/enroll, /question,
+    /answer y /leaderboard, con peticiones HTTP cortas y sin WebSocket.
+    """
+    if draining:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="El servidor se está reiniciando. Inténtalo de nuevo en unos segundos.")
+    _require_quiz_media(request.quiz)
+    # Olvidar las tareas cerradas
+    now = time.time()
+    for assignment_id, old in list(active_assignments.items()):
+        if not old.is_open(now):
+            del active_assignments[assignment_id]
+    try:
+        assignment = HomeworkAssignment(secrets.token_hex(4), request.quiz, now + request.due_in_hours * 3600)
+    except HomeworkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    active_assignments[assignment.assignment_id] = assignment
+    logger.info(f"Assignment {assignment.assignment_id} created for quiz '{request.quiz.title}', closes in {request.due_in_hours}h.")
+    return {"assignment_id": assignment.assignment_id, "question_count": assignment.question_count,
+            "closes_at": assignment.closes_at}
+
+
+@app.get("/assignments/{assignment_id}", dependencies=[Depends(require_admin)])
+async def get_assignment(assignment_id: str):
+    """Estado de una tarea: alumnos inscritos, cuántos terminaron y el marcador."""
+    return _get_assignment(assignment_id).snapshot()
+
+
+@app.get("/assignments/{assignment_id}/results", dependencies=[Depends(require_admin)])
+async def export_assignment_results(assignment_id: str, format: str = "csv"):
+    """Exporta en streaming las respuestas de una tarea (mismo formato que GET /games/{code}/results)."""
+    assignment = _get_assignment(assignment_id)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: '{format}' (usa csv o ndjson)")
+    return StreamingResponse(
+        stream_results(assignment.answer_log, assignment.final_ranks(), format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="results_{assignment_id}.{format}"'}
+    )
+
+
+@app.post("/assignments/{assignment_id}/enroll", status_code=status.HTTP_201_CREATED)
+async def enroll_in_assignment(assignment_id: str, request: HomeworkEnrollRequest):
+    """Inscribe a un alumno; el token devuelto va en la cabecera 'X-Homework-Token' de las demás peticiones."""
+    assignment = _get_assignment(assignment_id)
+    try:
+        player_id, token = assignment.enroll(request.nickname)
+    except HomeworkError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"nickname": assignment.nickname(player_id), "player_token": token,
+            "question_count": assignment.question_count, "closes_at": assignment.closes_at}
+
+
+@app.get("/assignments/{assignment_id}/question", response_model=HomeworkQuestionPayload)
+async def get_assignment_question(assignment_id: str, x_homework_token: Optional[str] = Header(default=None)):
+    """Pregunta por la que va el alumno; su tiempo empieza a contar la primera vez que la pide."""
+    assignment = _get_assignment(assignment_id)
+    player_id = _get_homework_player(assignment, x_homework_token)
+    try:
+        question, time_remaining = assignment.current_question(player_id, time.time())
+    except HomeworkError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return HomeworkQuestionPayload(
+        question=question,
+        time_remaining=time_remaining,
+        score=assignment.scores[player_id],
+        rank=assignment.rank_of(player_id),
+        finished=question is None,
+    )
+
+
+@app.post("/assignments/{assignment_id}/answer")
+async def submit_assignment_answer(assignment_id: str, payload: SubmitAnswerPayload,
+                                   x_homework_token: Optional[str] = Header(default=None)):
+    """Responde la pregunta actual del alumno (mismo resultado que 'answer_result' en directo)."""
+    received_time = time.time() # Se puntúa con el momento de recepción, como en directo
+    assignment = _get_assignment(assignment_id)
+    player_id = _get_homework_player(assignment, x_homework_token)
+    try:
+        return assignment.submit_answer(player_id, payload.answer_id, received_time)
+    except HomeworkError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@app.get("/assignments/{assignment_id}/leaderboard", response_model=HomeworkLeaderboardPayload)
+async def get_assignment_leaderboard(assignment_id: str, top: int = HOMEWORK_TOP_K,
+                                     x_homework_token: Optional[str] = Header(default=None)):
+    """Primeros del marcador de la tarea y, si se envía el token, el puesto del alumno."""
+    assignment = _get_assignment(assignment_id)
+    player_id = assignment.player_from_token(x_homework_token)
+    return HomeworkLeaderboardPayload(
+        player_count=assignment.player_count,
+        top=assignment.top(max(1, min(top, 100))),
+        my_rank=assignment.rank_of(player_id) if player_id is not None else None,
+        my_score=assignment.scores[player_id] if player_id is not None else None,
+    )
+
+
+# --- Introspección de Partidas Activas (ver introspection.py) ---
+
+@app.get("/games", response_model=GamePage, dependencies=[Depends(require_admin)])
+async def get_games(offset: int = Query(0, ge=0), limit: int = Query(GAMES_PAGE_DEFAULT, ge=1, le=GAMES_PAGE_MAX),
+                    state: Optional[GameStateEnum] = None, min_players: Optional[int] = Query(None, ge=0),
+                    max_players: Optional[int] = Query(None, ge=0), min_age: Optional[float] = Query(None, ge=0),
+                    max_age: Optional[float] = Query(None, ge=0), quiz: Optional[str] = None):
+    """
+    Lista las partidas activas, por orden de creación, con paginación y filtros.
+
+    Filtros: estado, rango de jugadores reales, rango de antigüedad (segundos)
+    y texto del título del cuestionario. Cada partida se resume con contadores
+    O(1): no se recorren sus jugadores.
+    """
+    return await list_games(active_games, offset, limit, state, min_players, max_players, min_age, max_age, quiz)
+
+
+@app.get("/games/{game_code}", response_model=GameDetail, dependencies=[Depends(require_admin)])
+async def get_game(game_code: str, players_offset: int = Query(0, ge=0),
+                   players_limit: int = Query(GAME_PLAYERS_PAGE_DEFAULT, ge=1, le=GAME_PLAYERS_PAGE_MAX)):
+    """Vista detallada de una partida: temporizadores, colas de entrada y salida y una página de jugadores."""
+    game = active_games.get(game_code.strip().upper())
+    if not game:
+        raise HTTPException(status_code=404, detail="Partida no encontrada")
+    return game_detail(game, players_offset, players_limit)
+
+
+# --- Exportación de Resultados ---
+
+@app.get("/games/{game_code}/results", dependencies=[Depends(require_admin)])
+async def export_game_results(game_code: str, format: str = "csv"):
+    """
+    Exporta en streaming las respuestas de una partida (CSV o NDJSON).
+
+    Una fila por jugador y pregunta respondida: respuesta, si fue correcta,
+    puntos y tiempo de respuesta, más el rango y la puntuación final del
+    jugador. Las filas se generan por bloques desde el registro compacto de la
+    partida (ver results.py), sin materializar la exportación completa.
+    """
+    game = active_games.get(game_code.strip().upper())
+    if not game:
+        raise HTTPException(status_code=404, detail="Partida no encontrada")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: '{format}' (usa csv o ndjson)")
+    # El marcador se calcula una sola vez al empezar (tamaño: un elemento por jugador)
+    final_ranks = {entry.nickname: (entry.rank, entry.score) for entry in get_player_only_scoreboard(game)}
+    return StreamingResponse(
+        stream_results(game.answer_log, final_ranks, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="results_{game.game_code}.{format}"'}
+    )
 
 
 # --- Endpoints HTML para Servir las Interfaces de Usuario ---
@@ -371,6 +1055,17 @@ async def get_host_client():
          logger.error("Host interface file 'host.html' not found.")
          return HTMLResponse(content="<h1>Error: Archivo de interfaz de anfitrión no encontrado.</h1>", status_code=404)
 
+@app.get("/watch.html", response_class=HTMLResponse)
+async def get_spectator_client():
+    """Sirve el archivo HTML para la vista de espectador (solo lectura)."""
+    try:
+        with open("watch.html", "r", encoding="utf-8") as f:
+            html_content = f.read()
+        return HTMLResponse(content=html_content)
+    except FileNotFoundError:
+         logger.error("Spectator interface file 'watch.html' not found.")
+         return HTMLResponse(content="<h1>Error: Archivo de vista de espectador no encontrado.</h1>", status_code=404)
+
 
 # --- Punto de Entrada para Ejecutar el Servidor (si se corre directamente) ---
 if __name__ == "__main__":
@@ -380,4 +1075,8 @@ if __name__ == "__main__":
     # reload=False es importante para producción o cuando no se necesita recarga automática
     # host="0.0.0.0" permite conexiones desde otras máquinas en la red
     # port=8000 es el puerto estándar para desarrollo web
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False)
+    # log_config=None: los logs de uvicorn también pasan por la cola de logging_setup
+    # ws_max_size: tope a nivel de protocolo, por encima del mayor límite de admisión de la aplicación
+    # ws_per_message_deflate: compresión del transporte para clientes que la negocian (QUIZ_WS_DEFLATE=0 la desactiva)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False, log_config=None,
+                ws_max_size=admission.limits.max_frame_bytes_host * 4, ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE)
@@ -0,0 +1,167 @@
+# media.py
+"""
+Imágenes de las preguntas: almacén por hash de contenido con caché en memoria.
+
+Cada imagen se sube una vez (`POST /media`) y se guarda en disco con su
+SHA-256 como nombre (`<hash>.<ext>`): subir la misma imagen dos veces no
+ocupa más, y el ID identifica el contenido para siempre. Por eso se sirve
+(`GET /media/{id}`) con caché "immutable" de un año, ETag y soporte de
+rangos: un navegador que ya la tiene no vuelve a pedirla.
+
+Las más pedidas se guardan en una caché LRU en memoria (hasta
+MEDIA_MEMORY_CACHE_BYTES), así que una sala de 500 jugadores descargando la
+misma imagen solo lee el disco una vez. Además, los clientes descargan las
+imágenes del quiz en el lobby ('media_prefetch') y la de la siguiente
+pregunta durante el marcador ('question_prefetch'): durante una pregunta no
+hay transferencias grandes.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+MEDIA_DIR = os.environ.get("QUIZ_MEDIA_DIR", "media") # Directorio del almacén de imágenes
+MEDIA_MAX_BYTES = int(os.environ.get("QUIZ_MEDIA_MAX_BYTES", str(2 * 1024 * 1024))) # Tamaño máximo de una imagen
+MEDIA_DISK_QUOTA_BYTES = int(os.environ.get("QUIZ_MEDIA_DISK_QUOTA_BYTES", str(1024 ** 3))) # Tamaño máximo del almacén en disco
+MEDIA_MEMORY_CACHE_BYTES = int(os.environ.get("QUIZ_MEDIA_CACHE_BYTES", str(64 * 1024 * 1024))) # Caché LRU en memoria
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable" # El ID es el hash del contenido: nunca cambia
+MEDIA_TYPES = {"png": "image/png", "jpg": "image/jpeg", "gif": "image/gif", "webp": "image/webp"}
+MEDIA_ID_PATTERN = r"^[0-9a-f]{64}\.(png|jpg|gif|webp)$"
+
+_MEDIA_ID_RE = re.compile(MEDIA_ID_PATTERN)
+
+
+class MediaError(Exception):
+    """Imagen rechazada al subirla (el mensaje es para el usuario)."""
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    """Extensión de la imagen según sus primeros bytes (no se confía en el Content-Type), o None."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def is_media_id(media_id: str) -> bool:
+    return bool(_MEDIA_ID_RE.match(media_id))
+
+
+def media_url(media_id: str) -> str:
+    """URL pública de una imagen."""
+    return f"/media/{media_id}"
+
+
+def content_type(media_id: str) -> str:
+    return MEDIA_TYPES[media_id.rsplit(".", 1)[1]]
+
+
+class MediaStore:
+    """Almacén de imágenes por hash de contenido (disco) con caché LRU en memoria."""
+
+    def __init__(self, directory: str = MEDIA_DIR, cache_bytes: int = MEDIA_MEMORY_CACHE_BYTES):
+        self.directory = directory
+        self.cache_bytes = cache_bytes
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._cached_size = 0
+        self._disk_size: Optional[int] = None # Se calcula al subir la primera imagen
+        self._lock = threading.Lock() # Las lecturas y escrituras de disco se hacen en hilos (asyncio.to_thread)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, media_id: str) -> str:
+        return os.path.join(self.directory, media_id)
+
+    def put(self, data: bytes) -> str:
+        """
+        Guarda una imagen (si no estaba ya) y devuelve su ID.
+
+        Raises:
+            MediaError: Si no es una imagen admitida, es demasiado grande o el almacén está lleno.
+        """
+        if len(data) > MEDIA_MAX_BYTES:
+            raise MediaError(f"La imagen supera el tamaño máximo ({MEDIA_MAX_BYTES // 1024} KB).")
+        extension = sniff_image_type(data)
+        if extension is None:
+            raise MediaError("Formato de imagen no admitido (usa PNG, JPEG, GIF o WebP).")
+        media_id = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self._path(media_id)
+        with self._lock:
+            if os.path.exists(path):
+                return media_id # Misma imagen ya subida
+            if self._disk_size is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._disk_size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+            if self._disk_size + len(data) > MEDIA_DISK_QUOTA_BYTES:
+                logger.error("Media store full (%d bytes); rejecting upload of %d bytes.", self._disk_size, len(data))
+                raise MediaError("El almacén de imágenes está lleno.")
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(data)
+            os.replace(temporary_path, path) # Nunca se sirve una imagen a medio escribir
+            self._disk_size += len(data)
+            self._remember(media_id, data)
+        logger.info("Stored media %s (%d bytes).", media_id, len(data))
+        return media_id
+
+    def get_cached(self, media_id: str) -> Optional[bytes]:
+        """Imagen desde la caché en memoria (sin tocar el disco), o None."""
+        with self._lock:
+            data = self._cache.get(media_id)
+            if data is not None:
+                self._cache.move_to_end(media_id)
+                self.hits += 1
+            return data
+
+    def get(self, media_id: str) -> Optional[bytes]:
+        """Imagen desde la caché o el disco (bloqueante: llamar con asyncio.to_thread), o None si no existe."""
+        data = self.get_cached(media_id)
+        if data is not None:
+            return data
+        try:
+            with open(self._path(media_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.misses += 1
+            self._remember(media_id, data)
+        return data
+
+    def exists(self, media_id: str) -> bool:
+        return media_id in self._cache or os.path.exists(self._path(media_id))
+
+    def _remember(self, media_id: str, data: bytes):
+        """Añade una imagen a la caché LRU, expulsando las menos usadas (con el lock tomado)."""
+        if len(data) > self.cache_bytes // 8 or media_id in self._cache:
+            return # Las muy grandes no desplazan a todas las demás
+        self._cache[media_id] = data
+        self._cached_size += len(data)
+        while self._cached_size > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_size -= len(evicted)
+
+
+def quiz_media_ids(quiz) -> List[str]:
+    """IDs de las imágenes de un quiz, sin repetir y en orden de aparición."""
+    return list(dict.fromkeys(question.media_id for question in quiz.questions if question.media_id))
+
+
+def missing_media(quiz, store: "MediaStore") -> List[int]:
+    """Números (1-based) de las preguntas cuya imagen no está en el almacén."""
+    return [number for number, question in enumerate(quiz.questions, start=1)
+            if question.media_id and not store.exists(question.media_id)]
+
+
+media_store = MediaStore()
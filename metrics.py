@@ -0,0 +1,92 @@
+# metrics.py
+"""
+Registro mínimo de métricas del servidor, expuesto en formato de texto de
+Prometheus en el endpoint `/metrics` (ver main.py).
+
+Solo contadores y gauges con etiquetas opcionales; sin dependencias externas.
+Actualizar una métrica es una operación de diccionario, apta para los
+caminos calientes del bucle de eventos.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        REGISTRY.append(self)
+
+    def samples(self) -> List[Tuple[LabelValues, float]]:
+        return list(self._values.items())
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.samples():
+            if labels:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+                lines.append(f"{self.name}{{{label_str}}} {_format_value(value)}")
+            else:
+                lines.append(f"{self.name} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Contador monótono creciente."""
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Valor que puede subir y bajar.
+
+    Si se indica `callback`, el valor se calcula al renderizar (útil para
+    exponer contadores que ya mantiene otro módulo sin duplicarlos).
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._callback = callback
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def samples(self) -> List[Tuple[LabelValues, float]]:
+        if self._callback is not None:
+            return list(self._callback().items())
+        return super().samples()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """Devuelve todas las métricas registradas en formato de texto de Prometheus."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -9,11 +9,19 @@ Incluye:
 """
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, NamedTuple, Optional, Any
 from enum import Enum
+import time
 import uuid # Para generar IDs por defecto
 
-from fastapi import WebSocket # Para tipar conexiones WebSocket
+from registry import ConnectionRegistry, ScoreRanking # Tabla de conexiones por conn_id y puestos de los jugadores de cada partida
+from spectators import SpectatorChannel # Espectadores de cada partida (/ws/{code}/watch)
+from game_actor import GameActor # Cola de comandos que serializa los cambios de estado de cada partida
+from results import AnswerLog # Registro compacto de respuestas para exportar resultados
+from event_log import EventLog # Registro de eventos de cada partida (para reproducirla con replay.py)
+from tournament import TOURNAMENT_MAX_ROOMS, Tournament # Torneos de varias salas con clasificación global
+from teams import TeamStandings # Equipos de cada partida con sus agregados incrementales
+from media import MEDIA_ID_PATTERN # Imágenes de las preguntas (almacén por hash de contenido)
 
 # --- Modelos de Datos Internos ---
 
@@ -38,12 +46,14 @@ class QuestionData(BaseModel):
     text: str = Field(..., description="Texto de la pregunta")
     options: List[OptionData] = Field(..., min_length=2, max_length=4, description="Lista de opciones (entre 2 y 4)")
     time_limit: int = Field(default=20, ge=5, le=120, description="Tiempo límite en segundos para responder (entre 5 y 120)")
+    media_id: Optional[str] = Field(default=None, pattern=MEDIA_ID_PATTERN, description="Imagen opcional de la pregunta (ID devuelto por POST /media)")
 
 class QuizData(BaseModel):
     """Representa la estructura completa de un cuestionario cargado."""
     id: Optional[str] = Field(default_factory=lambda: f"quiz_{uuid.uuid4().hex[:10]}", description="ID único opcional del quiz; se generará si falta")
     title: str = Field(..., description="Título del Quiz")
     questions: List[QuestionData] = Field(..., description="Lista de preguntas que componen el quiz")
+    shuffle_options: bool = Field(default=True, description="Mostrar las opciones en distinto orden a cada jugador (False para preguntas tipo 'todas las anteriores')")
 
 # --- Modelos Procesados/Utilizados Durante el Juego ---
 
@@ -59,17 +69,38 @@ class Question(BaseModel):
     options: List[Option] = Field(..., description="Lista de opciones (con IDs) para mostrar al jugador")
     correct_answer_id: str = Field(..., description="ID de la opción correcta (usado internamente para validar)")
     time_limit: int = Field(default=15, description="Tiempo límite en segundos")
+    media_url: Optional[str] = Field(default=None, description="URL de la imagen de la pregunta, si tiene")
 
 class Player(BaseModel):
-    """Representa a un jugador conectado a una partida."""
-    nickname: str = Field(..., description="Nombre elegido por el jugador")
-    connection: WebSocket = Field(..., exclude=True, description="Referencia a la conexión WebSocket del jugador")
-    score: int = Field(default=0, description="Puntuación acumulada del jugador")
-    last_answer_time: Optional[float] = Field(default=None, description="Timestamp de la última respuesta enviada (para desempates o análisis)")
-    has_answered_current_question: bool = Field(default=False, description="Flag para indicar si ya respondió la pregunta actual")
+    """
+    Representa a un jugador conectado a una partida.
 
-    class Config:
-        arbitrary_types_allowed = True # Permite el tipo WebSocket
+    La conexión, la puntuación y el estado de respuesta no se guardan aquí:
+    viven en `Game.connections` (ConnectionRegistry), indexados por `conn_id`.
+    """
+    nickname: str = Field(..., description="Nombre elegido por el jugador")
+    conn_id: int = Field(..., description="ID de la conexión del jugador en Game.connections")
+    reconnect_token: Optional[str] = Field(default=None, exclude=True, description="Token secreto para recuperar la sesión tras una desconexión (None para el host)")
+    team_id: Optional[int] = Field(default=None, exclude=True, description="ID del equipo del jugador en Game.teams (None si juega sin equipo)")
+
+class DetachedPlayer(NamedTuple):
+    """
+    Forma compacta de un jugador desconectado durante el periodo de gracia.
+
+    Conserva solo lo necesario para reanudar la sesión con `resume_session`
+    sin mantener la conexión ni el objeto Player completo.
+    """
+    nickname: str
+    score: int
+    last_answer_time: Optional[float]
+    answered_question_index: Optional[int] # Índice de la pregunta ya respondida al desconectarse, si la había
+    detached_at: float
+    team_id: Optional[int] = None # ID del equipo en Game.teams (sigue contando como miembro)
+
+class PrefetchedQuestion(NamedTuple):
+    """Siguiente pregunta ya procesada y enviada oculta a los clientes ('question_prefetch')."""
+    question: "Question"
+    payload: "NewQuestionPayload"
 
 class AnswerRecord(BaseModel):
     """Almacena información sobre la respuesta de un jugador a una pregunta específica."""
@@ -82,18 +113,35 @@ class AnswerRecord(BaseModel):
 class Game(BaseModel):
     """Representa el estado completo de una partida en curso."""
     game_code: str = Field(..., description="Código único de 4 caracteres alfanuméricos (mayúsculas) que identifica la partida")
-    host_connection: Optional[WebSocket] = Field(default=None, exclude=True, description="Conexión WebSocket del anfitrión (host)")
+    host_id: Optional[int] = Field(default=None, exclude=True, description="conn_id del anfitrión (host)")
     quiz_data: Optional[QuizData] = Field(default=None, description="Datos del cuestionario cargado para esta partida")
-    players: Dict[WebSocket, Player] = Field(default_factory=dict, description="Diccionario que mapea conexiones WebSocket a objetos Player")
+    players: Dict[int, Player] = Field(default_factory=dict, description="Diccionario que mapea conn_id a objetos Player (incluye al host)")
     state: GameStateEnum = Field(default=GameStateEnum.LOBBY, description="Estado actual de la partida (Lobby, Pregunta, Marcador, Finalizada)")
     current_question_index: int = Field(default=-1, description="Índice de la pregunta actual dentro de quiz_data.questions")
     question_start_time: Optional[float] = Field(default=None, description="Timestamp (time.time()) de cuándo se envió la pregunta actual")
     answers_received_this_round: Dict[str, AnswerRecord] = Field(default_factory=dict, description="Registro de las respuestas recibidas para la pregunta actual (nickname -> AnswerRecord)")
-    active_connections: List[WebSocket] = Field(default_factory=list, exclude=True, description="Lista de todas las conexiones WebSocket activas en la partida (incluye host y jugadores)")
+    connections: ConnectionRegistry = Field(default_factory=ConnectionRegistry, exclude=True, description="Conexiones de la partida por conn_id; las activas (host y jugadores unidos) forman la lista de fan-out")
     current_correct_answer_id: Optional[str] = Field(default=None, exclude=True, description="ID de la respuesta correcta para la pregunta actual (cacheada para rápido acceso)")
+    current_question_payload: Optional["NewQuestionPayload"] = Field(default=None, exclude=True, description="Último payload 'new_question' enviado (para reenviarlo al reanudar sesiones)")
+    prefetched_question: Optional[PrefetchedQuestion] = Field(default=None, exclude=True, description="Siguiente pregunta ya enviada oculta, pendiente del 'reveal'")
+    player_tokens: Dict[str, int] = Field(default_factory=dict, exclude=True, description="Tokens de reconexión de los jugadores conectados (token -> conn_id)")
+    detached_players: Dict[str, DetachedPlayer] = Field(default_factory=dict, exclude=True, description="Jugadores desconectados en periodo de gracia (token -> DetachedPlayer)")
+    answer_counts: Dict[str, int] = Field(default_factory=dict, exclude=True, description="Respuestas recibidas por opción en la pregunta actual (option_id -> número)")
+    answered_count: int = Field(default=0, exclude=True, description="Respuestas recibidas en la pregunta actual")
+    spectators: SpectatorChannel = Field(default_factory=SpectatorChannel, exclude=True, description="Espectadores de solo lectura; no cuentan como jugadores")
+    detached_host: Optional[DetachedPlayer] = Field(default=None, exclude=True, description="Host pendiente de reconectar tras un reinicio del servidor (partida restaurada)")
+    host_reconnect_token: Optional[str] = Field(default=None, exclude=True, description="Token con el que el host reanuda su sesión tras un reinicio del servidor")
+    answer_log: AnswerLog = Field(default_factory=AnswerLog, exclude=True, description="Todas las respuestas aceptadas de la partida, en columnas (para GET /games/{code}/results)")
+    actor: GameActor = Field(default_factory=GameActor, exclude=True, description="Actor que aplica en orden todos los comandos que modifican esta partida")
+    event_log: Optional[EventLog] = Field(default=None, exclude=True, description="Registro de los comandos aplicados por el actor (None si QUIZ_EVENT_LOG_DIR no está definido)")
+    tournament: Optional[Tournament] = Field(default=None, exclude=True, description="Torneo al que pertenece esta sala (sin host: la dirige el torneo)")
+    created_at: float = Field(default_factory=time.time, exclude=True, description="Cuándo se creó la partida (o se restauró tras un reinicio)")
+    pending_lobby_update: Optional["WebSocketMessage"] = Field(default=None, exclude=True, description="Último 'player_joined'/'player_left' pendiente de enviar a los jugadores (lobby agrupado por sobrecarga)")
+    teams: TeamStandings = Field(default_factory=TeamStandings, exclude=True, description="Equipos de la partida: puntuación y miembros de cada uno, con su índice de puestos")
+    ranking: ScoreRanking = Field(default_factory=ScoreRanking, exclude=True, description="Puntuaciones ordenadas de los jugadores reales (para el puesto de cada 'answer_result')")
 
     class Config:
-        arbitrary_types_allowed = True # Permite el tipo WebSocket
+        arbitrary_types_allowed = True # Permite los tipos ConnectionRegistry, SpectatorChannel, AnswerLog, GameActor, EventLog, Tournament, TeamStandings y ScoreRanking
 
 # --- Modelos para Mensajes WebSocket (Protocolo Cliente <-> Servidor) ---
 
@@ -102,6 +150,11 @@ class Game(BaseModel):
 class JoinGamePayload(BaseModel):
     """Payload para el mensaje 'join_game' enviado por un jugador."""
     nickname: str = Field(..., description="Nickname que el jugador desea usar")
+    team: Optional[str] = Field(default=None, description="Nombre del equipo al que se une (opcional; sin distinguir mayúsculas)")
+
+class ResumeSessionPayload(BaseModel):
+    """Payload para el mensaje 'resume_session' enviado por un jugador que se reconecta."""
+    reconnect_token: str = Field(..., description="Token recibido en 'join_ack'")
 
 class SubmitAnswerPayload(BaseModel):
     """Payload para el mensaje 'submit_answer' enviado por un jugador."""
@@ -126,11 +179,14 @@ class JoinAckPayload(BaseModel):
     message: str = Field(..., description="Mensaje de bienvenida o estado")
     # --- AÑADIDO ---
     player_count: int = Field(..., description="Número total de jugadores reales (sin host) al momento de unirse")
+    reconnect_token: Optional[str] = Field(default=None, description="Token para reanudar la sesión con 'resume_session' si se pierde la conexión (no se envía al host)")
+    team: Optional[str] = Field(default=None, description="Equipo del jugador, con la grafía con la que se creó (None si juega sin equipo)")
 
 class PlayerJoinedPayload(BaseModel):
     """Payload para el mensaje 'player_joined' broadcast a todos."""
     nickname: str = Field(..., description="Nickname del jugador que se unió")
     player_count: int = Field(..., description="Número total de jugadores (sin host) actual")
+    team: Optional[str] = Field(default=None, description="Equipo del jugador que se unió, si tiene")
 
 class PlayerLeftPayload(BaseModel):
     """Payload para el mensaje 'player_left' broadcast a todos."""
@@ -149,6 +205,41 @@ class NewQuestionPayload(BaseModel):
     time_limit: int = Field(..., description="Tiempo límite en segundos para responder")
     question_number: int = Field(..., description="Número de la pregunta actual (empezando en 1)")
     total_questions: int = Field(..., description="Número total de preguntas en el quiz")
+    media_url: Optional[str] = Field(default=None, description="URL de la imagen de la pregunta, si tiene")
+
+class MediaPrefetchPayload(BaseModel):
+    """Payload para 'media_prefetch': imágenes del quiz que el cliente debe descargar ya (en el lobby)."""
+    urls: List[str] = Field(..., description="URLs de las imágenes, en orden de aparición")
+
+class RevealPayload(BaseModel):
+    """Payload para 'reveal': muestra a la vez la pregunta recibida antes en 'question_prefetch'."""
+    question_id: str = Field(..., description="ID de la pregunta a mostrar (la del último 'question_prefetch')")
+    question_number: int = Field(..., description="Número de la pregunta (empezando en 1)")
+    starts_at: float = Field(..., description="Hora del servidor (time.time()) en la que empieza la pregunta; el tiempo de respuesta se mide desde aquí")
+    delay_ms: int = Field(..., description="Milisegundos desde el envío hasta 'starts_at' (para clientes con el reloj desajustado)")
+
+class SessionResumedPayload(BaseModel):
+    """Payload para 'session_resumed': instantánea del estado enviada al jugador que reanuda su sesión."""
+    nickname: str = Field(..., description="Nickname del jugador")
+    state: GameStateEnum = Field(..., description="Estado actual de la partida")
+    score: int = Field(..., description="Puntuación acumulada del jugador")
+    rank: Optional[int] = Field(default=None, description="Posición actual del jugador en el marcador")
+    player_count: int = Field(..., description="Número de jugadores reales conectados")
+    question: Optional[NewQuestionPayload] = Field(default=None, description="Pregunta en curso (solo en QUESTION_DISPLAY)")
+    time_remaining: Optional[float] = Field(default=None, description="Segundos restantes para responder la pregunta en curso")
+    has_answered: bool = Field(default=False, description="Si el jugador ya respondió la pregunta en curso")
+
+class ServerRestartingPayload(BaseModel):
+    """Payload para 'server_restarting': el servidor se va a reiniciar y la partida se conservará."""
+    message: str = Field(..., description="Mensaje para mostrar al usuario")
+    reconnect_token: Optional[str] = Field(default=None, description="Token para 'resume_session' tras el reinicio (el del jugador o uno nuevo para el host)")
+
+class AnswerStatsPayload(BaseModel):
+    """Payload para 'answer_stats': distribución agregada de respuestas enviada periódicamente al host."""
+    question_number: int = Field(..., description="Número (1-based) de la pregunta a la que se refieren los datos")
+    answered_count: int = Field(..., description="Respuestas recibidas hasta ahora")
+    player_count: int = Field(..., description="Número de jugadores reales que pueden responder")
+    counts: Dict[str, int] = Field(..., description="Respuestas por opción (option_id -> número)")
 
 class AnswerResultPayload(BaseModel):
     """Payload para el mensaje 'answer_result' enviado al jugador que respondió."""
@@ -164,15 +255,57 @@ class ScoreboardEntry(BaseModel):
     nickname: str = Field(..., description="Nickname del jugador")
     score: int = Field(..., description="Puntuación del jugador")
 
+class TeamScoreboardEntry(BaseModel):
+    """Representa un equipo en la clasificación de equipos."""
+    rank: int = Field(..., description="Posición del equipo (1 es el primero)")
+    team: str = Field(..., description="Nombre del equipo")
+    score: int = Field(..., description="Suma de las puntuaciones de sus miembros")
+    members: int = Field(..., description="Miembros actuales del equipo")
+    average_score: float = Field(..., description="Puntuación media por miembro")
+
 class UpdateScoreboardPayload(BaseModel):
-    """Payload para el mensaje 'update_scoreboard' broadcast a todos."""
+    """Payload para el mensaje 'update_scoreboard' (el host recibe el marcador completo; cada jugador, los primeros y su propio puesto)."""
     scoreboard: List[ScoreboardEntry] = Field(..., description="Lista ordenada de jugadores y sus puntuaciones")
+    teams: Optional[List[TeamScoreboardEntry]] = Field(default=None, description="Clasificación de equipos (solo si algún jugador se unió con equipo)")
+    current_score: Optional[int] = Field(default=None, description="Puntuación del jugador que recibe el mensaje (no se envía al host)")
+    current_rank: Optional[int] = Field(default=None, description="Puesto del jugador que recibe el mensaje (no se envía al host)")
+
+class SpectateAckPayload(BaseModel):
+    """Payload para el mensaje 'spectate_ack' enviado al espectador que se conecta."""
+    game_code: str = Field(..., description="Código de la partida observada")
+    state: GameStateEnum = Field(..., description="Estado actual de la partida")
+    player_count: int = Field(..., description="Número de jugadores reales (sin host)")
+    spectator_count: int = Field(..., description="Número de espectadores conectados")
 
 class GameOverPayload(BaseModel):
     """Payload para el mensaje 'game_over' enviado a cada jugador."""
     podium: List[ScoreboardEntry] = Field(..., description="Los 3 mejores jugadores (o menos si hay menos jugadores, excluyendo al host)")
     my_final_rank: Optional[int] = Field(default=None, description="El rango final específico de este jugador entre todos los jugadores (excluyendo host)")
     my_final_score: Optional[int] = Field(default=None, description="La puntuación final específica de este jugador")
+    my_global_rank: Optional[int] = Field(default=None, description="Puesto final del jugador en la clasificación global (solo en torneos)")
+    teams: Optional[List[TeamScoreboardEntry]] = Field(default=None, description="Clasificación final de equipos (solo si algún jugador se unió con equipo)")
+    my_team_rank: Optional[int] = Field(default=None, description="Puesto final del equipo del jugador, si tiene")
+
+class GlobalScoreboardEntry(BaseModel):
+    """Entrada de la clasificación global de un torneo."""
+    rank: int = Field(..., description="Puesto global (1 es el primero)")
+    nickname: str = Field(..., description="Nickname del jugador")
+    score: int = Field(..., description="Puntuación del jugador")
+    game_code: str = Field(..., description="Sala del jugador")
+
+class GlobalLeaderboardPayload(BaseModel):
+    """Payload para 'global_leaderboard': top-K del torneo, igual para todas las salas."""
+    tournament_id: str = Field(..., description="ID del torneo")
+    question_number: int = Field(..., description="Pregunta tras la que se calculó (empezando en 1)")
+    room_count: int = Field(..., description="Número de salas del torneo")
+    player_count: int = Field(..., description="Número de jugadores clasificados en todas las salas")
+    top: List[GlobalScoreboardEntry] = Field(..., description="Mejores jugadores del torneo")
+
+class GlobalRankPayload(BaseModel):
+    """Payload para 'global_rank': puesto del jugador en la clasificación global del torneo."""
+    rank: int = Field(..., description="Puesto global del jugador")
+    score: int = Field(..., description="Puntuación del jugador")
+    player_count: int = Field(..., description="Número de jugadores clasificados en todas las salas")
 
 class ErrorPayload(BaseModel):
     """Payload para mensajes de 'error' enviados a un cliente específico o broadcast."""
@@ -183,3 +316,101 @@ class WebSocketMessage(BaseModel):
     """Estructura estándar para todos los mensajes WebSocket."""
     type: str = Field(..., description="Tipo de mensaje (ej: 'join_game', 'new_question')")
     payload: Optional[Any] = Field(default=None, description="Datos asociados al mensaje, varía según el tipo")
+
+# --- Modelos para Endpoints de Administración / Diagnóstico ---
+
+class DiagnosticsSettings(BaseModel):
+    """Cuerpo de la petición para activar/desactivar diagnósticos en tiempo de ejecución."""
+    loop_monitor: Optional[bool] = Field(default=None, description="Activa o desactiva el muestreador de lag del bucle de eventos")
+    handler_tracing: Optional[bool] = Field(default=None, description="Activa o desactiva el trazado de latencia de manejadores")
+    slow_threshold_ms: Optional[float] = Field(default=None, gt=0, description="Umbral (ms) a partir del cual un manejador se considera lento")
+    reset: bool = Field(default=False, description="Si es True, reinicia las estadísticas acumuladas")
+
+class GameSummary(BaseModel):
+    """Resumen de una partida activa (GET /games). Todos los campos salen de contadores O(1) de la partida."""
+    game_code: str = Field(..., description="Código de la partida")
+    state: GameStateEnum = Field(..., description="Estado actual")
+    quiz_title: Optional[str] = Field(default=None, description="Título del cuestionario cargado (None si aún no hay)")
+    player_count: int = Field(..., description="Jugadores reales conectados (sin host)")
+    connected_count: int = Field(..., description="Conexiones activas (host incluido)")
+    detached_count: int = Field(..., description="Jugadores desconectados en periodo de gracia")
+    spectator_count: int = Field(..., description="Espectadores conectados")
+    question_number: Optional[int] = Field(default=None, description="Pregunta actual (1-based); None antes de empezar")
+    total_questions: Optional[int] = Field(default=None, description="Preguntas del cuestionario")
+    answered_count: int = Field(..., description="Respuestas recibidas en la pregunta actual")
+    age_seconds: float = Field(..., description="Segundos desde que se creó (o restauró) la partida")
+    tournament_id: Optional[str] = Field(default=None, description="Torneo al que pertenece la sala, si es el caso")
+
+class GamePage(BaseModel):
+    """Una página del listado de partidas activas."""
+    total: int = Field(..., description="Partidas que cumplen los filtros")
+    offset: int = Field(..., description="Posición de la primera partida de la página")
+    limit: int = Field(..., description="Tamaño máximo de la página")
+    games: List[GameSummary] = Field(..., description="Partidas de esta página, por orden de creación")
+
+class GamePlayerInfo(BaseModel):
+    """Un jugador en la vista detallada de una partida."""
+    nickname: str
+    score: int
+    connected: bool = Field(..., description="False si está en periodo de gracia")
+    answered: bool = Field(..., description="Si ya respondió la pregunta actual")
+    is_host: bool = False
+    team: Optional[str] = None
+
+class GameDetail(GameSummary):
+    """Vista detallada de una partida (GET /games/{game_code})."""
+    question_started_at: Optional[float] = Field(default=None, description="Hora del servidor a la que empezó la pregunta actual")
+    question_time_limit: Optional[int] = Field(default=None, description="Segundos de la pregunta actual")
+    question_time_remaining: Optional[float] = Field(default=None, description="Segundos que le quedan a la pregunta actual (solo mientras se muestra)")
+    actor_queue_depth: int = Field(..., description="Comandos pendientes en la cola del actor de la partida")
+    actor_last_queue_delay_ms: float = Field(..., description="Espera en cola del primer comando del último lote")
+    outbound_pending: int = Field(..., description="Mensajes de salida pendientes de agrupar (conexiones con '?caps=batch')")
+    players_offset: int = Field(..., description="Posición del primer jugador de `players`")
+    players: List[GamePlayerInfo] = Field(..., description="Una página de jugadores: conectados por orden de unión y después los desconectados en periodo de gracia")
+
+class TournamentCreateRequest(BaseModel):
+    """Cuerpo de la petición para crear un torneo."""
+    rooms: int = Field(..., ge=1, le=TOURNAMENT_MAX_ROOMS, description="Número de salas (partidas) del torneo")
+    quiz: QuizData = Field(..., description="Cuestionario común a todas las salas")
+
+class HomeworkCreateRequest(BaseModel):
+    """Cuerpo de la petición para crear una tarea (modo a tu ritmo, ver homework.py)."""
+    quiz: QuizData = Field(..., description="Cuestionario de la tarea")
+    due_in_hours: float = Field(default=72, gt=0, le=24 * 60, description="Horas hasta el cierre de la tarea")
+
+class HomeworkEnrollRequest(BaseModel):
+    """Cuerpo de la petición de un alumno para inscribirse en una tarea."""
+    nickname: str = Field(..., max_length=20, description="Nickname que el alumno desea usar")
+
+class HomeworkQuestionPayload(BaseModel):
+    """Respuesta de GET /assignments/{id}/question: la pregunta por la que va el alumno."""
+    question: Optional[NewQuestionPayload] = Field(default=None, description="Pregunta actual (None si ya terminó la tarea)")
+    time_remaining: Optional[float] = Field(default=None, description="Segundos que le quedan para responder con puntos")
+    score: int = Field(..., description="Puntuación acumulada del alumno")
+    rank: int = Field(..., description="Posición actual del alumno en el marcador de la tarea")
+    finished: bool = Field(..., description="Si el alumno ya respondió todas las preguntas")
+
+class HomeworkLeaderboardPayload(BaseModel):
+    """Respuesta de GET /assignments/{id}/leaderboard."""
+    player_count: int = Field(..., description="Alumnos inscritos")
+    top: List[ScoreboardEntry] = Field(..., description="Primeros del marcador")
+    my_rank: Optional[int] = Field(default=None, description="Posición del alumno (si envía su token)")
+    my_score: Optional[int] = Field(default=None, description="Puntuación del alumno (si envía su token)")
+
+class OverloadSettings(BaseModel):
+    """Cuerpo de la petición para fijar a mano el nivel de sobrecarga (ver overload.py)."""
+    level: Optional[int] = Field(default=None, ge=0, le=4, description="Nivel fijo (0 = normal, 4 = rechazar partidas nuevas); null vuelve al modo automático")
+
+class AdmissionLimits(BaseModel):
+    """Límites de admisión de tráfico entrante (configurables en caliente y por variables de entorno QUIZ_<CAMPO>)."""
+    max_frame_bytes_player: int = Field(default=4096, gt=0, description="Tamaño máximo (bytes; los textos, en UTF-8) de un mensaje de un jugador o de una conexión aún no unida")
+    max_frame_bytes_host: int = Field(default=1_048_576, gt=0, description="Tamaño máximo (bytes; los textos, en UTF-8) de un mensaje del anfitrión (ej: 'load_quiz_data')")
+    messages_per_second: float = Field(default=5.0, gt=0, description="Mensajes por segundo sostenidos permitidos por conexión")
+    message_burst: int = Field(default=20, gt=0, description="Ráfaga máxima de mensajes permitida por conexión")
+    max_players_per_game: int = Field(default=5000, gt=0, description="Número máximo de jugadores (incluido el host) por partida")
+    joins_per_second_per_game: float = Field(default=50.0, gt=0, description="Nuevas conexiones por segundo sostenidas permitidas por partida")
+    join_burst_per_game: int = Field(default=200, gt=0, description="Ráfaga máxima de nuevas conexiones por partida")
+    max_spectators_per_game: int = Field(default=20000, gt=0, description="Número máximo de espectadores (/ws/{code}/watch) por partida")
+
+# Resolver la referencia adelantada de Game.current_question_payload
+Game.model_rebuild()
@@ -0,0 +1,156 @@
+# overload.py
+"""
+Protección contra sobrecarga con degradación gradual.
+
+Un controlador por proceso mide el retraso (lag) del bucle de eventos y la
+cola de comandos más larga de los actores de partida, y fija un nivel de
+sobrecarga. Cada nivel recorta un trabajo no esencial más (y mantiene los
+recortes de los niveles anteriores):
+
+1. `LEVEL_COALESCE_LOBBY`: en el lobby, los jugadores reciben solo el último
+   'player_joined'/'player_left' cada OVERLOAD_LOBBY_FLUSH_S (solo muestran
+   el contador); el host los sigue recibiendo todos.
+2. `LEVEL_TRIM_SCOREBOARD`: el host también recibe solo los primeros del
+   marcador en 'update_scoreboard' (los jugadores ya reciben una ventana).
+3. `LEVEL_PAUSE_BACKGROUND`: se pausan los 'answer_stats' al host y los
+   logs de eventos de alta frecuencia (`should_log`).
+4. `LEVEL_REJECT_NEW_GAMES`: POST /create_game/ responde 503.
+
+'new_question', 'reveal', 'submit_answer' y sus resultados no se recortan
+nunca: son el tráfico prioritario que el resto deja pasar.
+
+El nivel sube en cuanto la carga lo pide y baja de uno en uno tras
+OVERLOAD_COOLDOWN_S seguidos por debajo del umbral (sin oscilar en el
+límite). Cada transición se exporta como métrica y se puede fijar un nivel a
+mano desde `/debug/overload`.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+OVERLOAD_ENABLED = os.environ.get("QUIZ_OVERLOAD", "1") != "0" # Activa el controlador al arrancar
+OVERLOAD_SAMPLE_INTERVAL = 0.1          # Segundos entre muestras
+OVERLOAD_LAG_EWMA_ALPHA = 0.3           # Peso de la última muestra de lag en la media móvil
+OVERLOAD_LAG_THRESHOLDS_MS = (50.0, 100.0, 200.0, 400.0) # Lag medio (ms) para entrar en los niveles 1..4
+OVERLOAD_QUEUE_THRESHOLDS = (500, 1000, 2000, 5000)      # Comandos en cola (partida más cargada) para los niveles 1..4
+OVERLOAD_COOLDOWN_S = 5.0               # Segundos por debajo del umbral antes de bajar un nivel
+OVERLOAD_LOBBY_FLUSH_S = 1.0            # Periodo de las actualizaciones de lobby agrupadas (nivel 1)
+
+LEVEL_NORMAL = 0
+LEVEL_COALESCE_LOBBY = 1
+LEVEL_TRIM_SCOREBOARD = 2
+LEVEL_PAUSE_BACKGROUND = 3
+LEVEL_REJECT_NEW_GAMES = 4
+LEVEL_NAMES = ("normal", "coalesce_lobby", "trim_scoreboard", "pause_background", "reject_new_games")
+
+
+class OverloadController:
+    """Nivel de sobrecarga del proceso, recalculado periódicamente a partir del lag y las colas."""
+
+    def __init__(self):
+        self.level = LEVEL_NORMAL
+        self.forced_level: Optional[int] = None # Fijado a mano desde /debug/overload (None = automático)
+        self.lag_ms = 0.0
+        self.queue_depth = 0
+        self._calm_since: Optional[float] = None
+        self._games_dict: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, games_dict: Dict[str, Any]):
+        """Arranca la tarea de muestreo (idempotente). `games_dict` es el registro de partidas."""
+        self._games_dict = games_dict
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Overload controller started (interval %.3fs).", OVERLOAD_SAMPLE_INTERVAL)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logger.info("Overload controller stopped.")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + OVERLOAD_SAMPLE_INTERVAL
+            await asyncio.sleep(OVERLOAD_SAMPLE_INTERVAL)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000.0)
+            games = self._games_dict.values() if self._games_dict else ()
+            queue_depth = max((len(game.actor) for game in games), default=0)
+            self.update(lag_ms, queue_depth, time.monotonic())
+
+    def update(self, lag_ms: float, queue_depth: int, now: float):
+        """Incorpora una muestra y cambia de nivel si corresponde."""
+        self.lag_ms += OVERLOAD_LAG_EWMA_ALPHA * (lag_ms - self.lag_ms)
+        self.queue_depth = queue_depth
+        target = self.forced_level if self.forced_level is not None else self.pressure_level()
+        if target > self.level:
+            self._calm_since = None
+            self._set_level(target)
+        elif target < self.level:
+            if self.forced_level is not None:
+                self._set_level(target)
+            elif self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= OVERLOAD_COOLDOWN_S:
+                self._calm_since = now # El siguiente escalón vuelve a esperar
+                self._set_level(self.level - 1)
+        else:
+            self._calm_since = None
+
+    def pressure_level(self) -> int:
+        """Nivel que piden las medidas actuales (el mayor de lag y colas)."""
+        level = LEVEL_NORMAL
+        for candidate, (lag_threshold, queue_threshold) in enumerate(zip(OVERLOAD_LAG_THRESHOLDS_MS, OVERLOAD_QUEUE_THRESHOLDS), start=1):
+            if self.lag_ms >= lag_threshold or self.queue_depth >= queue_threshold:
+                level = candidate
+        return level
+
+    def force(self, level: Optional[int]):
+        """Fija un nivel a mano (None vuelve al modo automático)."""
+        self.forced_level = level
+        if level is not None:
+            self._set_level(level)
+        logger.info("Overload level %s.", f"forced to {LEVEL_NAMES[level]}" if level is not None else "back to automatic")
+
+    def _set_level(self, level: int):
+        if level == self.level:
+            return
+        transitions_total.inc(LEVEL_NAMES[self.level], LEVEL_NAMES[level])
+        log = logger.warning if level > self.level else logger.info
+        log("Overload level %s -> %s (loop lag %.1f ms, deepest queue %d).",
+            LEVEL_NAMES[self.level], LEVEL_NAMES[level], self.lag_ms, self.queue_depth)
+        self.level = level
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado del controlador para el endpoint de diagnóstico."""
+        return {
+            "enabled": self.running,
+            "level": self.level,
+            "level_name": LEVEL_NAMES[self.level],
+            "forced": self.forced_level is not None,
+            "lag_ms": round(self.lag_ms, 3),
+            "queue_depth": self.queue_depth,
+        }
+
+
+overload_controller = OverloadController()
+
+# --- Métricas ---
+transitions_total = Counter("quiz_overload_transitions_total", "Cambios de nivel de sobrecarga", ("from_level", "to_level"))
+shed_total = Counter("quiz_overload_shed_total", "Trabajo no esencial recortado por sobrecarga", ("action",))
+Gauge("quiz_overload_level", "Nivel de sobrecarga actual (0 = normal)", callback=lambda: {(): float(overload_controller.level)})
+Gauge("quiz_overload_loop_lag_ms", "Lag medio del bucle de eventos visto por el controlador de sobrecarga",
+      callback=lambda: {(): overload_controller.lag_ms})
@@ -0,0 +1,195 @@
+# registry.py
+"""
+Registro de conexiones de una partida indexado por IDs enteros pequeños.
+
+Cada conexión WebSocket aceptada recibe un ID (`conn_id`) que es su posición
+en una tabla de huecos (slots). Los IDs liberados se reutilizan, así que la
+tabla se mantiene compacta y el ID sirve de índice directo en arrays.
+
+- Alta, baja y búsqueda por ID en O(1), sin hashear objetos WebSocket.
+- Las conexiones que participan en la partida (tras 'join_game' o
+  'resume_session') se mantienen además en una lista contigua para el
+  fan-out (`active_connections`), con borrado O(1) por intercambio con el
+  último elemento.
+- Los datos por jugador que cambian en cada ronda (puntuación, si ya respondió,
+  momento de la respuesta) y el orden de opciones que ve viven en columnas
+  indexadas por `conn_id` (`scores`, `answered`, `answer_times`, `views`). Reiniciar los flags de respuesta de
+  toda la sala es una sola copia de memoria.
+
+Los puestos de los jugadores salen de `ScoreRanking`: un array ordenado con
+las puntuaciones de todos los jugadores reales (no el host; sí los
+desconectados en periodo de gracia), que se mantiene al puntuar cada
+respuesta en vez de reordenar toda la sala.
+
+Un `conn_id` solo se libera con `remove()`, que debe llamar el dueño de la
+conexión (el bucle de `websocket_endpoint`) al terminar. Así un ID no se
+reasigna mientras algún manejador de esa conexión pueda seguir usándolo.
+"""
+import bisect
+from array import array
+from typing import Iterator, List, Optional
+
+from fastapi import WebSocket
+
+_INACTIVE = -1 # Posición en la lista de fan-out de un ID que no está activo
+
+
+class ConnectionRegistry:
+    """Tabla de conexiones de una partida con IDs enteros y columnas por jugador."""
+
+    def __init__(self):
+        self._slots: List[Optional[WebSocket]] = [] # conn_id -> conexión (None = hueco libre)
+        self._free: List[int] = []                  # IDs libres para reutilizar
+        self._active: List[WebSocket] = []          # Conexiones activas, contiguas (fan-out)
+        self._active_ids: List[int] = []            # Posición en _active -> conn_id
+        self._active_pos = array("l")               # conn_id -> posición en _active (o _INACTIVE)
+        # Columnas por jugador, indexadas por conn_id
+        self.scores = array("q")                    # Puntuación acumulada
+        self.answered = bytearray()                 # 1 si ya respondió la pregunta actual
+        self.answer_times = array("d")              # Timestamp de la última respuesta (0.0 = ninguna)
+        self.views = bytearray()                    # Vista (orden de opciones) asignada; 0 = orden original
+        self.outbound_pending = 0                   # Mensajes de salida pendientes de agrupar (lo mantiene wire._Outbox)
+
+    def __len__(self) -> int:
+        """Número de conexiones activas (participando en la partida)."""
+        return len(self._active)
+
+    def __contains__(self, conn_id: int) -> bool:
+        return 0 <= conn_id < len(self._slots) and self._slots[conn_id] is not None
+
+    @property
+    def capacity(self) -> int:
+        """Tamaño de la tabla (y de las columnas): mayor conn_id asignado + 1."""
+        return len(self._slots)
+
+    def add(self, websocket: WebSocket) -> int:
+        """Registra una conexión recién aceptada y devuelve su conn_id."""
+        if self._free:
+            conn_id = self._free.pop()
+            self._slots[conn_id] = websocket
+            self.scores[conn_id] = 0
+            self.answered[conn_id] = 0
+            self.answer_times[conn_id] = 0.0
+            self.views[conn_id] = 0
+        else:
+            conn_id = len(self._slots)
+            self._slots.append(websocket)
+            self._active_pos.append(_INACTIVE)
+            self.scores.append(0)
+            self.answered.append(0)
+            self.answer_times.append(0.0)
+            self.views.append(0)
+        return conn_id
+
+    def remove(self, conn_id: int, websocket: WebSocket) -> bool:
+        """
+        Libera el ID de una conexión terminada (idempotente).
+
+        Solo actúa si el hueco sigue perteneciendo a `websocket`.
+        """
+        if conn_id not in self or self._slots[conn_id] is not websocket:
+            return False
+        self.deactivate(conn_id)
+        self._slots[conn_id] = None
+        self._free.append(conn_id)
+        return True
+
+    def get(self, conn_id: Optional[int]) -> Optional[WebSocket]:
+        if conn_id is None or not 0 <= conn_id < len(self._slots):
+            return None
+        return self._slots[conn_id]
+
+    def owns(self, conn_id: int, websocket: WebSocket) -> bool:
+        """True si `conn_id` sigue asignado a `websocket`."""
+        return self.get(conn_id) is websocket
+
+    # --- Conjunto de fan-out ---
+
+    def activate(self, conn_id: int):
+        """Añade la conexión a la lista de fan-out (al unirse o reanudar sesión)."""
+        if conn_id in self and self._active_pos[conn_id] == _INACTIVE:
+            self._active_pos[conn_id] = len(self._active)
+            self._active.append(self._slots[conn_id])
+            self._active_ids.append(conn_id)
+
+    def deactivate(self, conn_id: int) -> bool:
+        """Quita la conexión de la lista de fan-out. Devuelve False si no estaba."""
+        if not 0 <= conn_id < len(self._slots):
+            return False
+        pos = self._active_pos[conn_id]
+        if pos == _INACTIVE:
+            return False
+        # Intercambiar con el último para borrar en O(1)
+        last_id = self._active_ids[-1]
+        self._active[pos] = self._active[-1]
+        self._active_ids[pos] = last_id
+        self._active_pos[last_id] = pos
+        self._active.pop()
+        self._active_ids.pop()
+        self._active_pos[conn_id] = _INACTIVE
+        return True
+
+    def is_active(self, conn_id: int) -> bool:
+        return 0 <= conn_id < len(self._slots) and self._active_pos[conn_id] != _INACTIVE
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        """Lista contigua de conexiones activas. Copiarla antes de iterar con awaits."""
+        return self._active
+
+    @property
+    def active_ids(self) -> List[int]:
+        """IDs de las conexiones activas, en el mismo orden que `active_connections`."""
+        return self._active_ids
+
+    def iter_active(self) -> Iterator[tuple]:
+        """Pares (conn_id, conexión) de una copia de la lista de fan-out."""
+        return iter(list(zip(self._active_ids, self._active)))
+
+    # --- Columnas por jugador ---
+
+    def reset_answered(self):
+        """Marca a todos como 'sin responder' para una nueva pregunta."""
+        self.answered[:] = bytes(len(self.answered))
+
+    def copy_player_state(self, from_id: int, to_id: int):
+        """Copia las columnas de un ID a otro (al mover un jugador de conexión)."""
+        self.scores[to_id] = self.scores[from_id]
+        self.answered[to_id] = self.answered[from_id]
+        self.answer_times[to_id] = self.answer_times[from_id]
+        self.views[to_id] = self.views[from_id]
+
+
+class ScoreRanking:
+    """
+    Puntuaciones de los jugadores de una partida en un array ordenado (negadas: la mayor primero).
+
+    El puesto de una puntuación es 1 + cuántos jugadores tienen más puntos,
+    así que los empatados comparten puesto. Lo mantiene game_logic: alta al
+    unirse (o al restaurar la partida), baja cuando el jugador abandona de
+    verdad y `move()` al sumarle puntos.
+    """
+
+    def __init__(self):
+        self._scores = array("q")
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def add(self, score: int = 0):
+        bisect.insort(self._scores, -score)
+
+    def remove(self, score: int):
+        position = bisect.bisect_left(self._scores, -score)
+        if position < len(self._scores) and self._scores[position] == -score:
+            del self._scores[position]
+
+    def move(self, old_score: int, new_score: int):
+        """Cambia una puntuación del índice (dos búsquedas binarias, sin reordenar)."""
+        if old_score != new_score:
+            self.remove(old_score)
+            self.add(new_score)
+
+    def rank_of(self, score: int) -> int:
+        """Puesto de un jugador con esa puntuación (1 es el primero)."""
+        return bisect.bisect_left(self._scores, -score) + 1
@@ -0,0 +1,304 @@
+# replay.py
+"""
+Reproduce partidas a partir de su registro de eventos (ver event_log.py).
+
+Cada comando del registro se vuelve a encolar en el actor de una partida
+nueva, con los mismos manejadores de game_logic, contra WebSockets falsos
+que solo cuentan lo que reciben. Los valores no deterministas (reloj al
+mostrar cada pregunta, tokens de reconexión...) se devuelven desde el propio
+registro, así que la reproducción da las mismas puntuaciones, rangos y
+mensajes que la partida original. Los temporizadores (avance automático,
+expiración de sesiones) no se disparan: sus comandos ya están en el registro.
+
+Sirve para reproducir exactamente un fallo de producción, para inspeccionar
+el estado en que quedó una partida y como carga de benchmark hecha con
+tráfico real (`--copies` reproduce cada registro N veces a la vez).
+`--encoding` elige la codificación de los clientes falsos (ver wire.py); con
+`all` se reproduce una vez por codificación y se comparan los bytes enviados
+por ronda (pregunta).
+
+Uso:
+    python replay.py event_logs/ABCD-1700000000000.ndjson       # lo más rápido posible
+    python replay.py --speed 1 event_logs/ABCD-1700000000000.ndjson  # a velocidad real
+    python replay.py --copies 200 event_logs/*.ndjson            # benchmark
+    python replay.py --encoding all event_logs/*.ndjson          # bytes por ronda: JSON vs binario
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from diagnostics import handler_tracer
+from event_log import EVENT_CAPTURE, EVENT_LOG_VERSION
+from game_actor import CMD_ANSWER, CMD_DISCONNECT, CMD_LOAD_QUIZ
+from game_logic import submit_command
+from models import Game, QuizData
+from wire import ENCODING_JSON, ENCODING_NAMES, SUBPROTOCOL_MSGPACK, available_subprotocols, set_encoding
+
+logger = logging.getLogger(__name__)
+
+
+class FakeWebSocket:
+    """Sustituto de WebSocket para reproducir partidas: solo cuenta lo que se le envía."""
+
+    def __init__(self):
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.closed = False
+        self.close_code: Optional[int] = None
+
+    async def send_text(self, data: str):
+        self.messages_sent += 1
+        self.bytes_sent += len(data.encode())
+
+    async def send_bytes(self, data: bytes):
+        self.messages_sent += 1
+        self.bytes_sent += len(data)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+        self.close_code = code
+
+
+class ReplaySource:
+    """
+    Ocupa el lugar del EventLog de una partida reproducida.
+
+    No anota nada; `capture()` devuelve los valores capturados en la partida
+    original, en el mismo orden en que los leyeron sus manejadores.
+    """
+
+    replaying = True
+
+    def __init__(self, captures: Iterable[Any]):
+        self._captures = deque(captures)
+        self.missing = 0 # Capturas pedidas de más (la reproducción se desvió del original)
+
+    @property
+    def unused(self) -> int:
+        """Capturas que quedaron sin pedir (la reproducción se desvió del original)."""
+        return len(self._captures)
+
+    def record(self, kind: str, conn_id: Optional[int], data: Any = None):
+        pass
+
+    def record_command(self, kind: str, conn_id: Optional[int], payload: Any):
+        pass
+
+    def capture(self, value: Any) -> Any:
+        if self._captures:
+            return self._captures.popleft()
+        self.missing += 1
+        return value
+
+    def close(self):
+        pass
+
+
+class ReplayResult(NamedTuple):
+    """Resultado de reproducir un registro."""
+    game: Game                # Partida reproducida (en el estado en que quedó)
+    commands: int             # Comandos reproducidos
+    elapsed_s: float          # Tiempo de reproducción
+    messages_sent: int        # Mensajes enviados a los WebSockets falsos
+    bytes_sent: int           # Bytes de esos mensajes
+    rounds: int               # Preguntas mostradas
+    diverged: bool            # True si se pidieron más o menos capturas que en el original
+
+
+def read_event_log(path: str) -> Tuple[Dict[str, Any], List[list]]:
+    """
+    Lee un registro de eventos.
+
+    Una última línea incompleta (el proceso murió a mitad de escritura) se
+    descarta con un aviso.
+
+    Returns:
+        (cabecera, eventos).
+
+    Raises:
+        ValueError: Si el fichero no es un registro de eventos de una versión conocida.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    if not lines:
+        raise ValueError(f"{path}: empty event log")
+    header = json.loads(lines[0])
+    if not isinstance(header, dict) or header.get("version") != EVENT_LOG_VERSION:
+        raise ValueError(f"{path}: not an event log or unsupported version")
+    events = []
+    for number, line in enumerate(lines[1:], start=2):
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            if number != len(lines):
+                raise ValueError(f"{path}:{number}: corrupt event")
+            logger.warning("%s: ignoring truncated last event", path)
+    return header, events
+
+
+def _decode_payload(kind: str, data: Any) -> Any:
+    """Convierte los datos de un evento en el payload que espera el actor."""
+    if kind == CMD_LOAD_QUIZ:
+        return QuizData.model_validate(data)
+    if kind == CMD_ANSWER:
+        payload, received_time = data
+        return (payload, received_time)
+    return data
+
+
+async def replay_game(header: Dict[str, Any], events: List[list], speed: float = 0.0,
+                      game_code: Optional[str] = None, encoding: int = ENCODING_JSON) -> ReplayResult:
+    """
+    Reproduce un registro en una partida nueva.
+
+    Args:
+        header: Cabecera del registro (`read_event_log`).
+        events: Eventos del registro.
+        speed: 0 para reproducir lo más rápido posible; si no, factor sobre el
+            ritmo original (1 = velocidad real, 2 = el doble de rápido).
+        game_code: Código para la partida reproducida (por defecto, el original).
+        encoding: Codificación de los WebSockets falsos (wire.ENCODING_*).
+
+    Raises:
+        ValueError: Si el registro es de una partida restaurada tras un
+            reinicio (empieza a mitad de partida).
+    """
+    if header.get("restored"):
+        raise ValueError("event log of a restored game starts mid-game and cannot be replayed on its own")
+    game_code = game_code or header["game_code"]
+    game = Game(game_code=game_code)
+    source = ReplaySource(data for _, kind, _, data in events if kind == EVENT_CAPTURE)
+    game.event_log = source
+    games_dict = {game_code: game}
+    # conn_id del registro -> (conn_id en la reproducción, socket falso)
+    connections: Dict[int, Tuple[int, FakeWebSocket]] = {}
+    sockets: List[FakeWebSocket] = []
+    commands = 0
+    last_future: Optional[asyncio.Future] = None
+    started = time.perf_counter()
+
+    for offset, kind, logged_conn_id, data in events:
+        if kind == EVENT_CAPTURE:
+            continue
+        if games_dict.get(game_code) is not game:
+            break # La partida se eliminó (se fueron todos)
+        if speed > 0:
+            delay = started + offset / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        conn_id = None
+        websocket = None
+        if logged_conn_id is not None:
+            entry = connections.get(logged_conn_id)
+            # Un socket cerrado ya no envía comandos (salvo su desconexión): el ID se reutilizó
+            if entry is None or (entry[1].closed and kind != CMD_DISCONNECT):
+                if entry is not None:
+                    game.connections.remove(*entry)
+                websocket = FakeWebSocket()
+                set_encoding(websocket, encoding)
+                sockets.append(websocket)
+                entry = connections[logged_conn_id] = (game.connections.add(websocket), websocket)
+            conn_id, websocket = entry
+        commands += 1
+        payload = _decode_payload(kind, data)
+        if kind == CMD_DISCONNECT:
+            # Como en main.py: el conn_id se libera cuando el actor aplicó la desconexión
+            await submit_command(games_dict, game, kind, conn_id, payload, wait=True)
+            game.connections.remove(conn_id, websocket)
+            del connections[logged_conn_id]
+        else:
+            last_future = submit_command(games_dict, game, kind, conn_id, payload, wait=True)
+    if last_future is not None:
+        await last_future
+    elapsed = time.perf_counter() - started
+    diverged = bool(source.missing or source.unused)
+    if diverged:
+        logger.warning("Replay of %s diverged from the original: %d capture(s) missing, %d unused.",
+                       game_code, source.missing, source.unused)
+    return ReplayResult(
+        game=game,
+        commands=commands,
+        elapsed_s=elapsed,
+        messages_sent=sum(ws.messages_sent for ws in sockets),
+        bytes_sent=sum(ws.bytes_sent for ws in sockets),
+        rounds=min(game.current_question_index + 1, len(game.quiz_data.questions)) if game.quiz_data else 0,
+        diverged=diverged,
+    )
+
+
+async def _replay_all(args: argparse.Namespace, logs: list, encoding: int) -> Tuple[List[ReplayResult], float]:
+    replays = [
+        replay_game(header, events, args.speed, game_code=f"{header['game_code']}#{copy}" if args.copies > 1 else None,
+                    encoding=encoding)
+        for path, header, events in logs
+        for copy in range(args.copies)
+    ]
+    started = time.perf_counter()
+    results: List[ReplayResult] = await asyncio.gather(*replays)
+    return results, time.perf_counter() - started
+
+
+async def _main(args: argparse.Namespace):
+    handler_tracer.enabled = True # Latencia por tipo de comando en el resumen
+    logs = [(path, *read_event_log(path)) for path in args.logs]
+    encodings = range(len(ENCODING_NAMES)) if args.encoding == "all" else [ENCODING_NAMES.index(args.encoding)]
+    wire_totals = []
+    for encoding in encodings:
+        results, elapsed = await _replay_all(args, logs, encoding)
+        wire_totals.append((encoding, sum(r.bytes_sent for r in results), sum(r.messages_sent for r in results),
+                            sum(r.rounds for r in results)))
+        if encoding == encodings[0]:
+            _print_summary(args, logs, results, elapsed)
+    print("\nBytes on the wire:")
+    for encoding, bytes_sent, messages, rounds in wire_totals:
+        print(f"  {ENCODING_NAMES[encoding]:<8} {bytes_sent} bytes, {bytes_sent / rounds if rounds else 0:.0f} bytes/round, "
+              f"{bytes_sent / messages if messages else 0:.1f} bytes/message")
+
+
+def _print_summary(args: argparse.Namespace, logs: list, results: List[ReplayResult], elapsed: float):
+
+    for (path, header, events), result in zip(logs, results[::args.copies]):
+        game = result.game
+        print(f"{path}: game {header['game_code']}, {result.commands} commands in {result.elapsed_s:.3f}s, "
+              f"{result.messages_sent} messages sent, final state {game.state.value}"
+              f"{' (DIVERGED)' if result.diverged else ''}")
+        # Puntos por jugador según el registro de respuestas (al final ya no queda nadie conectado)
+        totals: Dict[str, int] = {}
+        for row in game.answer_log.iter_rows(0, len(game.answer_log)):
+            totals[row[0]] = totals.get(row[0], 0) + row[5]
+        ranking = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        for rank, (nickname, score) in enumerate(ranking[:args.top], start=1):
+            print(f"  {rank:>3}. {nickname}: {score}")
+    commands = sum(result.commands for result in results)
+    messages = sum(result.messages_sent for result in results)
+    print(f"\n{len(results)} replays, {commands} commands, {messages} messages in {elapsed:.3f}s "
+          f"({commands / elapsed if elapsed else 0:.0f} commands/s, {messages / elapsed if elapsed else 0:.0f} messages/s)")
+    for kind, stats in sorted(handler_tracer.snapshot()["per_type"].items()):
+        print(f"  {kind:<16} count={stats['count']:<7} avg={stats['avg_ms']:.3f}ms max={stats['max_ms']:.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce partidas desde su registro de eventos (QUIZ_EVENT_LOG_DIR).")
+    parser.add_argument("logs", nargs="+", help="Ficheros .ndjson de registro de eventos")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 = lo más rápido posible (por defecto); 1 = velocidad real")
+    parser.add_argument("--copies", type=int, default=1, help="Reproducciones simultáneas de cada registro (benchmark)")
+    parser.add_argument("--top", type=int, default=10, help="Entradas del marcador final a mostrar")
+    parser.add_argument("--encoding", choices=ENCODING_NAMES + ("all",), default="json",
+                        help="Codificación de los clientes falsos; 'all' compara los bytes enviados con cada una")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar el log INFO de los manejadores")
+    args = parser.parse_args()
+    if args.encoding in ("msgpack", "all") and SUBPROTOCOL_MSGPACK not in available_subprotocols():
+        parser.error("the binary encoding needs the optional 'msgpack' package")
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s:%(name)s: %(message)s")
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# results.py
+"""
+Registro compacto de respuestas de una partida y su exportación en streaming.
+
+Cada respuesta aceptada se guarda como una fila en columnas (`array`) en lugar
+de un objeto por respuesta: una partida de 5.000 jugadores y 50 preguntas
+(250.000 filas) ocupa unos pocos MB. Los nicknames y los textos de preguntas
+y opciones se guardan una sola vez y las filas solo llevan índices.
+
+La exportación (`GET /games/{code}/results`) recorre las filas con un
+generador asíncrono que produce el CSV/NDJSON por bloques y cede el bucle de
+eventos entre bloques: nunca se construye el fichero completo en memoria ni
+se bloquea a las partidas en curso.
+"""
+import asyncio
+import csv
+import io
+import json
+from array import array
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# --- Constantes de Configuración ---
+EXPORT_CHUNK_ROWS = 500 # Filas por bloque de la respuesta en streaming (se cede el bucle entre bloques)
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+EXPORT_COLUMNS = ("nickname", "question_number", "question_text", "answer", "is_correct",
+                  "points", "response_ms", "final_rank", "final_score")
+
+_NO_OPTION = -1 # Índice de opción de una respuesta cuyo answer_id no corresponde a ninguna opción
+
+
+class _QuestionInfo(NamedTuple):
+    text: str
+    option_ids: Tuple[str, ...]
+    option_texts: Tuple[str, ...]
+
+
+class AnswerLog:
+    """Respuestas aceptadas de una partida, en columnas (una fila por respuesta)."""
+
+    def __init__(self):
+        self._nicknames: List[str] = []           # Índice de jugador -> nickname
+        self._nickname_refs: Dict[str, int] = {}  # nickname -> índice de jugador
+        self._questions: List[Optional[_QuestionInfo]] = [] # Índice de pregunta -> textos y opciones
+        # Columnas
+        self.question = array("H")   # Índice de la pregunta
+        self.player = array("l")     # Índice del jugador en _nicknames
+        self.option = array("b")     # Índice de la opción elegida (_NO_OPTION si no existe)
+        self.correct = bytearray()   # 1 si fue correcta
+        self.points = array("l")     # Puntos obtenidos
+        self.response_ms = array("l") # Milisegundos desde que se mostró la pregunta
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def begin_question(self, question_index: int, text: str, options: Sequence) -> None:
+        """Guarda el texto y las opciones (con sus IDs ya asignados) de una pregunta."""
+        while len(self._questions) <= question_index:
+            self._questions.append(None)
+        self._questions[question_index] = _QuestionInfo(
+            text, tuple(option.id for option in options), tuple(option.text for option in options)
+        )
+
+    def record(self, question_index: int, nickname: str, answer_id: str, is_correct: bool,
+               points: int, response_ms: int) -> None:
+        """Añade una respuesta aceptada."""
+        player_ref = self._nickname_refs.get(nickname)
+        if player_ref is None:
+            player_ref = len(self._nicknames)
+            self._nicknames.append(nickname)
+            self._nickname_refs[nickname] = player_ref
+        info = self._questions[question_index] if question_index < len(self._questions) else None
+        option = info.option_ids.index(answer_id) if info is not None and answer_id in info.option_ids else _NO_OPTION
+        self.question.append(question_index)
+        self.player.append(player_ref)
+        self.option.append(option)
+        self.correct.append(1 if is_correct else 0)
+        self.points.append(points)
+        self.response_ms.append(response_ms)
+
+    def to_state(self) -> tuple:
+        """Estado completo como tipos básicos (para snapshots de partidas)."""
+        return (
+            list(self._nicknames),
+            [tuple(info) if info is not None else None for info in self._questions],
+            self.question.tobytes(), self.player.tobytes(), self.option.tobytes(),
+            bytes(self.correct), self.points.tobytes(), self.response_ms.tobytes(),
+        )
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "AnswerLog":
+        """Reconstruye un registro a partir de `to_state()`."""
+        log = cls()
+        nicknames, questions, question, player, option, correct, points, response_ms = state
+        log._nicknames = list(nicknames)
+        log._nickname_refs = {nickname: ref for ref, nickname in enumerate(log._nicknames)}
+        log._questions = [_QuestionInfo(*info) if info is not None else None for info in questions]
+        log.question.frombytes(question)
+        log.player.frombytes(player)
+        log.option.frombytes(option)
+        log.correct = bytearray(correct)
+        log.points.frombytes(points)
+        log.response_ms.frombytes(response_ms)
+        return log
+
+    def iter_rows(self, start: int, stop: int):
+        """Tuplas (nickname, nº de pregunta, texto, respuesta, correcta, puntos, ms) de las filas [start, stop)."""
+        for row in range(start, stop):
+            question_index = self.question[row]
+            info = self._questions[question_index]
+            option = self.option[row]
+            yield (
+                self._nicknames[self.player[row]],
+                question_index + 1,
+                info.text if info is not None else "",
+                info.option_texts[option] if info is not None and option != _NO_OPTION else "",
+                bool(self.correct[row]),
+                self.points[row],
+                self.response_ms[row],
+            )
+
+
+async def stream_results(log: AnswerLog, final_ranks: Dict[str, Tuple[int, int]], export_format: str) -> AsyncIterator[str]:
+    """
+    Genera la exportación de resultados por bloques de EXPORT_CHUNK_ROWS filas.
+
+    Solo se exportan las filas que existían al empezar; las respuestas que
+    lleguen mientras tanto (partida en curso) no alargan la descarga.
+
+    Args:
+        log: Registro de respuestas de la partida.
+        final_ranks: nickname -> (rango, puntuación) del marcador de jugadores.
+            Los jugadores que ya abandonaron la partida quedan sin rango.
+        export_format: 'csv' o 'ndjson'.
+    """
+    stop = len(log)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer is not None:
+        writer.writerow(EXPORT_COLUMNS)
+    for start in range(0, stop, EXPORT_CHUNK_ROWS):
+        for row in log.iter_rows(start, min(start + EXPORT_CHUNK_ROWS, stop)):
+            rank, score = final_ranks.get(row[0], (None, None))
+            values = row + (rank, score)
+            if writer is not None:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values)), ensure_ascii=False))
+                buffer.write("\n")
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        yield chunk
+        await asyncio.sleep(0) # Ceder el bucle entre bloques
+    if buffer.tell():
+        yield buffer.getvalue() # Solo la cabecera CSV si no hay filas
@@ -0,0 +1,225 @@
+# snapshot.py
+"""
+Instantáneas de las partidas activas para reinicios sin cortar las partidas.
+
+Al drenar el servidor (`POST /debug/drain`, o al apagarse si no se drenó
+antes) el estado de cada partida se vuelca a un fichero binario compacto:
+cuestionario, estado e índice de pregunta, pregunta en curso, puntuaciones,
+tokens de reconexión y el registro de respuestas. Las conexiones no se
+guardan: tras arrancar, todos los jugadores quedan en periodo de gracia y
+reanudan su sesión con su token (el host, con un token generado al drenar).
+Las salas de un torneo guardan además el ID del torneo, cuyo estado
+(salas, pregunta y marcadores de la última clasificación global) va una
+sola vez en la tabla de torneos; al restaurar, las salas vuelven a
+compartir el mismo `Tournament` y su director se relanza (ver
+`game_logic.resume_restored_tournament`).
+
+El fichero es un pickle de tipos básicos (tuplas, listas, dicts, str,
+números y bytes) precedido de una cabecera con versión. Al cargarlo no se
+permite reconstruir ninguna clase, así que un fichero manipulado no puede
+ejecutar código.
+"""
+import gc
+import io
+import logging
+import os
+import pickle
+import time
+from typing import Dict, List, Optional
+
+from models import DetachedPlayer, Game, GameStateEnum, NewQuestionPayload, QuizData
+from results import AnswerLog
+from event_log import open_event_log
+from tournament import Tournament
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+SNAPSHOT_PATH = os.environ.get("QUIZ_SNAPSHOT_PATH", "quiz_snapshot.bin") # Fichero de instantánea (se borra al restaurarlo)
+SNAPSHOT_MAGIC = b"QUIZSNAP3\n" # Cabecera y versión del formato
+
+
+class _BasicTypesUnpickler(pickle.Unpickler):
+    """Unpickler que rechaza cualquier clase o función (solo tipos básicos)."""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Forbidden type in snapshot: {module}.{name}")
+
+
+def snapshot_game(game: Game, host_token: Optional[str], quiz_refs: Dict[str, int], tournaments: Dict[str, tuple]) -> tuple:
+    """
+    Convierte una partida en una tupla de tipos básicos.
+
+    El cuestionario no va en la tupla: se guarda una sola vez en la tabla de
+    cuestionarios de la instantánea (`quiz_refs`, JSON -> índice) y la
+    partida solo lleva su índice. Muchas partidas suelen usar el mismo
+    fichero de quiz y validarlo es lo más caro de la restauración.
+
+    Los jugadores conectados y los que estaban en periodo de gracia se guardan
+    igual: (token, nickname, puntuación, último timestamp de respuesta,
+    índice de la pregunta ya respondida o -1, nombre del equipo o None). Los
+    agregados de los equipos no se guardan: se reconstruyen al restaurar.
+    El torneo de una sala, como el cuestionario, se guarda una sola vez en
+    `tournaments` y la sala solo lleva su ID.
+
+    Args:
+        game: La partida.
+        host_token: Token de reconexión generado para el host, o None si la
+            partida no tiene host conectado.
+        quiz_refs: Tabla de cuestionarios de la instantánea (se amplía aquí).
+        tournaments: Tabla de torneos de la instantánea, ID -> `Tournament.to_state()` (se amplía aquí).
+    """
+    connections = game.connections
+    teams = game.teams
+    players = []
+    for token, conn_id in game.player_tokens.items():
+        player = game.players.get(conn_id)
+        if player is None:
+            continue
+        answered_index = game.current_question_index if connections.answered[conn_id] else -1
+        players.append((token, player.nickname, connections.scores[conn_id], connections.answer_times[conn_id], answered_index,
+                        teams.name(player.team_id) if player.team_id is not None else None))
+    for token, detached in game.detached_players.items():
+        answered_index = detached.answered_question_index if detached.answered_question_index is not None else -1
+        players.append((token, detached.nickname, detached.score, detached.last_answer_time or 0.0, answered_index,
+                        teams.name(detached.team_id) if detached.team_id is not None else None))
+    host = game.players.get(game.host_id) if game.host_id is not None else None
+    quiz_ref = -1
+    if game.quiz_data is not None:
+        quiz_ref = quiz_refs.setdefault(game.quiz_data.model_dump_json(), len(quiz_refs))
+    tournament_id = None
+    if game.tournament is not None:
+        tournament_id = game.tournament.tournament_id
+        if tournament_id not in tournaments:
+            tournaments[tournament_id] = game.tournament.to_state()
+    return (
+        game.game_code,
+        game.state.value,
+        game.current_question_index,
+        game.question_start_time,
+        game.current_correct_answer_id,
+        quiz_ref,
+        game.current_question_payload.model_dump_json() if game.current_question_payload else None,
+        dict(game.answer_counts),
+        game.answered_count,
+        (host_token, host.nickname) if host is not None and host_token else None,
+        players,
+        game.answer_log.to_state(),
+        tournament_id,
+    )
+
+
+def restore_game(record: tuple, quizzes: List[QuizData], tournaments: Dict[str, Tournament]) -> Game:
+    """
+    Reconstruye una partida a partir de `snapshot_game()`. Todos sus jugadores quedan desconectados.
+
+    Args:
+        record: Tupla de la partida.
+        quizzes: Tabla de cuestionarios ya validados (las partidas que
+            compartían cuestionario comparten también el objeto restaurado).
+        tournaments: Torneos ya restaurados, por ID (igual: las salas de un torneo comparten el objeto).
+    """
+    (game_code, state, question_index, question_start_time, correct_answer_id, quiz_ref,
+     question_json, answer_counts, answered_count, host, players, answer_log_state, tournament_id) = record
+    now = time.time()
+    game = Game(
+        game_code=game_code,
+        state=GameStateEnum(state),
+        current_question_index=question_index,
+        question_start_time=question_start_time,
+        quiz_data=quizzes[quiz_ref] if quiz_ref >= 0 else None,
+        tournament=tournaments[tournament_id] if tournament_id is not None else None,
+    )
+    game.current_correct_answer_id = correct_answer_id
+    game.current_question_payload = NewQuestionPayload.model_validate_json(question_json) if question_json else None
+    game.answer_counts = answer_counts
+    game.answered_count = answered_count
+    game.answer_log = AnswerLog.from_state(answer_log_state)
+    game.event_log = open_event_log(game_code, restored=True)
+    for token, nickname, score, last_answer_time, answered_index, team_name in players:
+        game.ranking.add(score)
+        team_id = None
+        if team_name is not None:
+            team_id = game.teams.resolve(team_name)
+            game.teams.add_member(team_id, score)
+        game.detached_players[token] = DetachedPlayer(
+            nickname=nickname,
+            score=score,
+            last_answer_time=last_answer_time or None,
+            answered_question_index=answered_index if answered_index >= 0 else None,
+            detached_at=now,
+            team_id=team_id
+        )
+    if host is not None:
+        host_token, host_nickname = host
+        game.host_reconnect_token = host_token
+        game.detached_host = DetachedPlayer(nickname=host_nickname, score=0, last_answer_time=None,
+                                            answered_question_index=None, detached_at=now)
+    return game
+
+
+def save_snapshot(games_dict: Dict[str, Game], host_tokens: Dict[str, str], path: str = SNAPSHOT_PATH) -> int:
+    """
+    Escribe la instantánea de todas las partidas no finalizadas.
+
+    Se serializa todo en memoria sin ceder el bucle (estado consistente entre
+    partidas) y se escribe en un fichero temporal que luego se renombra, para
+    no dejar nunca una instantánea a medias.
+
+    Returns:
+        Número de partidas guardadas.
+    """
+    started = time.perf_counter()
+    quiz_refs: Dict[str, int] = {}
+    tournaments: Dict[str, tuple] = {}
+    records = [
+        snapshot_game(game, host_tokens.get(code), quiz_refs, tournaments)
+        for code, game in games_dict.items() if game.state != GameStateEnum.FINISHED
+    ]
+    data = SNAPSHOT_MAGIC + pickle.dumps((list(quiz_refs), list(tournaments.values()), records), protocol=pickle.HIGHEST_PROTOCOL)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    logger.info("Snapshot of %d games written to %s (%d bytes, %.1f ms).",
+                len(records), path, len(data), (time.perf_counter() - started) * 1000.0)
+    return len(records)
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> List[Game]:
+    """
+    Lee y borra la instantánea, si existe.
+
+    Se borra siempre tras leerla (aunque esté corrupta) para no restaurar dos
+    veces las mismas partidas si el servidor vuelve a reiniciarse. El recolector
+    de ciclos se pausa mientras tanto: restaurar miles de partidas crea muchos
+    objetos de golpe y sus pasadas duplicarían el tiempo de arranque.
+
+    Returns:
+        Las partidas restauradas (lista vacía si no había instantánea o no es válida).
+        Las salas de un torneo llevan en `game.tournament` el torneo restaurado.
+    """
+    if not os.path.exists(path):
+        return []
+    started = time.perf_counter()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.remove(path)
+        if not data.startswith(SNAPSHOT_MAGIC):
+            logger.error(f"Ignoring snapshot {path}: unknown format or version.")
+            return []
+        quiz_table, tournament_table, records = _BasicTypesUnpickler(io.BytesIO(data[len(SNAPSHOT_MAGIC):])).load()
+        quizzes = [QuizData.model_validate_json(quiz_json) for quiz_json in quiz_table]
+        tournaments = {state[0]: Tournament.from_state(state) for state in tournament_table}
+        games = [restore_game(record, quizzes, tournaments) for record in records]
+    except Exception as e:
+        logger.exception(f"Failed to restore snapshot {path}: {e}")
+        return []
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    logger.info("Restored %d games from snapshot %s (%.1f ms).", len(games), path, (time.perf_counter() - started) * 1000.0)
+    return games
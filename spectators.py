@@ -0,0 +1,132 @@
+# spectators.py
+"""
+Modo espectador para grandes audiencias (`/ws/{game_code}/watch`).
+
+Los espectadores no son jugadores: no aparecen en `game.players`, ni en los
+marcadores, ni en `get_real_player_count`, y no tienen más estado que su
+socket. Solo reciben fotogramas compartidos (pregunta, top-K del marcador y
+podio) que se serializan UNA vez por partida y etapa.
+
+El envío lo hace una tarea propia de cada partida (`SpectatorChannel`), por
+lotes y con un tiempo máximo por socket. Los manejadores del juego solo
+encolan el fotograma ya serializado, así que miles de espectadores no
+retrasan los mensajes de los jugadores. Los espectadores lentos o caídos se
+descartan sin reintentos.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Iterable, Optional
+
+from fastapi import WebSocket
+from pydantic import BaseModel
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+SPECTATOR_BATCH_SIZE = 500        # Sockets por lote de envío (se cede el bucle entre lotes)
+SPECTATOR_SEND_TIMEOUT = 5.0      # Segundos máximos por envío antes de descartar al espectador
+SPECTATOR_LEADERBOARD_TOP_K = 10  # Entradas del marcador que se envían a los espectadores
+
+
+class SpectatorChannel:
+    """Espectadores de una partida y su cola de fotogramas compartidos."""
+
+    def __init__(self):
+        # dict como conjunto ordenado: sin estado por espectador más allá del socket
+        self._sockets: Dict[WebSocket, None] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # Últimos fotogramas por tipo, para quien se conecta a mitad de partida
+        self._latest: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._sockets)
+
+    async def add(self, websocket: WebSocket):
+        """Registra un espectador y le envía el estado actual (última pregunta/marcador)."""
+        self._sockets[websocket] = None
+        spectators_connected.inc()
+        for frame in list(self._latest.values()):
+            try:
+                await asyncio.wait_for(websocket.send_text(frame), SPECTATOR_SEND_TIMEOUT)
+            except Exception:
+                self.remove(websocket)
+                return
+
+    def remove(self, websocket: WebSocket):
+        if websocket in self._sockets:
+            del self._sockets[websocket]
+            spectators_connected.dec()
+
+    def publish(self, message_type: str, payload: BaseModel, replaces: tuple = ()):
+        """
+        Serializa un fotograma una sola vez y lo encola para todos los espectadores.
+
+        Args:
+            message_type: Tipo del mensaje WebSocket.
+            payload: Payload del mensaje.
+            replaces: Tipos cuyo último fotograma deja de ser relevante para
+                quien se conecte después (ej: la pregunta al mostrar el marcador).
+        """
+        # Mismo formato que WebSocketMessage.model_dump_json(), sin pasar por el modelo envolvente
+        frame = '{"type":%s,"payload":%s}' % (json.dumps(message_type), payload.model_dump_json())
+        for stale in replaces:
+            self._latest.pop(stale, None)
+        self._latest[message_type] = frame
+        if not self._sockets:
+            return # Nadie mirando: solo se guarda para futuros espectadores
+        frames_published.inc()
+        self._queue.put_nowait(frame)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, code: int = 1000):
+        """Cierra todas las conexiones de espectadores (la partida se eliminó o el servidor se reinicia)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        sockets = list(self._sockets)
+        for websocket in sockets:
+            self.remove(websocket)
+        self._latest.clear()
+        await _close_all(sockets, code)
+
+    # --- Internos ---
+
+    async def _run(self):
+        while not self._queue.empty():
+            frame = self._queue.get_nowait()
+            await self._fan_out(frame)
+
+    async def _fan_out(self, frame: str):
+        sockets = list(self._sockets)
+        for start in range(0, len(sockets), SPECTATOR_BATCH_SIZE):
+            batch = sockets[start:start + SPECTATOR_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(asyncio.wait_for(ws.send_text(frame), SPECTATOR_SEND_TIMEOUT) for ws in batch),
+                return_exceptions=True
+            )
+            failed = [ws for ws, result in zip(batch, results) if isinstance(result, BaseException)]
+            for websocket in failed:
+                self.remove(websocket)
+            if failed:
+                spectators_dropped.inc(amount=len(failed))
+                asyncio.create_task(_close_all(failed))
+            await asyncio.sleep(0) # Ceder el bucle entre lotes
+
+
+async def _close_all(sockets: Iterable[WebSocket], code: int = 1000):
+    """Cierra conexiones de espectadores ignorando errores (pueden estar ya muertas)."""
+    await asyncio.gather(
+        *(asyncio.wait_for(ws.close(code=code), SPECTATOR_SEND_TIMEOUT) for ws in sockets),
+        return_exceptions=True
+    )
+
+
+# --- Métricas ---
+spectators_connected = Gauge("quiz_spectators_connected", "Espectadores conectados en todas las partidas")
+frames_published = Counter("quiz_spectator_frames_total", "Fotogramas compartidos enviados a los espectadores de una partida")
+spectators_dropped = Counter("quiz_spectators_dropped_total", "Espectadores descartados por envíos fallidos o lentos")
@@ -0,0 +1,133 @@
+# teams.py
+"""
+Modo por equipos: los jugadores pueden unirse a una partida con un nombre de
+equipo (opcional en 'join_game') y el marcador muestra, junto al individual,
+la clasificación de equipos.
+
+Cada partida tiene un `TeamStandings`. El equipo de cada jugador se guarda
+en el propio jugador (`Player.team_id`, `DetachedPlayer.team_id`) como un
+ID entero pequeño; los agregados de cada equipo viven en columnas indexadas
+por ese ID y se actualizan de forma incremental:
+
+- `scores`: suma de las puntuaciones de sus miembros. Cada respuesta
+  correcta suma sus puntos al equipo en O(1) (más mover su clave en el
+  índice de puestos).
+- `members`: miembros actuales. Los desconectados en periodo de gracia
+  siguen contando (como en el marcador individual); quien abandona la
+  partida de verdad resta su puntuación y deja de contar.
+
+La media es `scores / members`, así que nunca hace falta recorrer los
+jugadores para construir la clasificación de equipos. El puesto de cada
+equipo es la posición de su clave en un array ordenado de claves enteras
+(puntuación y ID en un solo entero, como el marcador de las tareas en
+homework.py); un equipo sin miembros sale del índice.
+"""
+import bisect
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# --- Constantes de Configuración ---
+TEAM_MAX_PER_GAME = 100     # Equipos distintos como máximo por partida
+TEAM_NAME_MAX_LENGTH = 24   # Longitud máxima del nombre de un equipo
+
+_TEAM_ID_SPAN = 1 << 16 # Las claves del índice son -puntuación * _TEAM_ID_SPAN + ID (ID < 2^16)
+
+
+class TeamError(Exception):
+    """Nombre de equipo no válido o demasiados equipos (el mensaje es para el jugador)."""
+
+
+class TeamStandings:
+    """Equipos de una partida con sus agregados y su índice de puestos."""
+
+    def __init__(self):
+        self._names: List[str] = []           # ID de equipo -> nombre (con la grafía del primero que lo usó)
+        self._ids: Dict[str, int] = {}        # nombre en minúsculas -> ID
+        # Columnas por equipo, indexadas por ID
+        self.scores = array("q")              # Suma de las puntuaciones de sus miembros
+        self.members = array("l")             # Miembros actuales (incluidos los desconectados en periodo de gracia)
+        self._ranking = array("q")            # Claves de los equipos con miembros, ordenadas (ver _rank_key)
+
+    def __len__(self) -> int:
+        """Número de equipos con al menos un miembro."""
+        return len(self._ranking)
+
+    def name(self, team_id: int) -> str:
+        return self._names[team_id]
+
+    def resolve(self, team_name: str) -> int:
+        """
+        ID del equipo con ese nombre (sin distinguir mayúsculas), creándolo si no existe.
+
+        Raises:
+            TeamError: Si el nombre es demasiado largo o la partida ya tiene TEAM_MAX_PER_GAME equipos.
+        """
+        team_name = team_name.strip()
+        if len(team_name) > TEAM_NAME_MAX_LENGTH:
+            raise TeamError(f"El nombre del equipo no puede tener más de {TEAM_NAME_MAX_LENGTH} caracteres.")
+        key = team_name.lower()
+        team_id = self._ids.get(key)
+        if team_id is None:
+            if len(self._names) >= TEAM_MAX_PER_GAME:
+                raise TeamError("La partida ya tiene el máximo de equipos.")
+            team_id = len(self._names)
+            self._names.append(team_name)
+            self._ids[key] = team_id
+            self.scores.append(0)
+            self.members.append(0)
+        return team_id
+
+    def add_member(self, team_id: int, score: int = 0):
+        """Suma un miembro (con su puntuación, si ya tenía: partidas restauradas)."""
+        if self.members[team_id] == 0:
+            self.scores[team_id] = score
+            bisect.insort(self._ranking, _rank_key(score, team_id))
+        else:
+            self._move(team_id, self.scores[team_id] + score)
+        self.members[team_id] += 1
+
+    def remove_member(self, team_id: int, score: int):
+        """Quita a un miembro que abandona la partida, junto con su puntuación."""
+        if self.members[team_id] <= 0:
+            return
+        self.members[team_id] -= 1
+        if self.members[team_id] == 0:
+            del self._ranking[self._position(team_id)]
+            self.scores[team_id] = 0
+        else:
+            self._move(team_id, self.scores[team_id] - score)
+
+    def add_points(self, team_id: int, points: int):
+        """Suma los puntos de una respuesta al equipo del jugador."""
+        if points and self.members[team_id] > 0:
+            self._move(team_id, self.scores[team_id] + points)
+
+    def _position(self, team_id: int) -> int:
+        return bisect.bisect_left(self._ranking, _rank_key(self.scores[team_id], team_id))
+
+    def _move(self, team_id: int, new_score: int):
+        """Cambia la puntuación de un equipo moviendo su clave en el índice ordenado."""
+        del self._ranking[self._position(team_id)]
+        self.scores[team_id] = new_score
+        bisect.insort(self._ranking, _rank_key(new_score, team_id))
+
+    def rank_of(self, team_id: Optional[int]) -> Optional[int]:
+        """Puesto del equipo (1 es el primero; los empates, por orden de creación), o None."""
+        if team_id is None or self.members[team_id] == 0:
+            return None
+        return self._position(team_id) + 1
+
+    def standings(self) -> List[Tuple[int, str, int, int, float]]:
+        """Clasificación de equipos: (puesto, nombre, puntuación, miembros, media por miembro)."""
+        standings = []
+        for rank, key in enumerate(self._ranking, start=1):
+            team_id = key % _TEAM_ID_SPAN
+            score = -(key // _TEAM_ID_SPAN)
+            members = self.members[team_id]
+            standings.append((rank, self._names[team_id], score, members, round(score / members, 1)))
+        return standings
+
+
+def _rank_key(score: int, team_id: int) -> int:
+    """Clave entera del índice: ordena por puntuación descendente y, a igualdad, por ID."""
+    return -score * _TEAM_ID_SPAN + team_id
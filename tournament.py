@@ -0,0 +1,128 @@
+# tournament.py
+"""
+Torneos: varias salas (partidas) con el mismo cuestionario y una
+clasificación global común.
+
+Un evento grande reparte a sus jugadores entre muchas salas. Cada sala
+sigue siendo una partida normal con su propio actor y su propio marcador;
+el torneo solo añade:
+
+- Arranque y cierre de preguntas a la vez en todas las salas (lo dirige
+  `game_logic.run_tournament`; las salas de un torneo no tienen host).
+- La clasificación global. Al cerrar cada pregunta, cada sala entrega su
+  marcador, que ya viene ordenado (`get_player_only_scoreboard`). La
+  clasificación global es la mezcla de esas listas ordenadas (k-way merge,
+  O(N log R) para N jugadores y R salas) en lugar de reordenar a todos, y se
+  calcula una sola vez por pregunta. A partir de ella, cada sala recibe el
+  mismo top-K y cada jugador su puesto global con una consulta O(1).
+"""
+import heapq
+import itertools
+import operator
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# --- Constantes de Configuración ---
+TOURNAMENT_TOP_K = 10 # Entradas de la clasificación global que recibe cada sala
+TOURNAMENT_MAX_ROOMS = 200 # Salas como máximo por torneo
+TOURNAMENT_CLOSE_GRACE = 1.0 # Segundos extra tras el tiempo límite antes de cerrar la pregunta en todas las salas
+
+
+class Tournament:
+    """Salas de un torneo y su clasificación global."""
+
+    def __init__(self, tournament_id: str, game_codes: Sequence[str]):
+        self.tournament_id = tournament_id
+        self.game_codes: List[str] = list(game_codes)
+        self.started = False
+        self.finished = False
+        self.question_index = -1 # Última pregunta cuya clasificación global está calculada
+        # game_code -> marcador de la sala [(puntuación, nickname)], de mayor a menor
+        self._room_runs: Dict[str, List[Tuple[int, str]]] = {}
+        # game_code -> nickname -> puesto global
+        self._ranks: Dict[str, Dict[str, int]] = {}
+        self._top: List[Tuple[int, str, int, str]] = [] # (puesto, nickname, puntuación, game_code)
+        self.player_count = 0
+        self.top_message = None # Mensaje 'global_leaderboard' de la última mezcla (lo construye game_logic una vez)
+        self.task = None # Tarea de fondo que dirige las salas (game_logic.run_tournament)
+
+    def update_room(self, game_code: str, room_run: List[Tuple[int, str]]):
+        """
+        Guarda el marcador de una sala tras cerrar una pregunta.
+
+        Args:
+            game_code: Sala.
+            room_run: (puntuación, nickname) de sus jugadores, ya ordenado de
+                mayor a menor puntuación.
+        """
+        self._room_runs[game_code] = room_run
+
+    def remove_room(self, game_code: str):
+        """Saca del torneo una sala que se quedó vacía y se eliminó."""
+        self._room_runs.pop(game_code, None)
+
+    def merge(self, question_index: int, top_k: int = TOURNAMENT_TOP_K):
+        """
+        Recalcula la clasificación global mezclando los marcadores de las salas.
+
+        Los empates se resuelven por el orden de las salas en el torneo y,
+        dentro de cada sala, por su propio marcador.
+        """
+        runs = [_tagged(self._room_runs[code], code) for code in self.game_codes if code in self._room_runs]
+        ranks: Dict[str, Dict[str, int]] = {code: {} for code in self._room_runs}
+        top: List[Tuple[int, str, int, str]] = []
+        rank = 0
+        for rank, (negative_score, nickname, game_code) in enumerate(heapq.merge(*runs, key=operator.itemgetter(0)), start=1):
+            ranks[game_code][nickname] = rank
+            if rank <= top_k:
+                top.append((rank, nickname, -negative_score, game_code))
+        self._ranks = ranks
+        self._top = top
+        self.player_count = rank
+        self.question_index = question_index
+        self.top_message = None
+
+    def top(self) -> List[Tuple[int, str, int, str]]:
+        """Top-K global de la última mezcla: (puesto, nickname, puntuación, game_code)."""
+        return self._top
+
+    def rank_of(self, game_code: str, nickname: str) -> Optional[int]:
+        """Puesto global de un jugador en la última mezcla (None si no figuraba)."""
+        room_ranks = self._ranks.get(game_code)
+        return room_ranks.get(nickname) if room_ranks is not None else None
+
+    def snapshot(self) -> dict:
+        """Estado del torneo para el endpoint de administración."""
+        return {
+            "tournament_id": self.tournament_id,
+            "game_codes": self.game_codes,
+            "started": self.started,
+            "finished": self.finished,
+            "question_number": self.question_index + 1,
+            "player_count": self.player_count,
+            "top": [{"rank": rank, "nickname": nickname, "score": score, "game_code": code}
+                    for rank, nickname, score, code in self._top],
+        }
+
+    def to_state(self) -> tuple:
+        """Estado del torneo como tipos básicos (para snapshots de partidas)."""
+        return (
+            self.tournament_id, list(self.game_codes), self.started, self.finished, self.question_index,
+            {code: list(room_run) for code, room_run in self._room_runs.items()},
+        )
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "Tournament":
+        """Reconstruye un torneo a partir de `to_state()`, con su última clasificación global."""
+        tournament_id, game_codes, started, finished, question_index, room_runs = state
+        tournament = cls(tournament_id, game_codes)
+        tournament.started = started
+        tournament.finished = finished
+        tournament._room_runs = {code: [tuple(entry) for entry in room_run] for code, room_run in room_runs.items()}
+        if question_index >= 0:
+            tournament.merge(question_index)
+        return tournament
+
+
+def _tagged(room_run: List[Tuple[int, str]], game_code: str) -> Iterator[Tuple[int, str, str]]:
+    """Claves de mezcla de una sala: (-puntuación, nickname, sala), en el orden de su marcador."""
+    return zip((-score for score, _ in room_run), (nickname for _, nickname in room_run), itertools.repeat(game_code))
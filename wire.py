@@ -0,0 +1,410 @@
+# wire.py
+"""
+Codificación de los mensajes WebSocket en el cable.
+
+El cliente elige la codificación al conectarse con un subprotocolo
+WebSocket (cabecera `Sec-WebSocket-Protocol`):
+
+- `quiz.json` (o ningún subprotocolo): JSON en fotogramas de texto, con los
+  nombres de campo completos de models.py. Es la codificación por defecto y
+  la que usan las páginas del propio servidor.
+- `quiz.msgpack.v1`: MessagePack en fotogramas binarios, con los nombres de
+  campo sustituidos por los códigos cortos de `WIRE_KEYS` (`question_number`
+  viaja como `qn`). Solo se ofrece si el paquete opcional `msgpack` está
+  instalado. El primer byte de cada fotograma binario indica si el resto va
+  comprimido con zlib (`FRAME_DEFLATE`): solo se comprimen los mayores de
+  WIRE_COMPRESS_MIN_BYTES, así las respuestas y 'reveal' (unas decenas de
+  bytes) no pagan CPU de compresión.
+
+Regla para los clientes binarios: los fotogramas de texto son siempre JSON
+(el `ping` del heartbeat y los errores anteriores a la negociación).
+
+Los clientes JSON pueden además negociar `permessage-deflate` en el propio
+transporte (lo hacen los navegadores); se activa o desactiva para todo el
+servidor con QUIZ_WS_DEFLATE.
+
+Agrupación de salida (capacidad `batch`): un cliente que conecta con
+`?caps=batch` recibe los mensajes que se le envían casi a la vez (un
+'answer_result' seguido de 'update_scoreboard', ráfagas de 'player_joined')
+en un solo fotograma, tras esperar como mucho COALESCE_WINDOW_MS:
+
+- JSON: `{"type": "batch", "payload": [mensaje, mensaje, ...]}`, en orden.
+- 'quiz.msgpack.v1': primer byte `FRAME_BATCH` seguido de los fotogramas
+  binarios completos, cada uno precedido de su longitud (4 bytes, big-endian).
+
+Si solo hay un mensaje pendiente se envía tal cual. Los clientes que no
+anuncian la capacidad siguen recibiendo un fotograma por mensaje.
+
+Un broadcast se serializa como mucho una vez por codificación
+(`EncodedMessage`), no una vez por jugador. Los mensajes personalizados
+('game_over', 'answer_result', el marcador de cada jugador) usan
+`PersonalizedMessage`: la parte común se serializa una vez y los pocos
+campos de cada jugador se empalman con ella a nivel de bytes.
+"""
+import asyncio
+import json
+import logging
+import os
+import weakref
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from metrics import Counter
+from models import WebSocketMessage
+
+try:
+    import msgpack
+except ImportError: # Dependencia opcional: sin ella solo se ofrece JSON
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes de Configuración ---
+SUBPROTOCOL_JSON = "quiz.json"
+SUBPROTOCOL_MSGPACK = "quiz.msgpack.v1" # La versión fija la tabla WIRE_KEYS
+WIRE_COMPRESS_MIN_BYTES = int(os.environ.get("QUIZ_WIRE_COMPRESS_MIN_BYTES", "512")) # Fotogramas binarios más pequeños no se comprimen (0 = nunca)
+WIRE_COMPRESS_LEVEL = 6 # Nivel de zlib (equilibrio CPU/tamaño)
+WS_PER_MESSAGE_DEFLATE = os.environ.get("QUIZ_WS_DEFLATE", "1") != "0" # permessage-deflate del transporte (uvicorn)
+COALESCE_WINDOW_MS = float(os.environ.get("QUIZ_COALESCE_MS", "2")) # Espera máxima para agrupar mensajes de salida (0 = los del mismo ciclo del bucle)
+CAPABILITY_BATCH = "batch" # Capacidad del cliente (`?caps=batch`): acepta mensajes agrupados
+
+ENCODING_JSON = 0
+ENCODING_MSGPACK = 1
+ENCODING_NAMES = ("json", "msgpack")
+
+FRAME_PLAIN = 0   # Primer byte de un fotograma binario: MessagePack tal cual
+FRAME_DEFLATE = 1 # Primer byte de un fotograma binario: MessagePack comprimido con zlib
+FRAME_BATCH = 2   # Primer byte de un fotograma binario: varios fotogramas con su longitud delante
+
+# Códigos cortos de los nombres de campo en 'quiz.msgpack.v1' (en ambos sentidos).
+# Los campos que no están en la tabla viajan con su nombre completo.
+WIRE_KEYS: Dict[str, str] = {
+    # Sobre del mensaje
+    "type": "t", "payload": "p",
+    # Preguntas
+    "question_id": "qi", "question_text": "qt", "question_number": "qn", "total_questions": "tq",
+    "options": "o", "id": "i", "text": "x", "time_limit": "tl", "media_url": "mu", "urls": "u",
+    "question": "q", "time_remaining": "tr", "starts_at": "sa", "delay_ms": "dm",
+    # Respuestas y puntuaciones
+    "answer_id": "a", "is_correct": "ic", "correct_answer_id": "ca", "points_awarded": "pa",
+    "current_score": "cs", "current_rank": "cr", "has_answered": "ha", "answered_count": "ac", "counts": "c",
+    "scoreboard": "sb", "podium": "pd", "rank": "r", "score": "s",
+    "my_final_rank": "fr", "my_final_score": "fs", "my_global_rank": "gr",
+    # Jugadores, sesión y partida
+    "nickname": "n", "player_count": "pc", "spectator_count": "sc", "reconnect_token": "rt",
+    "message": "m", "code": "e", "state": "st", "game_code": "g",
+    # Torneos
+    "tournament_id": "ti", "room_count": "rc", "top": "tp",
+    # Cuestionario ('load_quiz_data')
+    "title": "tt", "questions": "qs", "media_id": "mi", "shuffle_options": "so",
+}
+_LONG_KEYS = {short: long for long, short in WIRE_KEYS.items()}
+# Campos cuyo valor es un diccionario de datos (sus claves no son nombres de campo)
+_DATA_FIELDS = frozenset({"counts"})
+
+assert len(_LONG_KEYS) == len(WIRE_KEYS) and not set(_LONG_KEYS) & set(WIRE_KEYS), "WIRE_KEYS must be a bijection"
+
+# --- Métricas ---
+connections_by_encoding_total = Counter("quiz_ws_connections_by_encoding_total", "Conexiones WebSocket aceptadas por codificación negociada", ("encoding",))
+coalesced_messages_total = Counter("quiz_ws_coalesced_messages_total", "Mensajes enviados dentro de un fotograma agrupado ('batch')")
+batch_frames_total = Counter("quiz_ws_batch_frames_total", "Fotogramas agrupados ('batch') enviados")
+
+# Codificación de las conexiones no JSON (las que no están aquí usan JSON)
+_encodings: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+# Fotogramas pendientes de las conexiones con la capacidad `batch`
+_outboxes: "weakref.WeakKeyDictionary[Any, _Outbox]" = weakref.WeakKeyDictionary()
+
+
+class FrameDecodeError(ValueError):
+    """Fotograma recibido que no se puede decodificar con la codificación de la conexión."""
+
+
+def available_subprotocols() -> Tuple[str, ...]:
+    """Subprotocolos que acepta este servidor, por orden de preferencia."""
+    return (SUBPROTOCOL_MSGPACK, SUBPROTOCOL_JSON) if msgpack is not None else (SUBPROTOCOL_JSON,)
+
+
+def negotiate(requested: Sequence[str]) -> Tuple[Optional[str], int]:
+    """
+    Elige el subprotocolo entre los que ofrece el cliente.
+
+    Returns:
+        (subprotocolo para `websocket.accept`, o None si el cliente no pidió
+        ninguno que conozcamos; codificación).
+    """
+    for subprotocol in available_subprotocols():
+        if subprotocol in requested:
+            return subprotocol, ENCODING_MSGPACK if subprotocol == SUBPROTOCOL_MSGPACK else ENCODING_JSON
+    return None, ENCODING_JSON
+
+
+def set_encoding(websocket: Any, encoding: int):
+    """Asocia una codificación a una conexión recién aceptada."""
+    if encoding != ENCODING_JSON:
+        _encodings[websocket] = encoding
+    connections_by_encoding_total.inc(ENCODING_NAMES[encoding])
+
+
+def encoding_of(websocket: Any) -> int:
+    return _encodings.get(websocket, ENCODING_JSON)
+
+
+def set_capabilities(websocket: Any, capabilities: str, stats: Any = None):
+    """
+    Activa las capacidades que anuncia el cliente (`?caps=`, separadas por comas) en una conexión recién aceptada.
+
+    Args:
+        stats: Objeto con un contador entero `outbound_pending` (el
+            `ConnectionRegistry` de la partida) donde se suman los mensajes
+            pendientes de agrupar de esta conexión, o None.
+    """
+    if CAPABILITY_BATCH in (capability.strip() for capability in capabilities.split(",")):
+        _outboxes[websocket] = _Outbox(stats)
+
+
+def _shorten(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {WIRE_KEYS.get(key, key): (item if key in _DATA_FIELDS else _shorten(item)) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_shorten(item) for item in value]
+    return value
+
+
+def _expand(value: Any) -> Any:
+    if isinstance(value, dict):
+        expanded = {}
+        for key, item in value.items():
+            key = _LONG_KEYS.get(key, key)
+            expanded[key] = item if key in _DATA_FIELDS else _expand(item)
+        return expanded
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+def encode(message: WebSocketMessage, encoding: int) -> Union[str, bytes]:
+    """Serializa un mensaje: texto JSON o fotograma binario de 'quiz.msgpack.v1'."""
+    if encoding == ENCODING_JSON:
+        return message.model_dump_json()
+    return _binary_frame(msgpack.packb(_shorten(message.model_dump(mode="json"))))
+
+
+def _binary_frame(packed: bytes) -> bytes:
+    """Antepone el byte de formato a un mensaje MessagePack, comprimiéndolo si compensa."""
+    if WIRE_COMPRESS_MIN_BYTES and len(packed) >= WIRE_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(packed, WIRE_COMPRESS_LEVEL)
+        if len(compressed) < len(packed):
+            return bytes((FRAME_DEFLATE,)) + compressed
+    return bytes((FRAME_PLAIN,)) + packed
+
+
+class EncodedMessage:
+    """Un mensaje que se serializa como mucho una vez por codificación, al primer envío que la necesita."""
+
+    __slots__ = ("message", "_frames")
+
+    def __init__(self, message: WebSocketMessage):
+        self.message = message
+        self._frames: list = [None] * len(ENCODING_NAMES)
+
+    def frame(self, encoding: int) -> Union[str, bytes]:
+        frame = self._frames[encoding]
+        if frame is None:
+            frame = self._frames[encoding] = encode(self.message, encoding)
+        return frame
+
+
+def _msgpack_map_header(size: int) -> bytes:
+    """Cabecera MessagePack de un mapa de `size` pares (el contenido se añade a continuación)."""
+    if size < 16:
+        return bytes((0x80 | size,))
+    if size < 1 << 16:
+        return b"\xde" + size.to_bytes(2, "big")
+    return b"\xdf" + size.to_bytes(4, "big")
+
+
+class PersonalizedMessage:
+    """
+    Un mensaje con una parte común y unos pocos campos propios de cada destinatario.
+
+    La parte común (`shared`, ya en modo JSON: el podio, el marcador) se
+    serializa como mucho una vez por codificación; en cada envío solo se
+    serializan los valores de `personal_fields` (escalares) y se empalman
+    tras ella. El resultado es el mismo mensaje que daría `encode` con el
+    payload completo, con los campos personales al final.
+    """
+
+    __slots__ = ("message_type", "personal_fields", "_shared", "_templates")
+
+    def __init__(self, message_type: str, shared: Dict[str, Any], personal_fields: Sequence[str]):
+        self.message_type = message_type
+        self.personal_fields = tuple(personal_fields)
+        self._shared = shared
+        self._templates: list = [None] * len(ENCODING_NAMES) # (prefijo, claves de los campos personales)
+
+    def _template(self, encoding: int) -> tuple:
+        template = self._templates[encoding]
+        if template is None:
+            if encoding == ENCODING_JSON:
+                body = json.dumps(self._shared, ensure_ascii=False, separators=(",", ":"))
+                prefix = '{"type":' + json.dumps(self.message_type, ensure_ascii=False) + ',"payload":' + body[:-1]
+                separator = "," if self._shared else ""
+                keys = tuple((separator if i == 0 else ",") + json.dumps(field) + ":"
+                             for i, field in enumerate(self.personal_fields))
+            else:
+                shared = _shorten(self._shared)
+                prefix = (_msgpack_map_header(2) + msgpack.packb("t") + msgpack.packb(self.message_type) + msgpack.packb("p")
+                          + _msgpack_map_header(len(shared) + len(self.personal_fields))
+                          + b"".join(msgpack.packb(key) + msgpack.packb(value) for key, value in shared.items()))
+                keys = tuple(msgpack.packb(WIRE_KEYS.get(field, field)) for field in self.personal_fields)
+            template = self._templates[encoding] = (prefix, keys)
+        return template
+
+    def frame(self, encoding: int, values: Sequence[Any]) -> Union[str, bytes]:
+        """Fotograma para un destinatario; `values` va en el orden de `personal_fields`."""
+        prefix, keys = self._template(encoding)
+        if encoding == ENCODING_JSON:
+            return prefix + "".join(key + json.dumps(value, ensure_ascii=False) for key, value in zip(keys, values)) + "}}"
+        return _binary_frame(prefix + b"".join(key + msgpack.packb(value) for key, value in zip(keys, values)))
+
+
+async def send_frame(websocket: WebSocket, frame: Union[str, bytes]):
+    """
+    Envía un fotograma ya serializado (texto o binario según su tipo).
+
+    En las conexiones con la capacidad `batch` solo lo deja pendiente: sale
+    agrupado con los demás en la siguiente ventana (ver `_Outbox`).
+    """
+    outbox = _outboxes.get(websocket)
+    if outbox is not None:
+        outbox.put(websocket, frame)
+    elif isinstance(frame, str):
+        await websocket.send_text(frame)
+    else:
+        await websocket.send_bytes(frame)
+
+
+class _Outbox:
+    """Fotogramas pendientes de una conexión con la capacidad `batch` y la tarea que los envía."""
+
+    __slots__ = ("frames", "task", "stats")
+
+    def __init__(self, stats: Any = None):
+        self.frames: List[Union[str, bytes]] = []
+        self.task: Optional[asyncio.Task] = None
+        self.stats = stats
+
+    def put(self, websocket: WebSocket, frame: Union[str, bytes]):
+        self.frames.append(frame)
+        if self.stats is not None:
+            self.stats.outbound_pending += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self._drain(websocket))
+
+    async def _drain(self, websocket: WebSocket):
+        """Espera la ventana y envía lo pendiente; lo que llega mientras se envía sale en el siguiente fotograma."""
+        try:
+            await asyncio.sleep(COALESCE_WINDOW_MS / 1000)
+            while self.frames:
+                frames, self.frames = self.frames, []
+                if self.stats is not None:
+                    self.stats.outbound_pending -= len(frames)
+                for frame in _batch_frames(frames):
+                    if isinstance(frame, str):
+                        await websocket.send_text(frame)
+                    else:
+                        await websocket.send_bytes(frame)
+        except Exception as e:
+            # Conexión caída: su limpieza ocurre en el bucle de recepción (main.py)
+            logger.debug("Dropping %d coalesced frame(s) for a closed connection: %s", len(self.frames), e)
+            if self.stats is not None:
+                self.stats.outbound_pending -= len(self.frames)
+            self.frames = []
+        finally:
+            self.task = None
+
+
+def _batch_frames(frames: List[Union[str, bytes]]) -> List[Union[str, bytes]]:
+    """Agrupa fotogramas pendientes en el menor número de fotogramas (los de texto y los binarios por separado, en orden)."""
+    if len(frames) == 1:
+        return frames
+    batched = []
+    start = 0
+    for end in range(1, len(frames) + 1):
+        if end < len(frames) and isinstance(frames[end], str) == isinstance(frames[start], str):
+            continue
+        run = frames[start:end]
+        if len(run) == 1:
+            batched.append(run[0])
+        else:
+            if isinstance(run[0], str):
+                batched.append('{"type":"batch","payload":[' + ",".join(run) + "]}")
+            else:
+                batched.append(bytes((FRAME_BATCH,)) + b"".join(len(frame).to_bytes(4, "big") + frame for frame in run))
+            coalesced_messages_total.inc(amount=len(run))
+            batch_frames_total.inc()
+        start = end
+    return batched
+
+
+async def flush(websocket: WebSocket):
+    """Espera a que salgan los fotogramas pendientes de agrupar de una conexión (si los hay)."""
+    outbox = _outboxes.get(websocket)
+    if outbox is not None and outbox.task is not None:
+        await asyncio.shield(outbox.task)
+
+
+async def close_connection(websocket: WebSocket, code: int):
+    """Cierra una conexión después de enviar lo que tuviera pendiente de agrupar."""
+    await flush(websocket)
+    await websocket.close(code=code)
+
+
+async def receive_frame(websocket: WebSocket) -> Union[str, bytes]:
+    """
+    Espera el siguiente fotograma de la conexión (texto o binario).
+
+    Raises:
+        WebSocketDisconnect: Si el cliente cerró la conexión.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    text = message.get("text")
+    return text if text is not None else message.get("bytes") or b""
+
+
+def decode_frame(raw_data: Union[str, bytes], encoding: int, max_bytes: int) -> Any:
+    """
+    Decodifica un fotograma recibido (ya pasado por el control de admisión).
+
+    Args:
+        raw_data: Fotograma tal como llegó.
+        encoding: Codificación negociada por la conexión.
+        max_bytes: Tamaño máximo una vez descomprimido.
+
+    Raises:
+        json.JSONDecodeError: Si un fotograma de texto no es JSON válido.
+        FrameDecodeError: Si un fotograma binario no es válido o la conexión no negoció 'quiz.msgpack.v1'.
+    """
+    if isinstance(raw_data, str):
+        return json.loads(raw_data)
+    if encoding != ENCODING_MSGPACK or not raw_data:
+        raise FrameDecodeError("binary frame on a connection without a binary subprotocol")
+    flag, body = raw_data[0], raw_data[1:]
+    if flag == FRAME_DEFLATE:
+        decompressor = zlib.decompressobj()
+        try:
+            body = decompressor.decompress(body, max_bytes)
+        except zlib.error as e:
+            raise FrameDecodeError(f"invalid compressed frame: {e}")
+        if decompressor.unconsumed_tail:
+            raise FrameDecodeError("decompressed frame too large")
+    elif flag != FRAME_PLAIN:
+        raise FrameDecodeError(f"unknown frame flag {flag}")
+    try:
+        return _expand(msgpack.unpackb(body))
+    except (ValueError, TypeError) as e: # Incluye ExtraData, FormatError y StackError de msgpack
+        raise FrameDecodeError(f"invalid MessagePack frame: {e}")